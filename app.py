@@ -1,18 +1,89 @@
 import streamlit as st
 import pandas as pd
 import os
+import tempfile
+import uuid
+from functools import partial
 import google.generativeai as genai
-import numpy as np
-import io
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import RerunException, StopException
+from engine import outofcore
+from engine.excel import sheet_columns
+from engine.dtypes import conversion_failures, detect_datetime_format, infer_column, inferred_astype_ops
+from engine.export import EXPORT_FORMATS, spool_path
+from engine.expressions import ExpressionError, compile_expression
+from engine.frames import column_dtype, column_range, column_sample, distinct_count, export_data, is_out_of_core, numeric_columns, preview, sample_values, unique_values
+from engine.checkpoints import SessionCheckpoints
+from engine.diagnostics import MetricsLog, RerunTrace, SamplingProfiler, column_memory
+from engine.batch import parse_questions, read_questions_file, report_json, report_markdown, run_batch
+from engine.llm import FakeBackend, GeminiBackend, ModelClient, RateLimiter, ResponseCache, response_key
+from engine.indexes import ColumnIndexes
+from engine.ingest import MemoryBudgetExceeded
+from engine.pipeline import load_table, profile_table
+from engine.profile import columns_with_missing, file_fingerprint
+from engine.prompt import build_context
+from engine.plan import PlanExecutionError, describe_op, dumps as dump_plan, execute as execute_plan, loads as load_plan
+from engine.snapshots import SnapshotHistory, enable_copy_on_write
+from engine.stats import ColumnStatsStore
+from engine.store import DatasetStore
 
 # Load environment variables from .env file if it exists
 load_dotenv()
 
+# Snapshots share unchanged column buffers, which relies on copy-on-write
+enable_copy_on_write()
+
 # Configuration
 CONFIG = {
     'PREVIEW_ROWS': 5,
     'ALLOWED_EXTENSIONS': ['.csv', '.xlsx'],
+    'INGEST_CHUNK_ROWS': 250_000,
+    'INGEST_MEMORY_BUDGET_MB': 2048,
+    'CATEGORY_MAX_UNIQUE_RATIO': 0.5,
+    'MAX_UNDO_STEPS': 20,
+    'APPROX_PROFILE_MIN_ROWS': 5_000_000,
+    'CORRELATION_MATRIX_MAX_COLUMNS': 250,
+    'CORRELATION_TOP_K': 100,
+    'CORRELATION_WORKERS': int(os.getenv("CORRELATION_WORKERS", "1")),
+    'APPROX_SAMPLE_ROWS': 100_000,
+    'DATASET_MEMORY_BUDGET_MB': int(os.getenv("DATASET_MEMORY_BUDGET_MB", "4096")),
+    'DATASET_SPILL_DIR': os.getenv("DATASET_SPILL_DIR"),
+    'SESSION_IDLE_SECONDS': 15 * 60,
+    'CHECKPOINT_DIR': os.getenv("CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "data-assistant-checkpoints")),
+    'CHECKPOINT_TTL_HOURS': 7 * 24,
+    'EXCEL_SHEET_WORKERS': min(4, os.cpu_count() or 1),
+    'EXCEL_CACHE_DIR': os.getenv("EXCEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "data-assistant-excel")),
+    'EXCEL_CACHE_MAX_MB': 2048,
+    'OUT_OF_CORE_MIN_MB': 512,
+    'OUT_OF_CORE_MEMORY_LIMIT': '1GB',
+    'OUT_OF_CORE_DIR': os.getenv("OUT_OF_CORE_DIR"),
+    'EXPORT_DIR': os.getenv("EXPORT_DIR"),
+    'MODEL_NAME': "gemini-2.0-flash",
+    'MODEL_BACKEND': os.getenv("MODEL_BACKEND", "gemini"),  # "fake" runs offline without an API key
+    'MODEL_TIMEOUT_SECONDS': 60,
+    'MODEL_MAX_RETRIES': 3,
+    'MODEL_MAX_CONCURRENT_REQUESTS': 4,
+    'MODEL_QUEUE_TIMEOUT_SECONDS': 30,
+    'PROMPT_TOKEN_BUDGET': 8000,
+    'PROMPT_TOP_CORRELATIONS': 20,
+    'GENERATION_CONFIG': {
+        "temperature": 0.2,
+        "top_p": 0.85,
+        "max_output_tokens": 1024
+    },
+    'BATCH_MAX_QUESTIONS': 50,
+    'BATCH_MAX_WORKERS': 4,
+    'BATCH_REQUESTS_PER_MINUTE': 30,
+    'RESPONSE_CACHE_SIZE': 256,
+    'RESPONSE_CACHE_TTL_SECONDS': 24 * 3600,
+    'RESPONSE_CACHE_DIR': os.getenv("RESPONSE_CACHE_DIR"),
+    'DIAGNOSTICS_JSONL': os.getenv("DIAGNOSTICS_JSONL"),
+    'DIAGNOSTICS_OPENMETRICS': os.getenv("DIAGNOSTICS_OPENMETRICS"),
+    'PROFILER_INTERVAL_SECONDS': 0.005,
+    'INFER_TYPES_ON_UPLOAD': False,
+    'ONE_HOT_MAX_COLUMNS': 100,
+    'ONE_HOT_TOP_K': 20,
+    'TYPE_INFERENCE_SAMPLE_ROWS': 10_000,
     'TYPE_MAPPING': {
         'int': 'int64',
         'float': 'float64',
@@ -27,71 +98,523 @@ st.set_page_config(page_title="Data Analysis Assistant", layout="wide")
 
 # Initialize session state variables
 for key, default_value in {
-    'transformed_df': None,
-    'original_df': None,
+    'session_id': None,
     'transformation_history': [],
-    'current_file': None
+    'current_file': None,
+    'dataset_fingerprint': None,
+    'data_version': 0,
+    'profile_cache': {},
+    'snapshots': None,
+    'ingest_report': None,
+    'engine': None,
+    'excel_selection': None,
+    'loaded_selection': None,
+    'dataset_key': None,
+    'working_bytes': (None, 0),
+    'checkpoint_token': None,
+    'checkpoint_version': None,
+    'resumed': False,
+    'export_file': None,
+    'batch_results': None,
+    'profile_next_rerun': False,
+    'profiler': None,
+    'profiler_result': None,
+    'column_memory': (None, None)
 }.items():
     if key not in st.session_state:
         st.session_state[key] = default_value
+if st.session_state.session_id is None:
+    st.session_state.session_id = uuid.uuid4().hex
 
-# Utility functions for data handling
-def create_download_button(data, filename, mime_type, transformation_history=None):
-    buffer = io.BytesIO()
-    
-    if mime_type == "text/csv":
-        data.to_csv(buffer, index=False)
-    else:  # Excel
-        with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-            data.to_excel(writer, index=False, sheet_name='Data')
-            if transformation_history:
-                pd.DataFrame({"Transformation": transformation_history}).to_excel(
-                    writer, index=False, sheet_name='Transformation History'
-                )
-    
-    buffer.seek(0)
-    return st.download_button(
-        label=f"📥 Download {filename}",
-        data=buffer,
-        file_name=filename,
-        mime=mime_type
-    )
+# Time the phases of this rerun. A requested profile samples the whole rerun,
+# including reruns it triggers itself (e.g. after a transformation).
+trace = RerunTrace()
+if st.session_state.profiler is not None and st.session_state.profiler.stopped:
+    # Stopped when the last rerun ended with st.stop(); see finish_rerun
+    st.session_state.profiler_result = st.session_state.profiler
+    st.session_state.profiler = None
+if st.session_state.profile_next_rerun and st.session_state.profiler is None:
+    st.session_state.profile_next_rerun = False
+    st.session_state.profiler = SamplingProfiler(interval=CONFIG['PROFILER_INTERVAL_SECONDS']).start()
+
+# Record transformation ops on the plan. Nothing is executed here: the ops run
+# the next time the data is needed, fused with any other pending ops.
+def apply_transformation(*ops):
+    st.session_state.snapshots.commit(ops)
+
+# Execute pending ops of the current snapshot and return its data.
+# Ops that fail are dropped again and reported. The data version follows the
+# snapshot so cached profiles are rebuilt only when the data changed.
+# Out-of-core plans are compiled to SQL here and only run when data is fetched.
+# In-memory sessions report their own memory to the shared dataset store and
+# are checkpointed to disk once per data version.
+def sync_snapshot_state():
+    snapshots = st.session_state.snapshots
+    execute = outofcore.execute if st.session_state.engine == "duckdb" else execute_plan
+    while True:
+        try:
+            snapshot = snapshots.resolve(execute)
+            break
+        except PlanExecutionError as e:
+            snapshots.discard()
+            st.error(f"Unable to apply transformation: {str(e)}")
+            if e.op['op'] == 'astype':
+                st.info("Tip: Make sure the data in the column is compatible with the selected data type, "
+                        "or choose to set values that cannot be converted to missing.")
+
+    st.session_state.transformation_history = [describe_op(op) for op in snapshot.ops]
+    if st.session_state.engine == "pandas":
+        # Measured once per data version
+        if st.session_state.working_bytes[0] != snapshot.version:
+            st.session_state.working_bytes = (snapshot.version, snapshots.working_bytes())
+        get_dataset_store().touch_session(
+            st.session_state.session_id, st.session_state.dataset_key,
+            snapshots.release, st.session_state.working_bytes[1]
+        )
+        if st.session_state.checkpoint_version != snapshot.version:
+            save_checkpoint(snapshot)
+    st.session_state.data_version = snapshot.version
+    return snapshot.frame
+
+# Write the session's plan and current version to its checkpoint; the
+# dataset itself is only written the first time
+def save_checkpoint(snapshot):
+    st.session_state.checkpoint_version = snapshot.version
+    try:
+        get_checkpoints().save(
+            st.session_state.checkpoint_token,
+            st.session_state.dataset_key,
+            st.session_state.snapshots.original.frame,
+            snapshot.ops,
+            st.session_state.snapshots.steps(),
+            snapshot.frame,
+            {'file_name': st.session_state.current_file, 'ingest_report': st.session_state.ingest_report}
+        )
+    except Exception as e:
+        st.warning(f"Unable to save a checkpoint of this session: {str(e)}")
+
+# Column statistics for the current data, built in full only when the snapshot has none
+def get_column_stats(df):
+    snapshot = st.session_state.snapshots.current
+    if snapshot.stats is None or snapshot.stats.df is not df:
+        snapshot.stats = ColumnStatsStore(df, CONFIG['CORRELATION_MATRIX_MAX_COLUMNS'])
+    return snapshot.stats
+
+# Filter indexes for the current in-memory data, kept with its snapshot
+def get_column_indexes(df):
+    if is_out_of_core(df):
+        return None
+    snapshot = st.session_state.snapshots.current
+    if snapshot.indexes is None or snapshot.indexes.df is not df:
+        snapshot.indexes = ColumnIndexes(df)
+    return snapshot.indexes
+
+# Profile of the current data, computed once per (dataset fingerprint, data version).
+# Out-of-core data is profiled by the engine itself; very large in-memory data
+# gets an approximate profile from sketches and a row sample.
+def get_profile(df):
+    key = (st.session_state.dataset_fingerprint, st.session_state.data_version)
+    if key not in st.session_state.profile_cache:
+        # Tables with many numeric columns only get their strongest correlations
+        correlation = {
+            'max_pair_columns': CONFIG['CORRELATION_MATRIX_MAX_COLUMNS'],
+            'top_k': CONFIG['CORRELATION_TOP_K'],
+            'workers': CONFIG['CORRELATION_WORKERS']
+        }
+        if is_out_of_core(df):
+            profile = df.profile(CONFIG['PREVIEW_ROWS'], sample_rows=CONFIG['APPROX_SAMPLE_ROWS'], **correlation)
+        else:
+            stats = get_column_stats(df) if len(df) < CONFIG['APPROX_PROFILE_MIN_ROWS'] else None
+            profile = profile_table(df, CONFIG['PREVIEW_ROWS'], stats, CONFIG['APPROX_PROFILE_MIN_ROWS'],
+                                    CONFIG['APPROX_SAMPLE_ROWS'], **correlation)
+        st.session_state.profile_cache = {key: profile}
+    return st.session_state.profile_cache[key]
+
+# Utility functions for data handling.
+# The export is only written when the user asks for it, in chunks to a temporary
+# spool file that is kept until the data or the format changes.
+def create_download_button(data, filename, file_format, transformation_history=None):
+    key = (st.session_state.data_version, file_format)
+    export = st.session_state.export_file
+    if export is None or export[0] != key:
+        if not st.button("Prepare download"):
+            return None
+        if export is not None and os.path.exists(export[1]):
+            os.remove(export[1])
+        st.session_state.export_file = export = None
+
+        path = spool_path(EXPORT_FORMATS[file_format][0], CONFIG['EXPORT_DIR'])
+        try:
+            with st.spinner("Preparing your file..."), trace.span("export"):
+                export_data(data, path, file_format, transformation_history)
+        except Exception as e:
+            os.remove(path)
+            st.error(f"Unable to export the data: {str(e)}")
+            return None
+        st.session_state.export_file = export = (key, path)
+
+    with open(export[1], "rb") as exported:
+        return st.download_button(
+            label=f"📥 Download {filename}",
+            data=exported,
+            file_name=filename,
+            mime=EXPORT_FORMATS[file_format][1]
+        )
+
+# Use the out-of-core engine when asked to, or automatically for large CSV files
+def wants_out_of_core(file, choice):
+    if choice == "In-memory" or not file.name.endswith(".csv"):
+        return False
+    if choice == "Out-of-core (DuckDB)":
+        return True
+    return outofcore.available() and file.size >= CONFIG['OUT_OF_CORE_MIN_MB'] * 1024 ** 2
 
-# Function to handle CSV downloads
-def get_csv_download_link(df, filename):
-    return create_download_button(df, filename, "text/csv")
+# Import a CSV into an on-disk DuckDB database, once per file for all sessions.
+# Returns the source and an ingest report.
+@st.cache_resource(show_spinner="Importing the file into the out-of-core engine...")
+def load_out_of_core(fingerprint, _file):
+    return outofcore.import_csv(_file, CONFIG['OUT_OF_CORE_DIR'], CONFIG['OUT_OF_CORE_MEMORY_LIMIT'])
 
-# Function to handle Excel downloads
-def get_excel_download_link(df, filename, transformation_history=None):
-    return create_download_button(
-        df, filename, 
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        transformation_history
+# Datasets loaded in memory, shared read-only by all sessions under one memory budget
+@st.cache_resource
+def get_dataset_store():
+    return DatasetStore(
+        CONFIG['DATASET_MEMORY_BUDGET_MB'] * 1024 ** 2,
+        spill_dir=CONFIG['DATASET_SPILL_DIR'],
+        idle_seconds=CONFIG['SESSION_IDLE_SECONDS']
     )
 
-# Cache data loading to improve performance
-@st.cache_data
-def load_data(file):
+# Session checkpoints on local disk; expired ones are removed when the server starts
+@st.cache_resource
+def get_checkpoints():
+    checkpoints = SessionCheckpoints(CONFIG['CHECKPOINT_DIR'], CONFIG['CHECKPOINT_TTL_HOURS'] * 3600)
+    checkpoints.prune()
+    return checkpoints
+
+# Load a file into the shared dataset store, once per file content and selection.
+# Returns the shared DataFrame and an ingest report. Excel files load the
+# selected sheets and columns; parsed sheets are also cached on disk by file hash.
+def load_data(file, key, sheets=None, columns=None):
     try:
         if not any(file.name.endswith(ext) for ext in CONFIG['ALLOWED_EXTENSIONS']):
             st.error("Unsupported file format. Please upload a CSV or Excel file.")
-            return None
+            return None, None
             
-        if file.name.endswith(".csv"):   
-            return pd.read_csv(file)
-        else:  # Excel
-            return pd.read_excel(file)
+        # CSV files are streamed in chunks with compact dtypes to stay inside the memory budget
+        return get_dataset_store().load(key, lambda: load_table(
+            file,
+            chunk_rows=CONFIG['INGEST_CHUNK_ROWS'],
+            memory_budget=CONFIG['INGEST_MEMORY_BUDGET_MB'] * 1024 ** 2,
+            category_max_ratio=CONFIG['CATEGORY_MAX_UNIQUE_RATIO'],
+            excel_options={
+                'sheets': sheets,
+                'columns': columns,
+                'workers': CONFIG['EXCEL_SHEET_WORKERS'],
+                'cache_dir': CONFIG['EXCEL_CACHE_DIR'],
+                'cache_max_bytes': CONFIG['EXCEL_CACHE_MAX_MB'] * 1024 ** 2,
+                'fingerprint': key[0]
+            }
+        ))
+    except MemoryBudgetExceeded as e:
+        st.error(f"File is too large to load: {str(e)}")
+        return None, None
     except Exception as e:
         st.error(f"Error loading file: {str(e)}")
-        return None
+        return None, None
+
+# Sheet names and header columns of a workbook, read once per file
+@st.cache_data(show_spinner="Reading the workbook's sheets...")
+def get_sheet_columns(fingerprint, _file):
+    return sheet_columns(_file)
+
+# Let the user choose the sheets and columns of a workbook before it is loaded.
+# Returns the applied (sheets, columns) selection, or None until one is applied.
+def choose_excel_selection(file, fingerprint):
+    headers = get_sheet_columns(fingerprint, file)
+    applied = st.session_state.excel_selection
+    applied = applied[1:] if applied and applied[0] == fingerprint else None
+    with st.expander("Workbook sheets and columns", expanded=applied is None):
+        sheets = st.multiselect(
+            "Sheets to load",
+            list(headers),
+            default=list(applied[0]) if applied else list(headers)[:1],
+            help="Several sheets are stacked into one table with a 'Sheet' column."
+        )
+        available = list(dict.fromkeys(col for sheet in sheets for col in headers[sheet]))
+        columns = st.multiselect(
+            "Columns to load",
+            available,
+            default=[col for col in applied[1] if col in available] if applied and applied[1] else available
+        )
+        if st.button("Load selected sheets", disabled=not sheets or not columns):
+            # All columns are loaded as "no column filter", so the cache entry is shared
+            selection = (tuple(sheets), None if columns == available else tuple(columns))
+            st.session_state.excel_selection = (fingerprint, *selection)
+            applied = selection
+    return applied
+
+# Open the uploaded file: pick up a new file, engine or sheet selection, and
+# load it when the session has no data yet. With `infer_types`, text columns of
+# in-memory data that hold dates, booleans or numbers are converted in one undoable step.
+def open_uploaded_file(uploaded_file, engine_choice, infer_types=False):
+    if engine_choice == "Out-of-core (DuckDB)" and not uploaded_file.name.endswith(".csv"):
+        st.info("The out-of-core engine reads CSV files; Excel files are loaded in memory.")
+    engine = "duckdb" if wants_out_of_core(uploaded_file, engine_choice) else "pandas"
+
+    fingerprint = st.session_state.dataset_fingerprint
+    if st.session_state.current_file != uploaded_file.name:
+        fingerprint = file_fingerprint(uploaded_file.getvalue())
+
+    # Workbooks are loaded once the user has picked the sheets and columns
+    selection = None
+    if engine == "pandas" and uploaded_file.name.endswith(".xlsx"):
+        selection = choose_excel_selection(uploaded_file, fingerprint)
+        if selection is None:
+            st.info("Choose the sheets and columns to load, then click \"Load selected sheets\".")
+            st.stop()
+
+    # Check if a new file is being uploaded by comparing with the current filename
+    if (st.session_state.current_file != uploaded_file.name or st.session_state.engine != engine
+            or st.session_state.loaded_selection != selection):
+        # Reset session state for a new file
+        st.session_state.transformation_history = []
+        st.session_state.current_file = uploaded_file.name
+        st.session_state.dataset_fingerprint = fingerprint
+        st.session_state.loaded_selection = selection
+        st.session_state.data_version = 0
+        st.session_state.profile_cache = {}
+        st.session_state.snapshots = None
+        st.session_state.engine = engine
+        st.session_state.export_file = None
+        st.session_state.batch_results = None
+        st.session_state.checkpoint_token = None
+        st.session_state.resumed = False
+        
+    # Load the data with caching
+    if st.session_state.snapshots is None:
+        reload = None
+        if engine == "duckdb":
+            try:
+                source, st.session_state.ingest_report = load_out_of_core(
+                    st.session_state.dataset_fingerprint, uploaded_file
+                )
+                df = source.frame()
+            except Exception as e:
+                st.error(f"Error loading file: {str(e)}")
+                df = None
+        else:
+            key = (st.session_state.dataset_fingerprint, *(selection or (None, None)))
+            df, st.session_state.ingest_report = load_data(uploaded_file, key, *(selection or ()))
+            st.session_state.dataset_key = key
+            # A session that released its data reloads the original from the shared store
+            reload = partial(get_dataset_store().frame, key)
+        if df is not None and not df.empty:
+            # Versions share buffers with the shared original until a column is modified
+            st.session_state.snapshots = SnapshotHistory(df, max_steps=CONFIG['MAX_UNDO_STEPS'], source=reload)
+            # In-memory sessions are checkpointed; the link to this page resumes them
+            if engine == "pandas":
+                token = st.session_state.checkpoint_token = uuid.uuid4().hex
+                st.session_state.snapshots.spilled = partial(get_checkpoints().frame, token)
+                st.query_params["session"] = token
+                if infer_types:
+                    ops = inferred_astype_ops(df, CONFIG['TYPE_INFERENCE_SAMPLE_ROWS'], CONFIG['CATEGORY_MAX_UNIQUE_RATIO'])
+                    if ops:
+                        apply_transformation(*ops)
+            elif "session" in st.query_params:
+                del st.query_params["session"]
+        else:
+            st.error("Failed to load the dataset. Please try again with a different file.")
+            st.stop()
+
+# Resume a checkpointed in-memory session, e.g. after a page reload or a
+# server restart. The dataset and the current version are memory-mapped back
+# from disk instead of parsing the file again; undo steps are rebuilt from the plan.
+def resume_session(token):
+    checkpoints = get_checkpoints()
+    checkpoint = checkpoints.load(token)
+    if checkpoint is None:
+        del st.query_params["session"]
+        st.info("The previous session has expired. Please upload the file again.")
+        return
+
+    key, metadata = checkpoint['dataset_key'], checkpoint['metadata']
+    df, report = get_dataset_store().load(key, lambda: (checkpoints.original(key), metadata['ingest_report']))
+    snapshots = SnapshotHistory(
+        df, max_steps=CONFIG['MAX_UNDO_STEPS'],
+        source=partial(get_dataset_store().frame, key), spilled=partial(checkpoints.frame, token)
+    )
+    start = 0
+    for end in checkpoint['steps']:
+        if end > start:
+            snapshots.commit(checkpoint['ops'][start:end])
+            start = end
+
+    selection = None if key[1] is None else tuple(key[1:])
+    st.session_state.current_file = metadata['file_name']
+    st.session_state.dataset_fingerprint = key[0]
+    st.session_state.loaded_selection = selection
+    st.session_state.excel_selection = (key[0], *selection) if selection else None
+    st.session_state.dataset_key = key
+    st.session_state.ingest_report = report
+    st.session_state.engine = "pandas"
+    st.session_state.snapshots = snapshots
+    st.session_state.checkpoint_token = token
+    # The checkpoint already holds this version
+    st.session_state.checkpoint_version = snapshots.current.version
+    st.session_state.resumed = True
+    st.caption(f"Resumed your session on {metadata['file_name']} with {len(checkpoint['ops'])} transformation(s).")
+
+# One response cache for the whole process, so identical questions on identical
+# data are answered once across reruns and sessions
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(
+        max_entries=CONFIG['RESPONSE_CACHE_SIZE'],
+        ttl_seconds=CONFIG['RESPONSE_CACHE_TTL_SECONDS'],
+        disk_dir=CONFIG['RESPONSE_CACHE_DIR']
+    )
+
+# Where finished rerun traces go for monitoring, shared by all sessions
+@st.cache_resource
+def get_metrics_log():
+    return MetricsLog(CONFIG['DIAGNOSTICS_JSONL'], CONFIG['DIAGNOSTICS_OPENMETRICS'])
+
+# Session, dataset and data version a trace is logged with
+def trace_fields():
+    return {
+        'session': st.session_state.session_id,
+        'dataset': st.session_state.dataset_fingerprint,
+        'data_version': st.session_state.data_version
+    }
+
+# Finish this rerun's trace and log it to `metrics_log`. The running profile
+# is stopped, unless the rerun ends by requesting another one ('rerun'), which
+# it then samples too. After st.stop() ('stop') session state can no longer be
+# read or changed: the trace is logged with the `fields` from the start of the
+# rerun, and the next rerun hands the stopped profile to the panel.
+def finish_rerun(trace, metrics_log, profiler, fields, ending=None):
+    trace.finish()
+    if profiler is not None and ending != 'rerun':
+        profiler.stop()
+    if ending != 'stop':
+        fields = trace_fields()
+        if profiler is not None and profiler.stopped:
+            st.session_state.profiler_result = profiler
+            st.session_state.profiler = None
+    if metrics_log.enabled:
+        metrics_log.record(trace, **fields)
+
+# Sidebar panel with this rerun's phases, memory per column of the current
+# data, and the sampling profiler
+def show_diagnostics(trace):
+    with st.sidebar.expander("Diagnostics"):
+        rss = f" · server memory {trace.rss_bytes / 1024 ** 2:,.0f} MB" if trace.rss_bytes is not None else ""
+        st.write(f"This rerun: {trace.seconds:.2f}s{rss}")
+        spans = pd.DataFrame([{
+            'phase': '\u2003' * span['depth'] + span['name'],
+            'seconds': span['seconds'],
+            'memory (MB)': None if span['rss_delta_bytes'] is None else span['rss_delta_bytes'] / 1024 ** 2
+        } for span in trace.spans if span['seconds'] is not None])
+        if not spans.empty:
+            st.dataframe(spans.round(3), hide_index=True, use_container_width=True)
+
+        snapshots = st.session_state.snapshots
+        frame = snapshots.current.frame if snapshots is not None else None
+        if frame is not None and not is_out_of_core(frame) and st.checkbox("Memory per column"):
+            # Measured once per data version; deep measurement reads every string
+            if st.session_state.column_memory[0] != st.session_state.data_version:
+                st.session_state.column_memory = (st.session_state.data_version, column_memory(frame))
+            table = st.session_state.column_memory[1]
+            st.write(f"Data: {table['bytes'].sum() / 1024 ** 2:,.1f} MB")
+            st.dataframe(
+                table.assign(MB=table['bytes'] / 1024 ** 2, share=table['share'].map('{:.0%}'.format))
+                     [['column', 'dtype', 'MB', 'share']].round(2),
+                hide_index=True, use_container_width=True
+            )
+
+        if st.button("Profile the next rerun", disabled=st.session_state.profile_next_rerun):
+            st.session_state.profile_next_rerun = True
+        if st.session_state.profile_next_rerun:
+            st.caption("The next rerun (your next click or input) will be sampled.")
+        profiler = st.session_state.profiler_result
+        if profiler is not None:
+            st.write(f"Profiled rerun: {profiler.seconds:.2f}s, {profiler.samples:,} samples")
+            st.dataframe(profiler.top().round(2), hide_index=True, use_container_width=True)
+            st.download_button(
+                label="📥 Download stacks (flame graph format)",
+                data=profiler.collapsed(),
+                file_name="rerun-profile.txt",
+                mime="text/plain"
+            )
+
+# One model client for the whole process; its concurrency limit is shared by all sessions
+@st.cache_resource
+def get_model_client():
+    if CONFIG['MODEL_BACKEND'] == "fake":
+        backend = FakeBackend()
+    else:
+        backend = GeminiBackend(CONFIG['MODEL_NAME'])
+    return ModelClient(
+        backend,
+        timeout=CONFIG['MODEL_TIMEOUT_SECONDS'],
+        max_retries=CONFIG['MODEL_MAX_RETRIES'],
+        max_concurrent=CONFIG['MODEL_MAX_CONCURRENT_REQUESTS'],
+        queue_timeout=CONFIG['MODEL_QUEUE_TIMEOUT_SECONDS']
+    )
+
+# Batch questions share one request rate across all sessions
+@st.cache_resource
+def get_batch_rate_limiter():
+    return RateLimiter(CONFIG['BATCH_REQUESTS_PER_MINUTE'], per=60.0)
+
+# Prompt for one question about the dataset described by `df_info`
+def build_prompt(df_info, question):
+    return f"""
+    You are a professional data analysis assistant analyzing a pandas DataFrame.
+    
+    {df_info}
+    
+    User question: {question}
+    IMPORTANT INSTRUCTIONS:
+    - Be concise and accurate.
+    - Be objective and avoid hallucinating data or results.
+    - If a question is ambiguous, ask for clarification rather than guessing.
+    - Explain steps clearly.
+    - Return all answers in markdown format, with proper code blocks for code suggestions.
+    """
+
+# Profile text for one question within the prompt token budget, with its size report
+def get_prompt_context(profile, question):
+    return build_context(profile, question, CONFIG['PROMPT_TOKEN_BUDGET'], CONFIG['PROMPT_TOP_CORRELATIONS'])
+
+def describe_prompt(report):
+    text = f"Prompt context: ~{report['tokens']:,} tokens ({report['characters']:,} characters), built in {report['seconds'] * 1000:.0f} ms"
+    if report['compressed']:
+        text += f"; compressed to {report['columns']} of {report['total_columns']} columns"
+    return text + "."
+
+# One answered batch question
+def show_batch_result(result):
+    with st.container(border=True):
+        st.markdown(f"**{result['index'] + 1}. {result['question']}**")
+        if result['error']:
+            st.error(f"Unable to analyze the data: {result['error']}")
+        else:
+            st.markdown(result['answer'])
+        if result.get('prompt'):
+            st.caption(describe_prompt(result['prompt']))
 
 st.title("Data Analysis Assistant")
 
 # Secure API key handling - get from environment variables or Streamlit secrets
 def get_api_key():
-    api_key = os.getenv("GOOGLE_API_KEY") or (
-        st.secrets["GOOGLE_API_KEY"] if hasattr(st, "secrets") and "GOOGLE_API_KEY" in st.secrets else None
-    )
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        try:
+            api_key = st.secrets["GOOGLE_API_KEY"] if "GOOGLE_API_KEY" in st.secrets else None
+        except FileNotFoundError:
+            # No secrets file configured
+            api_key = None
     if api_key:
         genai.configure(api_key=api_key)
     return api_key
@@ -99,481 +622,544 @@ def get_api_key():
 # Get API key securely
 api_key = get_api_key()
 
-# Configure Gemini AI with the API key
-if api_key:
-    # File uploader for dataset
-    uploaded_file = st.file_uploader("Upload your dataset", type=["csv", "xlsx"])
-
-    if uploaded_file is not None:
-        # Check if a new file is being uploaded by comparing with the current filename
-        if 'current_file' not in st.session_state or st.session_state.current_file != uploaded_file.name:
-            # Reset session state for a new file
-            st.session_state.original_df = None
-            st.session_state.transformed_df = None
-            st.session_state.transformation_history = []
-            st.session_state.current_file = uploaded_file.name
-            
-        # Load the data with caching
-        if st.session_state.original_df is None:
-            df = load_data(uploaded_file)
-            if df is not None and not df.empty:
-                st.session_state.original_df = df.copy()
-                st.session_state.transformed_df = df.copy()
-            else:
-                st.error("Failed to load the dataset. Please try again with a different file.")
-                st.stop()
+# Where this rerun's trace goes and what it is logged with, looked up before
+# anything can stop the script
+metrics_log = get_metrics_log()
+profiler = st.session_state.profiler
+fields = trace_fields()
+ending = None
+try:
+    # Configure Gemini AI with the API key
+    if api_key or CONFIG['MODEL_BACKEND'] == "fake":
+        # File uploader for dataset
+        uploaded_file = st.file_uploader("Upload your dataset", type=["csv", "xlsx"])
+    
+        # Large files can be kept on disk and processed by DuckDB instead of pandas
+        engine_choice = st.sidebar.radio(
+            "Execution engine",
+            ["Auto", "In-memory", "Out-of-core (DuckDB)"],
+            help=f"Auto keeps CSV files over {CONFIG['OUT_OF_CORE_MIN_MB']} MB on disk."
+        )
+        infer_types = st.sidebar.checkbox(
+            "Detect column types on upload",
+            value=CONFIG['INFER_TYPES_ON_UPLOAD'],
+            help="Convert text columns that hold dates, yes/no values or numbers when an in-memory file is loaded. "
+                 "The conversion is one step you can undo."
+        )
+
+        with trace.span("load"):
+            if uploaded_file is not None:
+                open_uploaded_file(uploaded_file, engine_choice, infer_types)
+            elif st.session_state.snapshots is None and "session" in st.query_params:
+                # A reloaded page or a restarted server picks the session up from its checkpoint
+                resume_session(st.query_params["session"])
+
+        if st.session_state.snapshots is not None and (uploaded_file is not None or st.session_state.resumed):
+            # Show how the file was ingested
+            report = st.session_state.ingest_report
+            if report and report.get('engine') == 'duckdb':
+                st.caption(
+                    f"Imported {report['rows']:,} rows into the out-of-core engine in {report['seconds']:.1f}s "
+                    f"({report['rows_per_second']:,.0f} rows/s) · "
+                    f"{report['disk_bytes'] / 1024 ** 2:,.1f} MB on disk"
+                )
+            elif report and report.get('engine') == 'excel':
+                st.caption(
+                    f"Loaded {report['rows']:,} rows from {len(report['sheets'])} sheet(s) in {report['seconds']:.1f}s "
+                    + ("from the workbook cache" if report['cached'] else f"with {report['reader']}")
+                    + f" · {report['memory_bytes'] / 1024 ** 2:,.1f} MB in memory"
+                )
+            elif report:
+                st.caption(
+                    f"Loaded {report['rows']:,} rows in {report['seconds']:.1f}s "
+                    f"({report['rows_per_second']:,.0f} rows/s) · "
+                    f"{report['memory_bytes'] / 1024 ** 2:,.1f} MB in memory "
+                    f"(≈{report['default_bytes_estimate'] / 1024 ** 2:,.1f} MB with default dtypes) · "
+                    f"peak {report['peak_bytes'] / 1024 ** 2:,.1f} MB"
+                )
         
-        # Use the transformed dataframe if it exists
-        if st.session_state.transformed_df is not None:
-            df = st.session_state.transformed_df
+            # Run any pending transformations and use the transformed dataframe
+            with trace.span("transform"):
+                df = sync_snapshot_state()
         
-        # Create tabs for different functionalities
-        tab1, tab2, tab3 = st.tabs(["Data Analysis", "Data Transformation", "Download Data"])
+            # Create tabs for different functionalities
+            tab1, tab2, tab3 = st.tabs(["Data Analysis", "Data Transformation", "Download Data"])
         
-        with tab1:
-            # Simplified preview of the data
-            with st.expander("Preview of the dataset"):
-                # Show basic dataset info
-                st.write(f"Dataset shape: {df.shape[0]} rows × {df.shape[1]} columns")
+            with tab1:
+                with trace.span("profile"):
+                    profile = get_profile(df)
+
+                # Simplified preview of the data
+                with st.expander("Preview of the dataset"):
+                    # Show basic dataset info
+                    st.write(f"Dataset shape: {profile['shape'][0]} rows × {profile['shape'][1]} columns")
+                    if profile.get('approximate'):
+                        st.caption(
+                            f"Large dataset: quartiles and unique counts are estimated, and correlations use "
+                            f"a sample of {profile['approximate']['sample_rows']:,} rows."
+                        )
                 
-                # Show first 5 rows
-                st.write("Sample data (first 5 rows):")
-                st.dataframe(df.head(), use_container_width=True)
+                    # Show first 5 rows
+                    st.write("Sample data (first 5 rows):")
+                    st.dataframe(profile['head'], use_container_width=True)
                 
-                # Show column types in a more compact format
-                st.write("Column types:")
-                for col, dtype in zip(df.columns, df.dtypes):
-                    st.write(f"• {col}: {dtype}")
+                    # Show column types in a more compact format
+                    st.write("Column types:")
+                    for col, dtype in profile['dtypes'].items():
+                        st.write(f"• {col}: {dtype}")
             
-            st.write("Ask a question about your dataset:")
+                st.write("Ask a question about your dataset:")
             
-            # Add example questions
-            with st.expander("Example questions you can ask"):
-                st.write("- What is the average of column X?")
-                st.write("- What is the correlation between column X and Y?")
-                st.write("- Show me a summary of the data grouped by column Z")
-                st.write("- Are there any outliers in column X?")
-                st.write("- What factors most strongly predict column X?")
+                # Add example questions
+                with st.expander("Example questions you can ask"):
+                    st.write("- What is the average of column X?")
+                    st.write("- What is the correlation between column X and Y?")
+                    st.write("- Show me a summary of the data grouped by column Z")
+                    st.write("- Are there any outliers in column X?")
+                    st.write("- What factors most strongly predict column X?")
             
-            question = st.text_input("Enter your question")
-
-            if question:
-                try:
-                    # Create DataFrame info more efficiently
-                    df_info = {
-                        'shape': df.shape,
-                        'columns': df.columns.tolist(),
-                        'dtypes': df.dtypes.to_dict(),
-                        'describe': df.describe().to_string(),
-                        'head': df.head().to_string(),
-                        'missing': df.isnull().sum().to_dict()
-                    }
-                    
-                    # Build the info string efficiently
-                    info_parts = [
-                        "DataFrame Information:",
-                        f"- Shape: {df_info['shape']}",
-                        f"- Columns: {df_info['columns']}",
-                        f"- Data types: {df_info['dtypes']}",
-                        "\nStatistical Summary:",
-                        df_info['describe'],
-                        "\nFirst 5 rows:",
-                        df_info['head'],
-                        "\nMissing Values:",
-                        str(df_info['missing'])
-                    ]
-                    
-                    # Add categorical info if exists
-                    cat_cols = df.select_dtypes(include=['object', 'category']).columns
-                    if not cat_cols.empty:
-                        cat_info = {col: df[col].nunique() for col in cat_cols}
-                        info_parts.extend([
-                            "\nUnique Values (for categorical columns):",
-                            ", ".join(f"{col}: {count} unique values" for col, count in cat_info.items())
-                        ])
-                    
-                    # Add correlations if numeric columns exist
-                    num_cols = df.select_dtypes(include=[np.number])
-                    if not num_cols.empty:
-                        info_parts.extend([
-                            "\nCorrelations (for numeric columns):",
-                            num_cols.corr().round(2).to_string()
-                        ])
-                    else:
-                        info_parts.append("\nCorrelations: No numeric columns for correlation")
-                    
-                    # Join all parts efficiently
-                    df_info = "\n".join(info_parts)
+                question = st.text_input("Enter your question")
+
+                if question:
+                    try:
+                        # Reuse the cached profile instead of rescanning the data on every rerun;
+                        # wide tables are compressed to the columns relevant to the question
+                        with trace.span("prompt"):
+                            df_info, prompt_report = get_prompt_context(profile, question)
                     
-                    # Create the prompt
-                    prompt = f"""
-                    You are a professional data analysis assistant analyzing a pandas DataFrame.
+                        # Create the prompt
+                        prompt = build_prompt(df_info, question)
+                        generation_config = CONFIG['GENERATION_CONFIG']
                     
-                    {df_info}
+                        def stream():
+                            return get_model_client().stream(prompt, generation_config)
                     
-                    User question: {question}
-                    IMPORTANT INSTRUCTIONS:
-                    - Be concise and accurate.
-                    - Be objective and avoid hallucinating data or results.
-                    - If a question is ambiguous, ask for clarification rather than guessing.
-                    - Explain steps clearly.
-                    - Return all answers in markdown format, with proper code blocks for code suggestions.
-                    """
+                        # Reruns and other sessions asking the same question about the same data reuse the answer
+                        key = response_key(df_info, question, CONFIG['MODEL_NAME'], generation_config)
+                        with st.spinner("Analyzing your data..."), trace.span("model"):
+                            chunks, origin = get_response_cache().get_or_stream(key, stream)
+                            st.markdown("### Analysis Result")
+                            # New answers appear piece by piece as the model produces them
+                            st.write_stream(chunks)
+                            if origin != "api":
+                                st.caption("Answer reused from an identical earlier question.")
+                            st.caption(describe_prompt(prompt_report))
+                        
+                    except Exception as e:
+                        st.error(f"Unable to analyze the data: {str(e)}")
+            
+                # Answer a whole checklist of questions at once
+                with st.expander("Batch questions"):
+                    batch_text = st.text_area("Questions (one per line):")
+                    questions_file = st.file_uploader("Or upload a question list", type=["txt", "csv"])
+                    questions = read_questions_file(questions_file) if questions_file is not None else parse_questions(batch_text)
+                    if len(questions) > CONFIG['BATCH_MAX_QUESTIONS']:
+                        st.warning(f"Only the first {CONFIG['BATCH_MAX_QUESTIONS']} questions will be asked.")
+                        questions = questions[:CONFIG['BATCH_MAX_QUESTIONS']]
+                
+                    if st.button(f"Ask {len(questions)} questions", disabled=not questions):
+                        client, cache, limiter = get_model_client(), get_response_cache(), get_batch_rate_limiter()
+                        prompt_reports = {}
                     
-                    # Create the Gemini client and get response
-                    client = genai.GenerativeModel("gemini-2.0-flash")
-                    generation_config = {
-                        "temperature": 0.2,
-                        "top_p": 0.85,
-                        "max_output_tokens": 1024
-                    }
+                        def ask(question):
+                            # Each question gets the profile columns relevant to it
+                            df_info, prompt_reports[question] = get_prompt_context(profile, question)
+                            # Only actual API calls count against the rate limit, cached answers do not
+                            def generate():
+                                limiter.acquire()
+                                return client.generate(build_prompt(df_info, question), CONFIG['GENERATION_CONFIG'])
+                            key = response_key(df_info, question, CONFIG['MODEL_NAME'], CONFIG['GENERATION_CONFIG'])
+                            return cache.get_or_generate(key, generate)
                     
-                    with st.spinner("Analyzing your data..."):
-                        response = client.generate_content(
-                            prompt,
-                            generation_config=generation_config
+                        progress = st.progress(0.0, text="Waiting for the first answer...")
+                        results = []
+                        with trace.span("model"):
+                            for result in run_batch(questions, ask, max_workers=CONFIG['BATCH_MAX_WORKERS']):
+                                result['prompt'] = prompt_reports.get(result['question'])
+                                results.append(result)
+                                progress.progress(len(results) / len(questions), text=f"{len(results)} of {len(questions)} answered")
+                                show_batch_result(result)
+                        st.session_state.batch_results = results
+                    elif st.session_state.batch_results:
+                        for result in sorted(st.session_state.batch_results, key=lambda r: r['index']):
+                            show_batch_result(result)
+                
+                    if st.session_state.batch_results:
+                        metadata = {
+                            'dataset': st.session_state.current_file,
+                            'rows': profile['shape'][0],
+                            'columns': profile['shape'][1],
+                            'model': CONFIG['MODEL_NAME']
+                        }
+                        md_col, json_col = st.columns(2)
+                        md_col.download_button(
+                            label="📥 Download report (Markdown)",
+                            data=report_markdown(st.session_state.batch_results, metadata),
+                            file_name="analysis_report.md",
+                            mime="text/markdown"
+                        )
+                        json_col.download_button(
+                            label="📥 Download report (JSON)",
+                            data=report_json(st.session_state.batch_results, metadata),
+                            file_name="analysis_report.json",
+                            mime="application/json"
                         )
-                        st.markdown("### Analysis Result")
-                        st.markdown(response.text)
-                        
-                except Exception as e:
-                    st.error(f"Unable to analyze the data: {str(e)}")
         
-        with tab2:
-            st.header("Transform Your Data")
+            with tab2:
+                st.header("Transform Your Data")
             
-            # Display transformation history
-            if st.session_state.transformation_history:
-                with st.expander("Transformation History"):
-                    for i, transformation in enumerate(st.session_state.transformation_history):
-                        st.write(f"{i+1}. {transformation}")
+                # Display transformation history
+                if st.session_state.transformation_history:
+                    with st.expander("Transformation History"):
+                        for i, transformation in enumerate(st.session_state.transformation_history):
+                            st.write(f"{i+1}. {transformation}")
             
-            # Option to reset to original data
-            if st.button("Reset to Original Data"):
-                st.session_state.transformed_df = st.session_state.original_df.copy()
-                st.session_state.transformation_history = []
-                st.success("Data reset to original state!")
-                st.rerun()
+                # Undo/redo individual steps or reset to original data
+                snapshots = st.session_state.snapshots
+                undo_col, redo_col, reset_col = st.columns(3)
+                if undo_col.button("↩️ Undo", disabled=not snapshots.can_undo):
+                    snapshots.undo()
+                    st.rerun()
+                if redo_col.button("↪️ Redo", disabled=not snapshots.can_redo):
+                    snapshots.redo()
+                    st.rerun()
+                if reset_col.button("Reset to Original Data"):
+                    snapshots.reset()
+                    st.rerun()
             
-            # Transformation options
-            transform_option = st.selectbox(
-                "Select transformation type:",
-                ["Select an option", "Filter Data", "Add/Remove Columns", "Handle Missing Values", "Transform Column", "Change Data Type", "Sort Data"]
-            )
+                # Save the recorded steps as a pipeline, or replay a saved one on this file
+                with st.expander("Transformation Pipeline"):
+                    if snapshots.current.ops:
+                        st.download_button(
+                            label="📥 Download pipeline (JSON)",
+                            data=dump_plan(snapshots.current.ops),
+                            file_name="pipeline.json",
+                            mime="application/json"
+                        )
+                    pipeline_file = st.file_uploader("Apply a saved pipeline", type=["json"])
+                    if pipeline_file is not None and st.button("Apply Pipeline"):
+                        try:
+                            apply_transformation(*load_plan(pipeline_file.getvalue()))
+                            st.rerun()
+                        except ValueError as e:
+                            st.error(f"Unable to read pipeline: {str(e)}")
             
-            if transform_option == "Filter Data":
-                col = st.selectbox("Select column to filter on:", df.columns)
+                # Transformation options
+                transform_option = st.selectbox(
+                    "Select transformation type:",
+                    ["Select an option", "Filter Data", "Add/Remove Columns", "Handle Missing Values", "Transform Column", "Change Data Type", "Sort Data"]
+                )
+            
+                if transform_option == "Filter Data":
+                    col = st.selectbox("Select column to filter on:", df.columns)
+                    # Distinct values and bounds come from per-column indexes built once per data version
+                    indexes = get_column_indexes(df)
                 
-                if col in df.select_dtypes(include=['object', 'category']).columns:
-                    # For categorical columns, show unique values
-                    unique_values = df[col].unique()
-                    selected_values = st.multiselect("Select values to keep:", unique_values)
+                    if col not in numeric_columns(df):
+                        # For categorical, date and boolean columns, show unique values
+                        selected_values = st.multiselect("Select values to keep:", unique_values(df, col, indexes))
                     
-                    if st.button("Apply Filter"):
-                        if selected_values:
-                            st.session_state.transformed_df = df[df[col].isin(selected_values)]
-                            st.session_state.transformation_history.append(f"Filtered {col} to keep only {', '.join(map(str, selected_values))}")
-                            st.success(f"Data filtered! Kept {len(st.session_state.transformed_df)} rows.")
-                            st.rerun()
-                else:
-                    # For numeric columns, show range filter
-                    min_val, max_val = float(df[col].min()), float(df[col].max())
-                    filter_range = st.slider(f"Filter range for {col}:", min_val, max_val, (min_val, max_val))
+                        if st.button("Apply Filter"):
+                            if selected_values:
+                                apply_transformation({'op': 'filter', 'kind': 'isin', 'column': col, 'values': list(selected_values)})
+                                st.rerun()
+                    else:
+                        # For numeric columns, show range filter
+                        min_val, max_val = map(float, column_range(df, col, indexes))
+                        filter_range = st.slider(f"Filter range for {col}:", min_val, max_val, (min_val, max_val))
                     
-                    if st.button("Apply Filter"):
-                        st.session_state.transformed_df = df[(df[col] >= filter_range[0]) & (df[col] <= filter_range[1])]
-                        st.session_state.transformation_history.append(f"Filtered {col} to range {filter_range[0]} - {filter_range[1]}")
-                        st.success(f"Data filtered! Kept {len(st.session_state.transformed_df)} rows.")
-                        st.rerun()
+                        if st.button("Apply Filter"):
+                            apply_transformation({'op': 'filter', 'kind': 'range', 'column': col, 'min': filter_range[0], 'max': filter_range[1]})
+                            st.rerun()
             
-            elif transform_option == "Add/Remove Columns":
-                operation = st.radio("Select operation:", ["Remove Columns", "Create New Column"])
+                elif transform_option == "Add/Remove Columns":
+                    operation = st.radio("Select operation:", ["Remove Columns", "Create New Column"])
                 
-                if operation == "Remove Columns":
-                    cols_to_remove = st.multiselect("Select columns to remove:", df.columns)
-                    if st.button("Remove Selected Columns"):
-                        if cols_to_remove:
-                            st.session_state.transformed_df = df.drop(columns=cols_to_remove)
-                            st.session_state.transformation_history.append(f"Removed columns: {', '.join(cols_to_remove)}")
-                            st.success(f"Removed {len(cols_to_remove)} columns!")
-                            st.rerun()
+                    if operation == "Remove Columns":
+                        cols_to_remove = st.multiselect("Select columns to remove:", df.columns)
+                        if st.button("Remove Selected Columns"):
+                            if cols_to_remove:
+                                apply_transformation({'op': 'drop_columns', 'columns': list(cols_to_remove)})
+                                st.rerun()
                 
-                else:  # Create New Column
-                    new_col_name = st.text_input("New column name:")
-                    calculation_type = st.selectbox(
-                        "Calculation type:",
-                        ["Simple Calculation", "Combine Columns"]
-                    )
+                    else:  # Create New Column
+                        new_col_name = st.text_input("New column name:")
+                        calculation_type = st.selectbox(
+                            "Calculation type:",
+                            ["Simple Calculation", "Combine Columns", "Expression"]
+                        )
                     
-                    if calculation_type == "Simple Calculation":
-                        numeric_cols = df.select_dtypes(include=np.number).columns
-                        if len(numeric_cols) > 0:
-                            col_to_transform = st.selectbox("Select column to transform:", numeric_cols)
-                            operation = st.selectbox("Select operation:", ["Add", "Subtract", "Multiply", "Divide"])
-                            value = st.number_input("Enter value:")
+                        if calculation_type == "Simple Calculation":
+                            numeric_cols = numeric_columns(df)
+                            if len(numeric_cols) > 0:
+                                col_to_transform = st.selectbox("Select column to transform:", numeric_cols)
+                                operation = st.selectbox("Select operation:", ["Add", "Subtract", "Multiply", "Divide"])
+                                value = st.number_input("Enter value:")
                             
+                                if st.button("Create Column"):
+                                    if operation == "Divide" and value == 0:
+                                        st.warning("Cannot divide by zero.")
+                                    elif new_col_name and col_to_transform:
+                                        apply_transformation({
+                                            'op': 'derive', 'kind': 'arithmetic', 'column': new_col_name,
+                                            'source': col_to_transform, 'operator': operation, 'value': value
+                                        })
+                                        st.rerun()
+                            else:
+                                st.warning("No numeric columns available for calculation.")
+                    
+                        elif calculation_type == "Expression":
+                            expression = st.text_input(
+                                "Expression:",
+                                placeholder='(price - cost) * qty   or   region + "-" + store',
+                                help="Use + - * / // % ** and parentheses over column names and constants. "
+                                     "Text is joined with + (use str(...) for numbers). Functions: abs, round, "
+                                     "sqrt, log, exp, upper, lower, str. Write names with spaces in backticks, "
+                                     "e.g. `Unit Price`."
+                            )
+                        
                             if st.button("Create Column"):
-                                if new_col_name and col_to_transform:
-                                    if operation == "Add":
-                                        st.session_state.transformed_df[new_col_name] = df[col_to_transform] + value
-                                    elif operation == "Subtract":
-                                        st.session_state.transformed_df[new_col_name] = df[col_to_transform] - value
-                                    elif operation == "Multiply":
-                                        st.session_state.transformed_df[new_col_name] = df[col_to_transform] * value
-                                    elif operation == "Divide" and value != 0:
-                                        st.session_state.transformed_df[new_col_name] = df[col_to_transform] / value
-                                    
-                                    st.session_state.transformation_history.append(f"Created new column '{new_col_name}' = {col_to_transform} {operation} {value}")
-                                    st.success(f"Created new column: {new_col_name}")
-                                    st.rerun()
-                        else:
-                            st.warning("No numeric columns available for calculation.")
+                                if new_col_name and expression:
+                                    try:
+                                        # Check names and types up front so mistakes are reported here
+                                        compile_expression(expression, df.columns, numeric_columns(df))
+                                        apply_transformation({
+                                            'op': 'derive', 'kind': 'expression', 'column': new_col_name,
+                                            'expression': expression
+                                        })
+                                        st.rerun()
+                                    except ExpressionError as e:
+                                        st.error(str(e))
                     
-                    else:  # Combine Columns
-                        cols_to_combine = st.multiselect("Select columns to combine:", df.columns)
-                        separator = st.text_input("Separator (for text columns):", " ")
+                        else:  # Combine Columns
+                            cols_to_combine = st.multiselect("Select columns to combine:", df.columns)
+                            separator = st.text_input("Separator (for text columns):", " ")
                         
-                        if st.button("Create Column"):
-                            if new_col_name and cols_to_combine:
-                                # Check if all selected columns are numeric
-                                all_numeric = all(col in df.select_dtypes(include=np.number).columns for col in cols_to_combine)
-                                
-                                if all_numeric:
-                                    # Sum numeric columns
-                                    st.session_state.transformed_df[new_col_name] = df[cols_to_combine].sum(axis=1)
-                                    operation_desc = "sum"
-                                else:
-                                    # Concatenate string columns
-                                    st.session_state.transformed_df[new_col_name] = df[cols_to_combine].astype(str).agg(separator.join, axis=1)
-                                    operation_desc = "concatenation with separator"
-                                
-                                st.session_state.transformation_history.append(f"Created new column '{new_col_name}' from {operation_desc} of {', '.join(cols_to_combine)}")
-                                st.success(f"Created new column: {new_col_name}")
-                                st.rerun()
+                            if st.button("Create Column"):
+                                if new_col_name and cols_to_combine:
+                                    # Numeric columns are summed, anything else is concatenated with the separator
+                                    apply_transformation({
+                                        'op': 'derive', 'kind': 'combine', 'column': new_col_name,
+                                        'columns': list(cols_to_combine), 'separator': separator
+                                    })
+                                    st.rerun()
             
-            elif transform_option == "Handle Missing Values":
-                strategy = st.selectbox(
-                    "Select strategy:",
-                    ["Drop rows with missing values", "Fill missing values"]
-                )
+                elif transform_option == "Handle Missing Values":
+                    strategy = st.selectbox(
+                        "Select strategy:",
+                        ["Drop rows with missing values", "Fill missing values"]
+                    )
                 
-                if strategy == "Drop rows with missing values":
-                    cols_with_missing = df.columns[df.isnull().any()].tolist()
-                    if not cols_with_missing:
-                        st.info("No missing values found in the dataset.")
-                    else:
-                        selected_cols = st.multiselect("Select columns to check for missing values (leave empty for all):", cols_with_missing)
+                    if strategy == "Drop rows with missing values":
+                        cols_with_missing = columns_with_missing(get_profile(df))
+                        if not cols_with_missing:
+                            st.info("No missing values found in the dataset.")
+                        else:
+                            selected_cols = st.multiselect("Select columns to check for missing values (leave empty for all):", cols_with_missing)
                         
-                        if st.button("Drop Rows"):
-                            if selected_cols:
-                                st.session_state.transformed_df = df.dropna(subset=selected_cols)
-                                st.session_state.transformation_history.append(f"Dropped rows with missing values in columns: {', '.join(selected_cols)}")
-                            else:
-                                st.session_state.transformed_df = df.dropna()
-                                st.session_state.transformation_history.append("Dropped all rows with any missing values")
-                            
-                            st.success(f"Dropped rows with missing values. New shape: {st.session_state.transformed_df.shape}")
-                            st.rerun()
+                            if st.button("Drop Rows"):
+                                # An empty column list means "any column"
+                                apply_transformation({'op': 'filter', 'kind': 'notna', 'columns': list(selected_cols)})
+                                st.rerun()
                 
-                else:  # Fill missing values
-                    cols_with_missing = df.columns[df.isnull().any()].tolist()
-                    if not cols_with_missing:
-                        st.info("No missing values found in the dataset.")
-                    else:
-                        col_to_fill = st.selectbox("Select column with missing values:", cols_with_missing)
+                    else:  # Fill missing values
+                        cols_with_missing = columns_with_missing(get_profile(df))
+                        if not cols_with_missing:
+                            st.info("No missing values found in the dataset.")
+                        else:
+                            col_to_fill = st.selectbox("Select column with missing values:", cols_with_missing)
                         
-                        if col_to_fill:
-                            if col_to_fill in df.select_dtypes(include=np.number).columns:
-                                fill_method = st.selectbox(
-                                    "Fill method for numeric column:",
-                                    ["Mean", "Median", "Custom value"]
-                                )
-                                
-                                if fill_method == "Custom value":
-                                    fill_value = st.number_input("Enter value to fill with:")
-                                
-                                if st.button("Fill Missing Values"):
-                                    if fill_method == "Mean":
-                                        fill_value = df[col_to_fill].mean()
-                                        st.session_state.transformed_df[col_to_fill] = df[col_to_fill].fillna(fill_value)
-                                        st.session_state.transformation_history.append(f"Filled missing values in {col_to_fill} with mean ({fill_value:.2f})")
-                                    elif fill_method == "Median":
-                                        fill_value = df[col_to_fill].median()
-                                        st.session_state.transformed_df[col_to_fill] = df[col_to_fill].fillna(fill_value)
-                                        st.session_state.transformation_history.append(f"Filled missing values in {col_to_fill} with median ({fill_value:.2f})")
-                                    else:
-                                        st.session_state.transformed_df[col_to_fill] = df[col_to_fill].fillna(fill_value)
-                                        st.session_state.transformation_history.append(f"Filled missing values in {col_to_fill} with custom value ({fill_value})")
-                                    
-                                    st.success(f"Filled missing values in column: {col_to_fill}")
-                                    st.rerun()
-                            else:
-                                # For non-numeric columns
-                                fill_method = st.selectbox(
-                                    "Fill method for non-numeric column:",
-                                    ["Most frequent value", "Custom value"]
-                                )
+                            if col_to_fill:
+                                if col_to_fill in numeric_columns(df):
+                                    fill_method = st.selectbox(
+                                        "Fill method for numeric column:",
+                                        ["Mean", "Median", "Custom value"]
+                                    )
                                 
-                                if fill_method == "Custom value":
-                                    fill_value = st.text_input("Enter value to fill with:")
+                                    fill_value = None
+                                    if fill_method == "Custom value":
+                                        fill_value = st.number_input("Enter value to fill with:")
+                                else:
+                                    # For non-numeric columns
+                                    fill_method = st.selectbox(
+                                        "Fill method for non-numeric column:",
+                                        ["Most frequent value", "Custom value"]
+                                    )
                                 
+                                    fill_value = None
+                                    if fill_method == "Custom value":
+                                        fill_value = st.text_input("Enter value to fill with:")
+                            
                                 if st.button("Fill Missing Values"):
-                                    if fill_method == "Most frequent value":
-                                        fill_value = df[col_to_fill].mode()[0]
-                                        st.session_state.transformed_df[col_to_fill] = df[col_to_fill].fillna(fill_value)
-                                        st.session_state.transformation_history.append(f"Filled missing values in {col_to_fill} with most frequent value ({fill_value})")
-                                    else:
-                                        st.session_state.transformed_df[col_to_fill] = df[col_to_fill].fillna(fill_value)
-                                        st.session_state.transformation_history.append(f"Filled missing values in {col_to_fill} with custom value ({fill_value})")
-                                    
-                                    st.success(f"Filled missing values in column: {col_to_fill}")
+                                    method = {"Mean": "mean", "Median": "median", "Most frequent value": "mode"}.get(fill_method, "value")
+                                    apply_transformation({'op': 'fillna', 'column': col_to_fill, 'method': method, 'value': fill_value})
                                     st.rerun()
             
-            elif transform_option == "Transform Column":
-                col_to_transform = st.selectbox("Select column to transform:", df.columns)
+                elif transform_option == "Transform Column":
+                    col_to_transform = st.selectbox("Select column to transform:", df.columns)
                 
-                if col_to_transform in df.select_dtypes(include=np.number).columns:
-                    # For numeric columns
-                    transform_type = st.selectbox(
-                        "Select transformation:",
-                        ["Normalize (0-1)", "Standardize (z-score)", "Log transform", "Square root"]
-                    )
-                    
-                    if st.button("Apply Transformation"):
-                        if transform_type == "Normalize (0-1)":
-                            min_val = df[col_to_transform].min()
-                            max_val = df[col_to_transform].max()
-                            if max_val > min_val:  # Avoid division by zero
-                                st.session_state.transformed_df[col_to_transform] = (df[col_to_transform] - min_val) / (max_val - min_val)
-                                st.session_state.transformation_history.append(f"Normalized {col_to_transform} to range 0-1")
-                        
-                        elif transform_type == "Standardize (z-score)":
-                            mean = df[col_to_transform].mean()
-                            std = df[col_to_transform].std()
-                            if std > 0:  # Avoid division by zero
-                                st.session_state.transformed_df[col_to_transform] = (df[col_to_transform] - mean) / std
-                                st.session_state.transformation_history.append(f"Standardized {col_to_transform} (z-score)")
-                        
-                        elif transform_type == "Log transform":
-                            # Handle negative or zero values
-                            min_val = df[col_to_transform].min()
-                            if min_val <= 0:
-                                offset = abs(min_val) + 1
-                                st.session_state.transformed_df[col_to_transform] = np.log(df[col_to_transform] + offset)
-                                st.session_state.transformation_history.append(f"Applied log transform to {col_to_transform} with offset {offset}")
-                            else:
-                                st.session_state.transformed_df[col_to_transform] = np.log(df[col_to_transform])
-                                st.session_state.transformation_history.append(f"Applied log transform to {col_to_transform}")
-                        
-                        elif transform_type == "Square root":
-                            # Handle negative values
-                            min_val = df[col_to_transform].min()
-                            if min_val < 0:
-                                offset = abs(min_val)
-                                st.session_state.transformed_df[col_to_transform] = np.sqrt(df[col_to_transform] + offset)
-                                st.session_state.transformation_history.append(f"Applied square root transform to {col_to_transform} with offset {offset}")
-                            else:
-                                st.session_state.transformed_df[col_to_transform] = np.sqrt(df[col_to_transform])
-                                st.session_state.transformation_history.append(f"Applied square root transform to {col_to_transform}")
-                        
-                        st.success(f"Transformed column: {col_to_transform}")
-                        st.rerun()
+                    if col_to_transform in numeric_columns(df):
+                        # For numeric columns
+                        transform_type = st.selectbox(
+                            "Select transformation:",
+                            ["Normalize (0-1)", "Standardize (z-score)", "Log transform", "Square root"]
+                        )
+                        methods = {
+                            "Normalize (0-1)": "normalize",
+                            "Standardize (z-score)": "standardize",
+                            "Log transform": "log",
+                            "Square root": "sqrt"
+                        }
+                    else:
+                        # For categorical/text columns
+                        transform_type = st.selectbox(
+                            "Select transformation:",
+                            ["Convert to uppercase", "Convert to lowercase", "One-hot encode"]
+                        )
+                        methods = {"Convert to uppercase": "upper", "Convert to lowercase": "lower"}
+                
+                    # Cardinality guard: beyond ONE_HOT_MAX_COLUMNS values only the most frequent get a column
+                    top_k = None
+                    if transform_type == "One-hot encode":
+                        indexes = None if is_out_of_core(df) else get_column_indexes(df)
+                        distinct = int(distinct_count(df, col_to_transform, indexes))
+                        if distinct > CONFIG['ONE_HOT_MAX_COLUMNS']:
+                            st.warning(
+                                f"{col_to_transform} has {distinct:,} distinct values. Only the most frequent ones get "
+                                "a column of their own; all others are grouped in an \"other\" column."
+                            )
+                            group_rare = True
+                        else:
+                            group_rare = st.checkbox("Group rare values in an \"other\" column")
+                        if group_rare:
+                            limit = min(CONFIG['ONE_HOT_MAX_COLUMNS'], max(distinct - 1, 1))
+                            top_k = int(st.number_input(
+                                "Most frequent values to keep as columns:",
+                                min_value=1, max_value=limit, value=min(CONFIG['ONE_HOT_TOP_K'], limit)
+                            ))
                 
-                else:
-                    # For categorical/text columns
-                    transform_type = st.selectbox(
-                        "Select transformation:",
-                        ["Convert to uppercase", "Convert to lowercase", "One-hot encode"]
-                    )
-                    
                     if st.button("Apply Transformation"):
-                        if transform_type == "Convert to uppercase":
-                            st.session_state.transformed_df[col_to_transform] = df[col_to_transform].astype(str).str.upper()
-                            st.session_state.transformation_history.append(f"Converted {col_to_transform} to uppercase")
-                        
-                        elif transform_type == "Convert to lowercase":
-                            st.session_state.transformed_df[col_to_transform] = df[col_to_transform].astype(str).str.lower()
-                            st.session_state.transformation_history.append(f"Converted {col_to_transform} to lowercase")
-                        
-                        elif transform_type == "One-hot encode":
-                            # Get one-hot encoding
-                            one_hot = pd.get_dummies(df[col_to_transform], prefix=col_to_transform)
-                            # Drop the original column and join the one-hot encoded columns
-                            st.session_state.transformed_df = pd.concat([df.drop(columns=[col_to_transform]), one_hot], axis=1)
-                            st.session_state.transformation_history.append(f"One-hot encoded {col_to_transform}")
-                        
-                        st.success(f"Transformed column: {col_to_transform}")
+                        if transform_type == "One-hot encode":
+                            op = {'op': 'one_hot', 'column': col_to_transform}
+                            if top_k is not None:
+                                op['top_k'] = top_k
+                            apply_transformation(op)
+                        else:
+                            apply_transformation({'op': 'transform', 'column': col_to_transform, 'method': methods[transform_type]})
                         st.rerun()
             
-            elif transform_option == "Change Data Type":
-                col_to_change = st.selectbox("Select column to change data type:", df.columns)
+                elif transform_option == "Change Data Type":
+                    col_to_change = st.selectbox("Select column to change data type:", df.columns)
                 
-                # Show current data type and sample values
-                current_type = df[col_to_change].dtype
-                st.write(f"Current data type: {current_type}")
-                st.write("Sample values:", df[col_to_change].head(CONFIG['PREVIEW_ROWS']).tolist())
+                    # Show current data type and sample values
+                    current_type = column_dtype(df, col_to_change)
+                    st.write(f"Current data type: {current_type}")
+                    st.write("Sample values:", sample_values(df, col_to_change, CONFIG['PREVIEW_ROWS']))
                 
-                # Select new data type
-                new_type = st.selectbox(
-                    "Select new data type:",
-                    list(CONFIG['TYPE_MAPPING'].keys()) + ["datetime"]
-                )
+                    # Suggest the most compact type the sampled values fit
+                    sample = column_sample(df, col_to_change, CONFIG['TYPE_INFERENCE_SAMPLE_ROWS'])
+                    suggestion = infer_column(
+                        sample if is_out_of_core(df) else df[col_to_change],
+                        CONFIG['TYPE_INFERENCE_SAMPLE_ROWS'], CONFIG['CATEGORY_MAX_UNIQUE_RATIO']
+                    )
+                    type_options = list(CONFIG['TYPE_MAPPING'].keys()) + ["datetime"]
+                    if suggestion is not None:
+                        suggested = f"suggested ({suggestion['dtype']})"
+                        type_options = [suggested] + type_options
+                        st.caption(
+                            f"Suggested type: {suggestion['dtype']}"
+                            + (f" with format {suggestion['format']}" if suggestion['format'] else "")
+                            + f", from {len(sample):,} sampled values"
+                        )
                 
-                if st.button("Change Data Type"):
-                    try:
-                        if new_type == "datetime":
-                            st.session_state.transformed_df[col_to_change] = pd.to_datetime(df[col_to_change])
+                    # Select new data type
+                    new_type = st.selectbox("Select new data type:", type_options)
+                    coerce = st.checkbox("Set values that cannot be converted to missing")
+                
+                    fmt = None
+                    if suggestion is not None and new_type == suggested:
+                        dtype, fmt = suggestion['dtype'], suggestion['format']
+                    elif new_type == "datetime":
+                        dtype = "datetime"
+                        if not pd.api.types.is_datetime64_any_dtype(sample):
+                            fmt = detect_datetime_format(sample)
+                    else:
+                        dtype = CONFIG['TYPE_MAPPING'][new_type]
+                
+                    # Preview conversion failures on the sample
+                    failures = conversion_failures(sample, dtype, fmt)
+                    if len(failures):
+                        examples = ", ".join(repr(value) for value in failures.head(5).tolist())
+                        message = (f"{len(failures):,} of {len(sample):,} sampled values cannot be converted to {dtype} "
+                                   f"(e.g. {examples})")
+                        if coerce:
+                            st.info(f"{message}; they will be set to missing.")
                         else:
-                            st.session_state.transformed_df[col_to_change] = df[col_to_change].astype(CONFIG['TYPE_MAPPING'][new_type])
-                        
-                        st.session_state.transformation_history.append(f"Changed data type of {col_to_change} from {current_type} to {new_type}")
-                        st.success(f"Changed data type of {col_to_change} to {new_type}")
+                            st.warning(message)
+                
+                    if st.button("Change Data Type"):
+                        # Conversion errors are reported when the plan is executed on the next run
+                        op = {'op': 'astype', 'column': col_to_change, 'dtype': dtype}
+                        if fmt:
+                            op['format'] = fmt
+                        if coerce:
+                            op['errors'] = 'coerce'
+                        apply_transformation(op)
                         st.rerun()
-                    except Exception as e:
-                        st.error(f"Error changing data type: {str(e)}")
-                        st.info("Tip: Make sure the data in the column is compatible with the selected data type.")
             
-            elif transform_option == "Sort Data":
-                sort_col = st.selectbox("Select column to sort by:", df.columns)
-                sort_order = st.radio("Sort order:", ["Ascending", "Descending"])
+                elif transform_option == "Sort Data":
+                    sort_col = st.selectbox("Select column to sort by:", df.columns)
+                    sort_order = st.radio("Sort order:", ["Ascending", "Descending"])
                 
-                if st.button("Sort Data"):
-                    ascending = sort_order == "Ascending"
-                    st.session_state.transformed_df = df.sort_values(by=sort_col, ascending=ascending)
-                    st.session_state.transformation_history.append(f"Sorted data by {sort_col} in {sort_order.lower()} order")
-                    st.success(f"Data sorted by: {sort_col}")
-                    st.rerun()
+                    if st.button("Sort Data"):
+                        apply_transformation({'op': 'sort', 'column': sort_col, 'ascending': sort_order == "Ascending"})
+                        st.rerun()
         
-        with tab3:
-            st.header("Download Your Data")
+            with tab3:
+                st.header("Download Your Data")
             
-            # Show smaller preview to reduce memory usage
-            st.write("Preview of current data (first 3 rows):")
-            st.dataframe(df.head(3))
+                # Show smaller preview to reduce memory usage
+                st.write("Preview of current data (first 3 rows):")
+                st.dataframe(preview(df, 3))
             
-            # Download options
-            file_format = st.radio("Select file format:", ["CSV", "Excel"])
-            filename = st.text_input("Enter filename (without extension):", "transformed_data")
+                # Download options
+                file_format = st.radio("Select file format:", list(EXPORT_FORMATS))
+                filename = st.text_input("Enter filename (without extension):", "transformed_data")
             
-            if filename:
-                download_filename = f"{filename}.{'csv' if file_format == 'CSV' else 'xlsx'}"
-                
-                if file_format == "CSV":
-                    get_csv_download_link(df, download_filename)
-                else:  # Excel
-                    get_excel_download_link(df, download_filename, st.session_state.transformation_history)
-else:
-    st.error("""
-    API key not found. Please set up your Google API key using one of these methods:
+                if filename:
+                    download_filename = f"{filename}.{EXPORT_FORMATS[file_format][0]}"
+                    create_download_button(df, download_filename, file_format, st.session_state.transformation_history)
+    else:
+        st.error("""
+        API key not found. Please set up your Google API key using one of these methods:
     
-    1. Create a `.env` file in the root directory with: `GOOGLE_API_KEY=your_api_key_here`
-    2. Set an environment variable: `GOOGLE_API_KEY=your_api_key_here`
-    3. Use Streamlit secrets management (recommended for deployment)
+        1. Create a `.env` file in the root directory with: `GOOGLE_API_KEY=your_api_key_here`
+        2. Set an environment variable: `GOOGLE_API_KEY=your_api_key_here`
+        3. Use Streamlit secrets management (recommended for deployment)
     
-    For more information on Streamlit secrets, visit: https://docs.streamlit.io/library/advanced-features/secrets-management
-    """)
+        For more information on Streamlit secrets, visit: https://docs.streamlit.io/library/advanced-features/secrets-management
+        """)
     
-    st.info("This application requires a Google API key to access Gemini AI for data analysis.")
+        st.info("This application requires a Google API key to access Gemini AI for data analysis.")
+
+    # Response cache effectiveness
+    cache_stats = get_response_cache().stats()
+    if cache_stats['requests']:
+        with st.sidebar.expander("Response cache"):
+            st.write(f"Hit rate: {cache_stats['hit_rate']:.0%} of {cache_stats['requests']} requests")
+            st.write(f"API calls: {cache_stats['misses']} · cached answers: {cache_stats['entries']}")
+            st.write(f"Waiting time saved: {cache_stats['seconds_saved']:.1f}s")
+except RerunException:
+    ending = 'rerun'
+    raise
+except StopException:
+    ending = 'stop'
+    raise
+finally:
+    # Runs however the rerun ends: at the bottom, st.rerun(), st.stop() or an error
+    finish_rerun(trace, metrics_log, profiler, fields, ending)
+
+show_diagnostics(trace)
 
 # Add footer
 st.sidebar.markdown("---")
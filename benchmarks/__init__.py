@@ -0,0 +1 @@
+"""Performance benchmarks for the app's hot paths; run with `python -m benchmarks`."""
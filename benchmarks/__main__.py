@@ -0,0 +1,148 @@
+"""Benchmark the app's hot paths on generated data and compare with a stored baseline.
+
+    python -m benchmarks                                  # 100K rows, all cases
+    python -m benchmarks --rows 10000000 --cases "load_*,transform_*"
+    python -m benchmarks --update-baseline                # record new baseline numbers
+
+Each case runs in a fresh process, so its peak RSS is its own. A case fails
+the run (exit code 1) when it is more than --threshold slower, or uses more
+than --memory-threshold more peak memory, than its baseline. Baselines only
+compare on the machine and data shape they were recorded with.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from benchmarks.cases import CASES, required_columns, run_case
+from benchmarks.data import DEFAULT_SHAPE, ensure_datasets, generate_frame
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def _arguments(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark load, profile, transforms and export.")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows of the generated CSV (default: 100000)")
+    parser.add_argument("--xlsx-rows", type=int, default=None, help="rows of the generated workbook, 0 to skip Excel (default: min(rows, 50000))")
+    parser.add_argument("--numeric", type=int, default=DEFAULT_SHAPE['numeric'], help="numeric columns")
+    parser.add_argument("--categorical", type=int, default=DEFAULT_SHAPE['categorical'], help="low-cardinality text columns")
+    parser.add_argument("--text", type=int, default=DEFAULT_SHAPE['text'], help="free-text columns")
+    parser.add_argument("--dates", type=int, default=DEFAULT_SHAPE['dates'], help="date columns")
+    parser.add_argument("--null-rate", type=float, default=DEFAULT_SHAPE['null_rate'], help="share of missing values per column")
+    parser.add_argument("--cardinality", type=int, default=DEFAULT_SHAPE['cardinality'], help="distinct values per categorical column")
+    parser.add_argument("--text-cardinality", type=int, default=DEFAULT_SHAPE['text_cardinality'], help="distinct values per text column (default: unique)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SHAPE['seed'], help="random seed of the generated data")
+    parser.add_argument("--cases", default="*", help="comma-separated case names or patterns, e.g. \"load_*,profile\"")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the fastest counts (default: 3)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "data-assistant-benchmarks"), help="where generated files are kept")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file (default: benchmarks/baseline.json)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, as a fraction (default: 0.25)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed peak RSS growth, as a fraction (default: 0.25)")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="slowdowns smaller than this are noise (default: 0.01)")
+    parser.add_argument("--output", default=None, help="also write the results to this JSON file")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    return parser.parse_args(argv)
+
+
+def _selected(patterns, columns):
+    patterns = [pattern.strip() for pattern in patterns.split(",") if pattern.strip()]
+    names = [name for name in CASES if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+    return [name for name in names if all(col in columns for col in required_columns(name))]
+
+
+def _load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+# A measurement against its baseline: 'ok', 'slower', 'more memory', or 'new' without one
+def compare(result, baseline, threshold, memory_threshold, min_seconds):
+    if baseline is None:
+        return 'new'
+    if (result['seconds'] > baseline['seconds'] * (1 + threshold)
+            and result['seconds'] - baseline['seconds'] > min_seconds):
+        return 'slower'
+    if (result['peak_rss_mb'] is not None and baseline.get('peak_rss_mb')
+            and result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + memory_threshold)):
+        return 'more memory'
+    return 'ok'
+
+
+def _line(name, status, result, baseline):
+    if result is None:
+        return f"  {status:<12}{name}"
+    line = f"  {status:<12}{name:<32}{result['seconds']:>9.3f}s"
+    if result['peak_rss_mb'] is not None:
+        line += f"  peak {result['peak_rss_mb']:>8,.0f} MB"
+    if baseline:
+        change = result['seconds'] / baseline['seconds'] - 1 if baseline['seconds'] else 0.0
+        line += f"  (baseline {baseline['seconds']:.3f}s, {change:+.0%})"
+    return line
+
+
+def main(argv=None):
+    args = _arguments(argv)
+    if args.list:
+        print("\n".join(CASES))
+        return 0
+
+    shape = {name: getattr(args, name) for name in DEFAULT_SHAPE}
+    xlsx_rows = min(args.rows, 50_000) if args.xlsx_rows is None else args.xlsx_rows
+    config = {'rows': args.rows, 'xlsx_rows': xlsx_rows, **shape}
+    columns = generate_frame(1, **shape).columns
+    names = [name for name in _selected(args.cases, columns) if xlsx_rows or 'xlsx' not in name and 'excel' not in name]
+    if not names:
+        print("No benchmark cases match --cases for this data shape.", file=sys.stderr)
+        return 2
+
+    stored = _load_baseline(args.baseline)
+    if stored is not None and stored['config'] != config:
+        if not args.update_baseline:
+            print(f"The baseline in {args.baseline} was recorded for different data ({stored['config']}); "
+                  "run with the same settings or --update-baseline.", file=sys.stderr)
+            return 2
+        stored = None
+    baselines = stored['results'] if stored else {}
+
+    print(f"Generating {args.rows:,} rows in {args.data_dir}...")
+    inputs = {**ensure_datasets(args.data_dir, args.rows, xlsx_rows, shape), 'xlsx_rows': xlsx_rows}
+
+    print(f"Running {len(names)} case(s), best of {args.repeat}:")
+    results, failed = {}, 0
+    for name in names:
+        # A fresh interpreter per case, so the peak RSS is this case's own
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            try:
+                result = pool.submit(run_case, name, inputs, args.repeat).result()
+            except Exception as e:
+                print(_line(name, 'failed', None, None) + f": {type(e).__name__}: {e}")
+                failed += 1
+                continue
+        results[name] = result
+        status = 'recorded' if args.update_baseline else compare(
+            result, baselines.get(name), args.threshold, args.memory_threshold, args.min_seconds
+        )
+        failed += status in ('slower', 'more memory')
+        print(_line(name, status, result, None if args.update_baseline else baselines.get(name)))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'config': config, 'results': results}, output, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as baseline:
+            json.dump({'config': config, 'results': {**baselines, **results}}, baseline, indent=2)
+            baseline.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    print(f"{len(results)} case(s) measured, {failed} failed or regressed.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
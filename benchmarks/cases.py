@@ -0,0 +1,147 @@
+"""The benchmarked hot paths: load, profile and prompt, every transformation, export.
+
+Each case is a `setup(inputs)` that prepares its input, untimed, and a
+`run(state)` that is timed. Settings follow the app's CONFIG defaults, so the
+numbers reflect what a session does. The model is the offline FakeBackend;
+only the app's own work around the call is measured.
+"""
+import os
+import tempfile
+import time
+
+from engine.export import export_dataframe
+from engine.expressions import referenced_columns
+from engine.llm import FakeBackend, ModelClient
+from engine.pipeline import load_table, peak_rss_mb, profile_table
+from engine.plan import execute
+from engine.prompt import build_context
+from engine.stats import ColumnStatsStore
+
+# Same values as the app's CONFIG
+LOAD_OPTIONS = {'chunk_rows': 250_000, 'memory_budget': None, 'category_max_ratio': 0.5}
+APPROX_PROFILE_MIN_ROWS = 5_000_000
+PROFILE_OPTIONS = {'sample_rows': 100_000, 'max_pair_columns': 250, 'top_k': 100}
+PROMPT_TOKEN_BUDGET = 8000
+PROMPT_TOP_CORRELATIONS = 20
+QUESTION = "Which factors most strongly predict num_0, and how does it differ by cat_0?"
+
+# One op per transformation in the Data Transformation tab, on the generated columns
+TRANSFORMS = {
+    'filter_isin': {'op': 'filter', 'kind': 'isin', 'column': 'cat_0', 'values': ['cat0_0', 'cat0_1', 'cat0_2']},
+    'filter_range': {'op': 'filter', 'kind': 'range', 'column': 'num_0', 'min': 400.0, 'max': 600.0},
+    'filter_notna': {'op': 'filter', 'kind': 'notna', 'columns': []},
+    'drop_columns': {'op': 'drop_columns', 'columns': ['text_0', 'num_2']},
+    'fillna_mean': {'op': 'fillna', 'column': 'num_0', 'method': 'mean', 'value': None},
+    'fillna_mode': {'op': 'fillna', 'column': 'cat_0', 'method': 'mode', 'value': None},
+    'derive_arithmetic': {'op': 'derive', 'kind': 'arithmetic', 'column': 'derived', 'source': 'num_0',
+                          'operator': 'Multiply', 'value': 1.2},
+    'derive_expression': {'op': 'derive', 'kind': 'expression', 'column': 'derived',
+                          'expression': 'num_0 * num_1 + log(num_3 + 1)'},
+    'derive_combine': {'op': 'derive', 'kind': 'combine', 'column': 'derived', 'columns': ['cat_0', 'text_0'],
+                       'separator': ' '},
+    'normalize': {'op': 'transform', 'column': 'num_0', 'method': 'normalize'},
+    'standardize': {'op': 'transform', 'column': 'num_0', 'method': 'standardize'},
+    'log': {'op': 'transform', 'column': 'num_1', 'method': 'log'},
+    'sqrt': {'op': 'transform', 'column': 'num_1', 'method': 'sqrt'},
+    'upper': {'op': 'transform', 'column': 'text_0', 'method': 'upper'},
+    'one_hot': {'op': 'one_hot', 'column': 'cat_1'},
+    'one_hot_top_k': {'op': 'one_hot', 'column': 'text_0', 'top_k': 20},
+    'astype_float': {'op': 'astype', 'column': 'num_1', 'dtype': 'float64'},
+    'astype_category': {'op': 'astype', 'column': 'text_1', 'dtype': 'category'},
+    'astype_datetime': {'op': 'astype', 'column': 'date_0', 'dtype': 'datetime'},
+    'sort': {'op': 'sort', 'column': 'num_0', 'ascending': False},
+}
+
+
+def _load(inputs):
+    return load_table(inputs['csv'], **LOAD_OPTIONS)[0]
+
+
+def _profile(df):
+    # As in the app: exact profiles keep incremental column statistics
+    stats = ColumnStatsStore(df, PROFILE_OPTIONS['max_pair_columns']) if len(df) < APPROX_PROFILE_MIN_ROWS else None
+    return profile_table(df, 5, stats, APPROX_PROFILE_MIN_ROWS, **PROFILE_OPTIONS)
+
+
+def _prepare_prompt(inputs):
+    return _profile(_load(inputs)), ModelClient(FakeBackend())
+
+
+def _ask(state):
+    profile, client = state
+    text, _ = build_context(profile, QUESTION, PROMPT_TOKEN_BUDGET, PROMPT_TOP_CORRELATIONS)
+    return client.generate(f"{text}\n\nUser question: {QUESTION}")
+
+
+def _transform(op):
+    return lambda df: execute(df, [op])
+
+
+# Write the data to a temporary file and remove it again; Excel gets `xlsx_rows` rows at most
+def _export(file_format, extension):
+    def run(state):
+        df, xlsx_rows = state
+        if file_format == 'Excel':
+            df = df.head(xlsx_rows)
+        handle, path = tempfile.mkstemp(suffix=f'.{extension}')
+        os.close(handle)
+        try:
+            export_dataframe(df, path, file_format)
+        finally:
+            os.remove(path)
+    return run
+
+
+def _prepare_export(inputs):
+    return _load(inputs), inputs['xlsx_rows']
+
+
+# Case name -> (setup(inputs) -> state, run(state)). `inputs` holds the
+# generated files ('csv', 'xlsx') and the row count of the workbook ('xlsx_rows').
+CASES = {
+    'load_csv': (lambda inputs: inputs['csv'], lambda path: load_table(path, **LOAD_OPTIONS)),
+    'load_xlsx': (lambda inputs: inputs['xlsx'], lambda path: load_table(path, **LOAD_OPTIONS)),
+    'profile': (_load, _profile),
+    'prompt': (_prepare_prompt, _ask),
+    **{f'transform_{name}': (_load, _transform(op)) for name, op in TRANSFORMS.items()},
+    'export_csv': (_prepare_export, _export('CSV', 'csv')),
+    'export_csv_gzip': (_prepare_export, _export('CSV (gzip)', 'csv.gz')),
+    'export_parquet': (_prepare_export, _export('Parquet', 'parquet')),
+    'export_excel': (_prepare_export, _export('Excel', 'xlsx')),
+}
+
+
+# Columns of the generated table a case needs
+def required_columns(name):
+    op = TRANSFORMS.get(name[len('transform_'):]) if name.startswith('transform_') else None
+    if op is None:
+        return []
+    if op['op'] == 'derive':
+        if op['kind'] == 'arithmetic':
+            return [op['source']]
+        return referenced_columns(op['expression']) if op['kind'] == 'expression' else op['columns']
+    return [op['column']] if 'column' in op else op['columns']
+
+
+# Start the peak RSS over from the current RSS; only Linux supports this
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+# Run one case in this process: set up, then time `repeat` runs.
+# Returns the fastest run's seconds and the peak RSS of the timed runs, which
+# includes the case's input; where the peak cannot be reset, setup counts too.
+def run_case(name, inputs, repeat=3):
+    setup, run = CASES[name]
+    state = setup(inputs)
+    _reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return {'seconds': round(min(times), 4), 'peak_rss_mb': round(peak_rss_mb(), 1)}
@@ -0,0 +1,95 @@
+"""Synthetic datasets for the benchmarks.
+
+Tables have numeric, categorical, free-text and date columns in the shape of
+the app's typical uploads (sales and transaction extracts). Width, null rate
+and cardinality are configurable, and generation is deterministic for a seed.
+CSV files are written in chunks, so 50M-row files never have to fit in memory.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from engine.export import EXCEL_MAX_ROWS
+
+GENERATE_CHUNK_ROWS = 1_000_000
+
+# Shape of the generated table; `text_cardinality` None means (nearly) unique text values
+DEFAULT_SHAPE = {
+    'numeric': 6,
+    'categorical': 3,
+    'text': 2,
+    'dates': 1,
+    'null_rate': 0.05,
+    'cardinality': 50,
+    'text_cardinality': None,
+    'seed': 0,
+}
+
+
+# Rows `start` to `start + rows` of the table; each chunk has its own seed,
+# so a file is the same however it is chunked
+def generate_frame(rows, start=0, numeric=6, categorical=3, text=2, dates=1, null_rate=0.05, cardinality=50,
+                   text_cardinality=None, seed=0):
+    rng = np.random.default_rng([seed, start])
+    columns = {}
+    for i in range(numeric):
+        # Alternate measurements (floats) and counts (integers)
+        if i % 2 == 0:
+            columns[f'num_{i}'] = np.round(rng.normal(500, 150, rows), 2)
+        else:
+            columns[f'num_{i}'] = rng.integers(0, 1000, rows)
+    for i in range(categorical):
+        labels = np.array([f'cat{i}_{k}' for k in range(cardinality)], dtype=object)
+        columns[f'cat_{i}'] = labels[rng.integers(0, cardinality, rows)]
+    for i in range(text):
+        ids = rng.integers(0, text_cardinality, rows) if text_cardinality else np.arange(start, start + rows)
+        columns[f'text_{i}'] = pd.Series(ids).astype(str).radd(f'T{i}-').to_numpy(dtype=object)
+    for i in range(dates):
+        days = np.datetime64('2020-01-01') + rng.integers(0, 5 * 365, rows).astype('timedelta64[D]')
+        columns[f'date_{i}'] = days.astype(str).astype(object)
+
+    df = pd.DataFrame(columns)
+    if null_rate:
+        for col in df.columns:
+            missing = rng.random(rows) < null_rate
+            if missing.any():
+                df[col] = df[col].mask(missing)
+    return df
+
+
+# Write a CSV of `rows` rows in chunks
+def write_csv(path, rows, **shape):
+    partial = f"{path}.partial"
+    for start in range(0, rows, GENERATE_CHUNK_ROWS):
+        chunk = generate_frame(min(GENERATE_CHUNK_ROWS, rows - start), start, **shape)
+        chunk.to_csv(partial, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    os.replace(partial, path)
+
+
+# Write an .xlsx workbook with one sheet of `rows` rows (Excel caps sheets at ~1M rows)
+def write_xlsx(path, rows, **shape):
+    if rows > EXCEL_MAX_ROWS:
+        raise ValueError(f"Excel sheets hold at most {EXCEL_MAX_ROWS:,} rows")
+    partial = f"{os.path.splitext(path)[0]}.partial.xlsx"
+    with pd.ExcelWriter(partial, engine='xlsxwriter') as writer:
+        generate_frame(rows, **shape).to_excel(writer, index=False)
+    os.replace(partial, path)
+
+
+# Paths of the benchmark's CSV and XLSX files in `data_dir`, generated on first use.
+# File names carry a hash of the shape, so changing any setting makes new files.
+def ensure_datasets(data_dir, rows, xlsx_rows, shape):
+    os.makedirs(data_dir, exist_ok=True)
+    tag = hashlib.sha256(json.dumps(shape, sort_keys=True).encode()).hexdigest()[:12]
+    paths = {
+        'csv': os.path.join(data_dir, f'bench-{rows}-{tag}.csv'),
+        'xlsx': os.path.join(data_dir, f'bench-{xlsx_rows}-{tag}.xlsx'),
+    }
+    if not os.path.exists(paths['csv']):
+        write_csv(paths['csv'], rows, **shape)
+    if xlsx_rows and not os.path.exists(paths['xlsx']):
+        write_xlsx(paths['xlsx'], xlsx_rows, **shape)
+    return paths
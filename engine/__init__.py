@@ -0,0 +1 @@
+"""Data handling helpers used by the Data Analysis Assistant app."""
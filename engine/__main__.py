@@ -0,0 +1,69 @@
+"""Run a recorded recipe over many CSV/Excel files without the app.
+
+    python -m engine pipeline.json "regions/*.csv" --output-dir cleaned --workers 8 --memory-limit-mb 2048
+
+The recipe is the JSON file from "Download pipeline" in the Transform tab.
+Each input is loaded, transformed and written to the output directory under
+its own name; a per-file summary of rows and timings is printed and written
+to summary.csv (or --summary).
+"""
+import argparse
+import os
+import sys
+import time
+
+from engine.export import EXPORT_FORMATS
+from engine.pipeline import expand_inputs, run_files, write_summary
+from engine.plan import loads
+
+
+def _arguments(argv):
+    parser = argparse.ArgumentParser(prog="python -m engine", description="Apply a saved transformation recipe to many files.")
+    parser.add_argument("recipe", help="pipeline JSON saved from the app")
+    parser.add_argument("inputs", nargs="+", help="CSV/XLSX files or glob patterns (quote patterns, e.g. \"data/*.csv\")")
+    parser.add_argument("--output-dir", default="output", help="directory for the transformed files (default: output)")
+    parser.add_argument("--format", default="CSV", choices=list(EXPORT_FORMATS), help="output format (default: CSV)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--memory-limit-mb", type=int, default=None, help="memory cap per worker process")
+    parser.add_argument("--chunk-rows", type=int, default=250_000, help="rows read at a time from CSV files")
+    parser.add_argument("--sheets", default=None, help="Excel sheets to load, comma-separated, or * for all (default: the first)")
+    parser.add_argument("--excel-cache-dir", default=None, help="cache parsed Excel sheets as Parquet in this directory")
+    parser.add_argument("--summary", default=None, help="summary file, .csv or .json (default: OUTPUT_DIR/summary.csv)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _arguments(argv)
+    with open(args.recipe, "rb") as recipe:
+        ops = loads(recipe.read())
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("No CSV or XLSX files match the inputs.", file=sys.stderr)
+        return 2
+
+    print(f"Applying {len(ops)} step(s) to {len(paths)} file(s)...")
+    start = time.perf_counter()
+    results = []
+    sheets = args.sheets if args.sheets in (None, "*") else [sheet.strip() for sheet in args.sheets.split(",")]
+    load_options = {
+        'chunk_rows': args.chunk_rows,
+        'excel_options': {'sheets': sheets, 'cache_dir': args.excel_cache_dir}
+    }
+    for result in run_files(paths, ops, args.output_dir, args.format, args.workers, args.memory_limit_mb, load_options):
+        results.append(result)
+        if result['status'] == 'ok':
+            print(f"  ok      {result['input']}: {result['rows_in']:,} -> {result['rows_out']:,} rows "
+                  f"in {result['seconds']:.2f}s")
+        else:
+            print(f"  failed  {result['input']}: {result['error']}")
+
+    summary_path = args.summary or os.path.join(args.output_dir, "summary.csv")
+    summary = write_summary(sorted(results, key=lambda result: paths.index(result['input'])), summary_path)
+    failed = int((summary['status'] != 'ok').sum())
+    print(f"Done in {time.perf_counter() - start:.1f}s: {len(results) - failed} succeeded, {failed} failed. "
+          f"Summary: {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
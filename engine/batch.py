@@ -0,0 +1,77 @@
+"""Batch question mode: many questions about one dataset, answered concurrently."""
+import datetime
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+# Leading list markers such as "1.", "2)", "-" or "*"
+LIST_MARKER = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+")
+
+
+# One question per line; list markers, blank lines and repeated questions are dropped
+def parse_questions(text):
+    questions = []
+    for line in text.splitlines():
+        question = LIST_MARKER.sub("", line).strip()
+        if question and question not in questions:
+            questions.append(question)
+    return questions
+
+
+# Questions from an uploaded .txt (one per line) or .csv (first column) file
+def read_questions_file(file):
+    if file.name.endswith(".csv"):
+        column = pd.read_csv(file).iloc[:, 0].dropna().astype(str)
+        return parse_questions("\n".join(column))
+    return parse_questions(file.getvalue().decode("utf-8"))
+
+
+# Answer questions on a thread pool and yield each result as soon as it is done.
+# `ask(question)` returns (answer, origin); failures are reported per question.
+def run_batch(questions, ask, max_workers=4):
+    def answer(index, question):
+        start = time.perf_counter()
+        result = {'index': index, 'question': question, 'answer': None, 'origin': None, 'error': None}
+        try:
+            result['answer'], result['origin'] = ask(question)
+        except Exception as e:
+            result['error'] = str(e)
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-question")
+    try:
+        futures = [pool.submit(answer, i, question) for i, question in enumerate(questions)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Questions not started yet are cancelled when the caller stops early
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _report_header(metadata):
+    return {
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        **metadata
+    }
+
+
+# All results in question order as one markdown document
+def report_markdown(results, metadata):
+    header = _report_header(metadata)
+    lines = ["# Data Analysis Report", ""]
+    lines += [f"- **{name.replace('_', ' ').capitalize()}:** {value}" for name, value in header.items()]
+    for result in sorted(results, key=lambda r: r['index']):
+        lines += ["", f"## {result['index'] + 1}. {result['question']}", ""]
+        lines.append(f"> Error: {result['error']}" if result['error'] else result['answer'])
+    return "\n".join(lines) + "\n"
+
+
+def report_json(results, metadata):
+    return json.dumps({
+        **_report_header(metadata),
+        'results': sorted(results, key=lambda r: r['index'])
+    }, indent=2)
@@ -0,0 +1,150 @@
+"""On-disk session checkpoints, so a session survives a server restart or timeout.
+
+Each checkpoint is the session's transformation plan (engine.plan JSON) plus
+Arrow IPC files: the original dataset, written once and shared by every
+session working on it, and the session's current version. Resuming
+memory-maps those files back instead of parsing the upload again; earlier
+versions are rebuilt from the plan when the user undoes. The same files
+let a session that released its data to save memory (engine.store) map its
+current version back instead of recomputing it.
+
+    directory/
+        datasets/<dataset id>.arrow
+        sessions/<token>/session.json
+        sessions/<token>/current.arrow
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from engine.plan import dumps, loads
+from engine.store import map_ipc, write_ipc
+
+# Session tokens are generated hex strings; anything else is never used as a path
+TOKEN_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def dataset_id(key):
+    return hashlib.sha256(json.dumps(list(key), default=list).encode()).hexdigest()[:32]
+
+
+def _write_json(path, data):
+    partial = f"{path}.{threading.get_ident()}.partial"
+    with open(partial, 'w', encoding='utf-8') as out:
+        json.dump(data, out, default=str)
+    os.replace(partial, path)
+
+
+class SessionCheckpoints:
+    """Checkpoints of in-memory sessions under one directory, kept for `ttl_seconds`."""
+
+    def __init__(self, directory, ttl_seconds=7 * 24 * 3600):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.join(directory, 'datasets'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'sessions'), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _session_dir(self, token):
+        if not TOKEN_PATTERN.fullmatch(token or ''):
+            raise ValueError("Invalid session token")
+        return os.path.join(self.directory, 'sessions', token)
+
+    def _dataset_path(self, key):
+        return os.path.join(self.directory, 'datasets', f"{dataset_id(key)}.arrow")
+
+    # Checkpoint a session: its dataset (written only the first time), the
+    # ops of its current version, the undo step boundaries within those ops,
+    # and the current version's frame. `metadata` is stored as given.
+    # Frames Arrow cannot store (e.g. columns mixing text and numbers) are
+    # skipped; the session is then resumed by re-running the plan.
+    def save(self, token, key, original, ops, steps, frame=None, metadata=None):
+        session_dir = self._session_dir(token)
+        os.makedirs(session_dir, exist_ok=True)
+        dataset = self._dataset_path(key)
+        with self._lock:
+            if not os.path.exists(dataset):
+                write_ipc(original, dataset)
+
+        current = os.path.join(session_dir, 'current.arrow')
+        saved_frame = False
+        if ops and frame is not None:
+            try:
+                write_ipc(frame, current, index=True)
+                saved_frame = True
+            except Exception:
+                saved_frame = False
+        if not saved_frame and os.path.exists(current):
+            os.remove(current)
+
+        _write_json(os.path.join(session_dir, 'session.json'), {
+            'dataset_key': list(key),
+            'plan': json.loads(dumps(ops)),
+            'steps': list(steps),
+            'frame_plan': dumps(ops) if saved_frame else None,
+            'saved_at': time.time(),
+            'metadata': metadata or {},
+        })
+
+    # The checkpoint of a session, or None if there is none (or it expired):
+    # {'dataset_key', 'ops', 'steps', 'saved_at', 'metadata'}
+    def load(self, token):
+        try:
+            path = os.path.join(self._session_dir(token), 'session.json')
+            with open(path, encoding='utf-8') as saved:
+                data = json.load(saved)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data['saved_at'] > self.ttl_seconds or not os.path.exists(self._dataset_path(data['dataset_key'])):
+            return None
+        return {
+            'dataset_key': tuple(tuple(part) if isinstance(part, list) else part for part in data['dataset_key']),
+            'ops': loads(json.dumps(data['plan'])),
+            'steps': data['steps'],
+            'saved_at': data['saved_at'],
+            'metadata': data['metadata'],
+        }
+
+    # The checkpointed original dataset, memory-mapped
+    def original(self, key):
+        return map_ipc(self._dataset_path(key))[0]
+
+    # The checkpointed frame of a session's current version if it was saved
+    # for exactly these `ops`, memory-mapped; None otherwise
+    def frame(self, token, ops):
+        session_dir = self._session_dir(token)
+        try:
+            with open(os.path.join(session_dir, 'session.json'), encoding='utf-8') as saved:
+                frame_plan = json.load(saved).get('frame_plan')
+            if frame_plan is None or frame_plan != dumps(ops):
+                return None
+            return map_ipc(os.path.join(session_dir, 'current.arrow'))[0]
+        except (OSError, ValueError):
+            return None
+
+    # Remove expired sessions, then datasets no remaining session uses
+    def prune(self):
+        sessions = os.path.join(self.directory, 'sessions')
+        used = set()
+        for token in os.listdir(sessions):
+            path = os.path.join(sessions, token, 'session.json')
+            try:
+                with open(path, encoding='utf-8') as saved:
+                    data = json.load(saved)
+                if time.time() - data['saved_at'] <= self.ttl_seconds:
+                    used.add(dataset_id(data['dataset_key']))
+                    continue
+            except (OSError, ValueError, KeyError):
+                if os.path.exists(path) or time.time() - os.stat(os.path.join(sessions, token)).st_mtime <= 3600:
+                    continue
+            shutil.rmtree(os.path.join(sessions, token), ignore_errors=True)
+
+        datasets = os.path.join(self.directory, 'datasets')
+        with self._lock:
+            for name in os.listdir(datasets):
+                if name.endswith('.arrow') and name[:-len('.arrow')] not in used:
+                    os.remove(os.path.join(datasets, name))
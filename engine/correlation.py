@@ -0,0 +1,160 @@
+"""Blocked top-k Pearson correlations for wide numeric data.
+
+Columns are standardized once into a contiguous float32 array and correlated
+block by block with matrix products, so the full p×p matrix is never held in
+memory; only the strongest pairs are kept. Missing values are handled with
+pairwise-complete masks, like DataFrame.corr().
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+# Columns per block; a block pair needs a few block_size × block_size products
+BLOCK_COLUMNS = 256
+
+
+# Standardize each column over its non-missing values into a column-major
+# float32 array (missing values become 0). Returns the values, the float32
+# presence mask (None when nothing is missing) and which columns vary at all.
+def standardize(df, columns):
+    n, p = len(df), len(columns)
+    values = np.zeros((n, p), dtype='float32', order='F')
+    mask = None
+    varies = np.zeros(p, dtype=bool)
+
+    for j, col in enumerate(columns):
+        column = df[col].to_numpy(dtype='float64', na_value=np.nan)
+        present = ~np.isnan(column)
+        if not present.all():
+            if mask is None:
+                mask = np.ones((n, p), dtype='float32', order='F')
+            mask[:, j] = present
+        if not present.any():
+            continue
+        mean = column[present].mean()
+        std = column[present].std()
+        if std > 0:
+            values[present, j] = (column[present] - mean) / std
+            varies[j] = True
+    return values, mask, varies
+
+
+# Correlations of block x against block y (column ranges of the standardized array)
+def _block_correlations(values, mask, x, y):
+    a, b = values[:, x[0]:x[1]], values[:, y[0]:y[1]]
+    if mask is None:
+        n = len(values)
+        return (a.T @ b).astype('float64') / n, np.full((x[1] - x[0], y[1] - y[0]), n, dtype='int64')
+
+    ma, mb = mask[:, x[0]:x[1]], mask[:, y[0]:y[1]]
+    count = (ma.T @ mb).astype('float64')
+    sx, sy = (a.T @ mb).astype('float64'), (ma.T @ b).astype('float64')
+    sxx, syy = ((a * a).T @ mb).astype('float64'), (ma.T @ (b * b)).astype('float64')
+    sxy = (a.T @ b).astype('float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = (count * sxy - sx * sy) / np.sqrt((count * sxx - sx * sx) * (count * syy - sy * sy))
+    corr[count < 2] = np.nan
+    return corr, count.round().astype('int64')
+
+
+# Keep the k strongest of the candidate pairs (all of them when k is None)
+def _keep_strongest(candidates, k):
+    left, right, corr, count = candidates
+    if k is not None and len(corr) > k:
+        keep = np.argpartition(-np.abs(corr), k - 1)[:k]
+        left, right, corr, count = left[keep], right[keep], corr[keep], count[keep]
+    return left, right, corr, count
+
+
+def _merge(candidates, extra, k):
+    return _keep_strongest(tuple(np.concatenate([c, e]) for c, e in zip(candidates, extra)), k)
+
+
+def _empty():
+    return (np.empty(0, dtype='int64'), np.empty(0, dtype='int64'), np.empty(0), np.empty(0, dtype='int64'))
+
+
+def _blocks(p, block_size):
+    return [(start, min(start + block_size, p)) for start in range(0, p, block_size)]
+
+
+# Strongest pairs of block row x against every block y at or after it
+def _scan_row(values, mask, varies, x, blocks, k, threshold):
+    found = _empty()
+    for y in blocks:
+        if y[0] < x[0]:
+            continue
+        corr, count = _block_correlations(values, mask, x, y)
+        rows, cols = np.indices(corr.shape)
+        left, right = rows.ravel() + x[0], cols.ravel() + y[0]
+        corr, count = np.clip(corr.ravel(), -1.0, 1.0), count.ravel()
+        keep = (left < right) & varies[left] & varies[right] & ~np.isnan(corr)
+        if threshold is not None:
+            keep &= np.abs(corr) >= threshold
+        found = _merge(found, (left[keep], right[keep], corr[keep], count[keep]), k)
+    return found
+
+
+# Worker-side views of the standardized data, attached once per process
+_shared = {}
+
+
+def _attach(names, shape, has_mask, varies):
+    _shared['memory'] = [shared_memory.SharedMemory(name=name) for name in names]
+    _shared['values'] = np.ndarray(shape, dtype='float32', buffer=_shared['memory'][0].buf, order='F')
+    _shared['mask'] = np.ndarray(shape, dtype='float32', buffer=_shared['memory'][1].buf, order='F') if has_mask else None
+    _shared['varies'] = varies
+
+
+def _scan_shared(x, blocks, k, threshold):
+    return _scan_row(_shared['values'], _shared['mask'], _shared['varies'], x, blocks, k, threshold)
+
+
+def _share(array):
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf, order='F')[...] = array
+    return memory
+
+
+# Block rows split across worker processes; the data is shared, not copied per task
+def _scan_parallel(values, mask, varies, blocks, k, threshold, workers):
+    memory = [_share(values)] + ([_share(mask)] if mask is not None else [])
+    names = [block.name for block in memory]
+    found = _empty()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=_attach,
+                                 initargs=(names, values.shape, mask is not None, varies)) as pool:
+            tasks = len(blocks)
+            for result in pool.map(_scan_shared, blocks, [blocks] * tasks, [k] * tasks, [threshold] * tasks):
+                found = _merge(found, result, k)
+    finally:
+        for block in memory:
+            block.close()
+            block.unlink()
+    return found
+
+
+# The strongest Pearson correlations between numeric columns of `df`, as
+# (column a, column b, r, pairwise-complete rows) sorted by |r|. Keeps the top
+# `k` pairs, only pairs with |r| >= `threshold`, or both. With `workers` > 1
+# the block rows are spread over that many processes.
+def strongest_correlations(df, columns=None, k=100, threshold=None, block_size=BLOCK_COLUMNS, workers=1):
+    columns = df.columns.tolist() if columns is None else list(columns)
+    if len(columns) < 2:
+        return []
+    values, mask, varies = standardize(df, columns)
+    blocks = _blocks(len(columns), block_size)
+    workers = min(workers or os.cpu_count() or 1, len(blocks))
+
+    if workers > 1:
+        left, right, corr, count = _scan_parallel(values, mask, varies, blocks, k, threshold, workers)
+    else:
+        found = _empty()
+        for x in blocks:
+            found = _merge(found, _scan_row(values, mask, varies, x, blocks, k, threshold), k)
+        left, right, corr, count = found
+
+    order = np.lexsort((right, left, -np.abs(corr)))
+    return [(columns[left[i]], columns[right[i]], float(corr[i]), int(count[i])) for i in order]
@@ -0,0 +1,236 @@
+"""Timing spans, memory accounting and a sampling profiler for app reruns.
+
+Each rerun of the script gets a RerunTrace. Its phases (load, transform,
+profile, prompt, model, export) are wrapped in spans, which record wall time
+and the change in resident memory. The finished trace is shown in the
+sidebar and can be appended to a JSONL log, or added to the totals in an
+OpenMetrics text file, which a Prometheus textfile collector can scrape.
+SamplingProfiler samples the stacks of one thread while it runs, so a single
+slow rerun can be captured without instrumenting anything else.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import pandas as pd
+
+from engine.ingest import current_rss
+
+
+class RerunTrace:
+    """Spans of one script rerun, in the order they started."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self.seconds = None
+        self.rss_bytes = current_rss()
+        self._depth = 0
+
+    # Time the block and record how much resident memory it added (or freed).
+    # Spans nest; `depth` tells a span inside another one apart.
+    @contextmanager
+    def span(self, name):
+        record = {'name': name, 'depth': self._depth, 'seconds': None, 'rss_delta_bytes': None}
+        self.spans.append(record)
+        rss = current_rss()
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield record
+        finally:
+            self._depth -= 1
+            record['seconds'] = time.perf_counter() - start
+            after = current_rss()
+            if rss is not None and after is not None:
+                record['rss_delta_bytes'] = after - rss
+
+    # Close the trace; the rerun's own time not covered by any span is 'other'
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start
+        self.rss_bytes = current_rss()
+        return self
+
+    # Seconds per phase name, top-level spans only, plus the uncovered rest
+    def phase_seconds(self):
+        phases = Counter()
+        for span in self.spans:
+            if span['depth'] == 0 and span['seconds'] is not None:
+                phases[span['name']] += span['seconds']
+        if self.seconds is not None:
+            phases['other'] = max(self.seconds - sum(phases.values()), 0.0)
+        return dict(phases)
+
+    def to_dict(self, **fields):
+        return {
+            'time': self.started,
+            'seconds': self.seconds,
+            'rss_bytes': self.rss_bytes,
+            'spans': self.spans,
+            **fields,
+        }
+
+
+# Memory per column of a DataFrame, largest first: column, dtype, bytes, share of the total
+def column_memory(df):
+    usage = df.memory_usage(deep=True, index=False)
+    table = pd.DataFrame({
+        'column': [str(col) for col in df.columns],
+        'dtype': [str(dtype) for dtype in df.dtypes],
+        'bytes': usage.to_numpy(),
+    })
+    total = table['bytes'].sum()
+    table['share'] = table['bytes'] / total if total else 0.0
+    return table.sort_values('bytes', ascending=False, ignore_index=True)
+
+
+# Escape a label value for the OpenMetrics text format
+def _metric_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsLog:
+    """Process-wide sink for finished rerun traces.
+
+    With `jsonl_path`, each trace is appended as one JSON line. With
+    `openmetrics_path`, running totals per phase (seconds and count), the
+    number of reruns and the latest resident memory are rewritten to that
+    file in the OpenMetrics text format after every rerun.
+    """
+
+    def __init__(self, jsonl_path=None, openmetrics_path=None, prefix='data_assistant'):
+        self.jsonl_path = jsonl_path
+        self.openmetrics_path = openmetrics_path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._reruns = 0
+        self._phase_seconds = Counter()
+        self._phase_count = Counter()
+        self._rss_bytes = None
+
+    @property
+    def enabled(self):
+        return bool(self.jsonl_path or self.openmetrics_path)
+
+    def record(self, trace, **fields):
+        with self._lock:
+            self._reruns += 1
+            for name, seconds in trace.phase_seconds().items():
+                self._phase_seconds[name] += seconds
+                self._phase_count[name] += 1
+            if trace.rss_bytes is not None:
+                self._rss_bytes = trace.rss_bytes
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as log:
+                    log.write(json.dumps(trace.to_dict(**fields), default=str) + "\n")
+            if self.openmetrics_path:
+                self._write_openmetrics()
+
+    def openmetrics(self):
+        prefix = self.prefix
+        lines = [
+            f"# TYPE {prefix}_reruns counter",
+            f"# HELP {prefix}_reruns Script reruns traced.",
+            f"{prefix}_reruns_total {self._reruns}",
+            f"# TYPE {prefix}_phase_seconds counter",
+            f"# UNIT {prefix}_phase_seconds seconds",
+            f"# HELP {prefix}_phase_seconds Time spent per rerun phase.",
+        ]
+        lines += [f'{prefix}_phase_seconds_total{{phase="{_metric_label(name)}"}} {seconds:.6f}'
+                  for name, seconds in sorted(self._phase_seconds.items())]
+        lines += [
+            f"# TYPE {prefix}_phase_runs counter",
+            f"# HELP {prefix}_phase_runs Reruns that went through each phase.",
+        ]
+        lines += [f'{prefix}_phase_runs_total{{phase="{_metric_label(name)}"}} {count}'
+                  for name, count in sorted(self._phase_count.items())]
+        if self._rss_bytes is not None:
+            lines += [
+                f"# TYPE {prefix}_resident_memory_bytes gauge",
+                f"# UNIT {prefix}_resident_memory_bytes bytes",
+                f"# HELP {prefix}_resident_memory_bytes Resident memory of the server after the latest rerun.",
+                f"{prefix}_resident_memory_bytes {self._rss_bytes}",
+            ]
+        return "\n".join(lines + ["# EOF"]) + "\n"
+
+    # Written whole and then renamed, so a scraper never reads half a file
+    def _write_openmetrics(self):
+        partial = f"{self.openmetrics_path}.partial"
+        with open(partial, 'w', encoding='utf-8') as out:
+            out.write(self.openmetrics())
+        os.replace(partial, self.openmetrics_path)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread every `interval` seconds.
+
+    Runs on a background thread, so the profiled code is not changed and
+    costs little extra while it runs. The result is a count per distinct stack.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.seconds = time.perf_counter() - self._started
+        return self
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    # Stacks in the "collapsed" format flame graph tools read: frames joined by ';', then the count
+    def collapsed(self):
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    # The functions that were running most often: name, samples where it was
+    # running (self), samples where it was anywhere on the stack (total), and
+    # their shares of all samples
+    def top(self, n=15):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        samples = self.samples or 1
+        return pd.DataFrame(
+            [(name, own[name], total[name], own[name] / samples, total[name] / samples)
+             for name in sorted(total, key=lambda name: (own[name], total[name]), reverse=True)[:n]],
+            columns=['function', 'self', 'total', 'self_share', 'total_share']
+        )
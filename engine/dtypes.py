@@ -0,0 +1,284 @@
+"""Column type inference and chunked, vectorized type conversion.
+
+infer_column looks at a sample of a column and proposes the most compact
+dtype its values fit: a datetime with an explicit format, the narrowest
+integer, float32, boolean, category or string. Datetime formats are detected
+once per distinct sample and cached, so parsing never falls back to guessing
+the format of every value. convert runs a conversion chunk by chunk and
+stops at the first chunk with values that cannot be converted, reporting
+how many failed there and in which rows, instead of failing after a full pass.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from engine.ingest import STRING_DTYPE, fits_float32
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# Rows converted at a time; a conversion stops at the first chunk with failures
+CONVERT_CHUNK_ROWS = 1_000_000
+
+# Distinct values a datetime format is detected from, spread over their sorted order
+FORMAT_SAMPLE_VALUES = 500
+
+# Explicit formats tried in order; month-first before day-first, as pandas does by default
+DATETIME_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f',
+    '%Y/%m/%d', '%Y/%m/%d %H:%M:%S',
+    '%m/%d/%Y', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+    '%m-%d-%Y', '%d-%m-%Y', '%d.%m.%Y', '%d.%m.%Y %H:%M',
+    '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%B %d, %Y', '%d-%b-%Y', '%d-%b-%y',
+    'ISO8601',
+]
+
+# Text values read as booleans (compared lower-cased)
+BOOL_VALUES = {'true': True, 'false': False, 'yes': True, 'no': False, 'y': True, 'n': False, 't': True, 'f': False}
+
+INTEGER_DTYPES = ['int8', 'int16', 'int32', 'int64']
+
+
+# Raised for values of a column that cannot be converted; keeps their first row labels and values
+class ConversionError(ValueError):
+    def __init__(self, column, dtype, failed, partial=False):
+        self.column = column
+        self.dtype = dtype
+        self.rows = failed.index[:20].tolist()
+        self.values = failed.head(5).tolist()
+        count = f"At least {len(failed):,}" if partial else f"{len(failed):,}"
+        rows = ", ".join(str(row) for row in self.rows[:5])
+        examples = ", ".join(repr(value) for value in self.values)
+        super().__init__(f"{count} values in {column} cannot be converted to {dtype} "
+                         f"(first at rows {rows}; e.g. {examples})")
+
+
+@lru_cache(maxsize=1024)
+def _detect_format(values):
+    sample = pd.Series(values, dtype=object)
+    for fmt in DATETIME_FORMATS:
+        try:
+            parsed = pd.to_datetime(sample, format=fmt, errors='coerce')
+        except (ValueError, TypeError):
+            continue
+        if parsed.notna().all():
+            return fmt
+    return None
+
+
+# The explicit format every one of `values` (strings) parses with, or None.
+# Results are cached by the distinct values sampled, so the formats of a
+# column are detected once however often it is checked or converted.
+def detect_datetime_format(values):
+    distinct = np.sort(pd.Series(values).dropna().astype(str).str.strip().unique().astype(object))
+    if len(distinct) == 0:
+        return None
+    step = -(-len(distinct) // FORMAT_SAMPLE_VALUES)
+    return _detect_format(tuple(distinct[::step]))
+
+
+# The narrowest integer dtype holding `low`..`high`; nullable ("Int16") when `nullable`
+def smallest_integer(low, high, nullable=False):
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype.capitalize() if nullable else dtype
+    return None
+
+
+def is_integer_dtype_name(dtype):
+    return str(dtype).lower() in INTEGER_DTYPES
+
+
+def _sample(series, sample_rows, seed=0):
+    return series.sample(sample_rows, random_state=seed) if len(series) > sample_rows else series
+
+
+def _is_text(series):
+    return not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)
+                or pd.api.types.is_datetime64_any_dtype(series))
+
+
+# Proposed dtype for a column from a sample of its values, or None when its
+# current dtype is already the best fit: {'dtype', 'format', 'current'}.
+# A proposal is only made when every sampled value converts.
+def infer_column(series, sample_rows=10_000, category_max_ratio=0.5):
+    current = str(series.dtype)
+    non_null = _sample(series, sample_rows).dropna()
+    if non_null.empty or pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return None
+    nullable = bool(series.isna().any())
+
+    dtype, fmt = None, None
+    if pd.api.types.is_integer_dtype(series):
+        dtype = smallest_integer(series.min(), series.max(), nullable=current[0].isupper())
+    elif pd.api.types.is_float_dtype(series):
+        values = non_null.to_numpy(dtype='float64')
+        if np.array_equal(values, np.round(values)):
+            dtype = smallest_integer(series.min(), series.max(), nullable)
+        if dtype is None and current != 'float32':
+            dtype = 'float32' if fits_float32(values) else 'float64'
+    else:
+        text = non_null.astype(str).str.strip()
+        numbers = pd.to_numeric(text, errors='coerce')
+        if text.str.lower().isin(BOOL_VALUES).all():
+            dtype = 'boolean' if nullable else 'bool'
+        elif numbers.notna().all():
+            values = numbers.to_numpy(dtype='float64')
+            if pd.api.types.is_integer_dtype(numbers) or np.array_equal(values, np.round(values)):
+                # Bounds from the sample; values outside them fail the conversion and are reported.
+                # Whole numbers too large for int64 stay text rather than being rounded to floats.
+                dtype = smallest_integer(numbers.min(), numbers.max(), nullable)
+                if dtype is None:
+                    return None
+            else:
+                dtype = 'float32' if fits_float32(values) else 'float64'
+        else:
+            fmt = detect_datetime_format(text)
+            if fmt is not None:
+                dtype = 'datetime'
+            elif text.nunique() / len(text) <= category_max_ratio:
+                dtype = 'category'
+            else:
+                dtype = STRING_DTYPE
+
+    if dtype is None or dtype == current or (dtype == STRING_DTYPE and current in ('str', 'string')):
+        return None
+    return {'dtype': dtype, 'format': fmt, 'current': current}
+
+
+# Proposals for every column whose dtype can be improved: {column: proposal}
+def infer_dtypes(df, sample_rows=10_000, category_max_ratio=0.5):
+    proposals = {}
+    for col in df.columns:
+        proposal = infer_column(df[col], sample_rows, category_max_ratio)
+        if proposal is not None:
+            proposals[col] = proposal
+    return proposals
+
+
+# astype ops for the text columns whose sampled values are all dates,
+# booleans or numbers, e.g. to apply right after a file is loaded
+def inferred_astype_ops(df, sample_rows=10_000, category_max_ratio=0.5):
+    ops = []
+    for col in df.columns:
+        if not _is_text(df[col]):
+            continue
+        proposal = infer_column(df[col], sample_rows, category_max_ratio)
+        if proposal is not None and proposal['dtype'] not in ('category', STRING_DTYPE):
+            op = {'op': 'astype', 'column': col, 'dtype': proposal['dtype']}
+            if proposal['format']:
+                op['format'] = proposal['format']
+            ops.append(op)
+    return ops
+
+
+# Parse text with an explicit format. Arrow's strptime is much faster than
+# pandas' but knows neither fractional seconds nor pandas' ISO 8601 mode.
+def _parse_datetimes(chunk, fmt):
+    if pc is not None and fmt and fmt != 'ISO8601' and '%f' not in fmt:
+        text = pa.array(chunk.astype('string[pyarrow]'))
+        parsed = pc.strptime(text, format=fmt, unit='us', error_is_null=True)
+        return pd.Series(parsed.to_numpy(zero_copy_only=False), index=chunk.index)
+    # Without a detected format each value is parsed on its own
+    return pd.to_datetime(chunk.where(chunk.notna()), format=fmt or 'mixed', errors='coerce')
+
+
+def _numbers(chunk):
+    if pd.api.types.is_numeric_dtype(chunk) or pd.api.types.is_bool_dtype(chunk):
+        return chunk.astype('float64')
+    return pd.to_numeric(chunk.astype(str).str.strip().where(chunk.notna()), errors='coerce')
+
+
+# Exact integers of a numeric series as int64 values and a mask of those that
+# fit the `info` range. Integer sources are compared as integers; only floats
+# are checked for being whole, so nothing above 2**53 is rounded through float64.
+def _exact_integers(numbers, info):
+    present = numbers.notna().to_numpy()
+    if pd.api.types.is_float_dtype(numbers):
+        floats = numbers.to_numpy(dtype='float64', na_value=np.nan)
+        with np.errstate(invalid='ignore'):
+            valid = present & (floats % 1 == 0) & (floats >= info.min) & (floats < info.max + 1)
+        return np.where(valid, floats, 0).astype('int64'), valid
+    kind = 'uint64' if pd.api.types.is_unsigned_integer_dtype(numbers) else 'int64'
+    values = numbers.to_numpy(dtype=kind, na_value=0)
+    valid = present & (values >= info.min) & (values <= info.max)
+    return np.where(valid, values, 0).astype('int64'), valid
+
+
+# Integer conversion of a chunk to the nullable `dtype` ("Int16"), missing where it fails.
+# Whole-number text is parsed as integers, any other text as floats.
+def _to_integers(chunk, dtype):
+    info = np.iinfo(dtype.lower())
+    if _is_text(chunk):
+        text = chunk.astype(str).str.strip().where(chunk.notna())
+        whole = text.str.fullmatch(r'[+-]?\d+').fillna(False).to_numpy(dtype=bool)
+        values = np.zeros(len(chunk), dtype='int64')
+        valid = np.zeros(len(chunk), dtype=bool)
+        for part in (whole, ~whole):
+            numbers = pd.to_numeric(text[part], errors='coerce', dtype_backend='numpy_nullable')
+            values[part], valid[part] = _exact_integers(numbers, info)
+    else:
+        values, valid = _exact_integers(chunk, info)
+    return pd.Series(pd.arrays.IntegerArray(values.astype(dtype.lower()), ~valid), index=chunk.index)
+
+
+# Convert one chunk; returns the converted values and a mask of the values that failed
+def _convert_chunk(chunk, dtype, fmt=None):
+    present = chunk.notna()
+    if dtype == 'datetime':
+        if pd.api.types.is_datetime64_any_dtype(chunk):
+            converted = pd.to_datetime(chunk)
+        else:
+            converted = _parse_datetimes(chunk, fmt)
+    elif dtype in ('bool', 'boolean'):
+        if _is_text(chunk):
+            converted = chunk.astype(str).str.strip().str.lower().map(BOOL_VALUES).where(present)
+        else:
+            converted = chunk
+        converted = converted.astype('boolean')
+    elif is_integer_dtype_name(dtype):
+        converted = _to_integers(chunk, dtype)
+    else:
+        converted = _numbers(chunk).astype(dtype)
+    return converted, present & converted.isna()
+
+
+# Values of a (sampled) column that would fail to convert to `dtype`, with their row labels
+def conversion_failures(series, dtype, fmt=None):
+    if dtype in ('category', 'string', 'str', STRING_DTYPE, 'object'):
+        return series.iloc[:0]
+    if dtype == 'datetime' and fmt is None:
+        fmt = detect_datetime_format(_sample(series, 10_000))
+    _, failed = _convert_chunk(series, dtype, fmt)
+    return series[failed]
+
+
+# Convert a column to `dtype`, vectorized and `chunk_rows` at a time. Datetimes
+# use `fmt`, detected from a sample when not given. With errors='raise' the
+# first chunk containing values that cannot be converted raises ConversionError;
+# with errors='coerce' those values become missing. Integer and boolean columns
+# with missing values get the nullable dtype (e.g. "Int64") instead of failing.
+def convert(series, dtype, fmt=None, errors='raise', chunk_rows=CONVERT_CHUNK_ROWS):
+    if dtype in ('category', 'string', 'str', STRING_DTYPE, 'object'):
+        return series.astype(dtype)
+    if dtype == 'datetime' and fmt is None and _is_text(series):
+        fmt = detect_datetime_format(_sample(series, 10_000))
+
+    pieces = []
+    for start in range(0, len(series), chunk_rows):
+        chunk = series.iloc[start:start + chunk_rows]
+        converted, failed = _convert_chunk(chunk, dtype, fmt)
+        if errors == 'raise' and failed.any():
+            raise ConversionError(series.name, dtype, chunk[failed], partial=start + chunk_rows < len(series))
+        pieces.append(converted)
+    result = pd.concat(pieces) if len(pieces) > 1 else (pieces[0] if pieces else series.astype('float64'))
+
+    # Plain (non-nullable) dtypes when nothing is missing, as astype would give
+    if (dtype == 'bool' or dtype in INTEGER_DTYPES) and not result.isna().any():
+        result = result.astype(dtype)
+    return result.rename(series.name)
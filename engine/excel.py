@@ -0,0 +1,198 @@
+"""Excel ingest with sheet and column selection, parallel sheet loading and a Parquet cache.
+
+Workbooks are parsed with python-calamine when it is installed (a compiled
+reader, many times faster than openpyxl) and with openpyxl's read-only
+streaming reader otherwise. Listing the sheets reads only their header rows,
+so the sheets and columns to load can be chosen before the full load.
+Loaded selections are cached as Parquet files keyed by the workbook's hash
+and the selection, so loading the same workbook again skips parsing.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import pandas as pd
+
+from engine.ingest import STRING_DTYPE, downcast_numeric
+
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
+
+# Column added when several sheets are loaded into one table
+SHEET_COLUMN = 'Sheet'
+
+
+def _read_bytes(source):
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    if hasattr(source, 'read'):
+        source.seek(0)
+        return source.read()
+    with open(source, 'rb') as workbook:
+        return workbook.read()
+
+
+# Column names of every sheet, in workbook order, from the header rows only
+def sheet_columns(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    with pd.ExcelFile(source, engine=EXCEL_ENGINE) as workbook:
+        return {
+            name: [str(col) for col in workbook.parse(name, nrows=0).columns]
+            for name in workbook.sheet_names
+        }
+
+
+# Read one sheet, only the given columns when `columns` is set. Columns are
+# named as sheet_columns lists them (str), so headers such as 2023 or a date
+# are matched by their text rather than their raw value.
+def read_sheet(path, sheet, columns=None):
+    wanted = None if columns is None else set(columns)
+    usecols = None if wanted is None else (lambda col: str(col) in wanted)
+    df = pd.read_excel(path, sheet_name=sheet, usecols=usecols, engine=EXCEL_ENGINE)
+    df.columns = [str(col) for col in df.columns]
+    return df
+
+
+# Same compact dtypes as CSV ingest: downcast numbers, and store text columns
+# as category when they repeat enough, otherwise as (pyarrow) strings.
+# Columns mixing text with other values are left as they are.
+def compact_dtypes(df, category_max_ratio=0.5):
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            continue
+        non_null = series.dropna()
+        if len(non_null) and non_null.nunique() / len(non_null) <= category_max_ratio:
+            df[col] = series.astype('category')
+        else:
+            df[col] = series.astype(STRING_DTYPE)
+    return downcast_numeric(df)
+
+
+def _cache_path(cache_dir, fingerprint, sheets, columns):
+    selection = json.dumps([EXCEL_ENGINE, sheets, columns], sort_keys=True).encode()
+    return os.path.join(cache_dir, f"{fingerprint}-{hashlib.sha256(selection).hexdigest()[:16]}.parquet")
+
+
+# Remove the least recently used cache files until the cache fits in `max_bytes`
+def prune_cache(cache_dir, max_bytes):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.parquet'):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_atime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        total -= size
+
+
+def _write_cache(df, path, max_bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, partial = tempfile.mkstemp(suffix='.partial', dir=os.path.dirname(path))
+    os.close(handle)
+    try:
+        df.to_parquet(partial, index=False)
+        os.replace(partial, path)
+    except Exception:
+        # Caching is best effort; e.g. columns mixing text and numbers cannot be stored
+        os.remove(partial)
+        return False
+    if max_bytes:
+        prune_cache(os.path.dirname(path), max_bytes)
+    return True
+
+
+# Load the selected sheets (the first sheet by default; '*' for all of them)
+# and, optionally, only some columns. Several sheets are read in parallel on
+# `workers` processes and stacked into one table with a 'Sheet' column.
+# With `cache_dir`, the result is cached as Parquet, keyed by the workbook's
+# SHA-256 (pass `fingerprint` when it is already known) and the selection.
+# Returns the DataFrame and an ingest report.
+def read_workbook(source, sheets=None, columns=None, workers=1, cache_dir=None, cache_max_bytes=None,
+                  category_max_ratio=0.5, fingerprint=None):
+    start = time.perf_counter()
+    data = _read_bytes(source)
+    fingerprint = fingerprint or hashlib.sha256(data).hexdigest()
+
+    # The cache is keyed by the selection as requested, so a hit never opens the workbook
+    columns = list(columns) if columns else None
+    requested = sheets if sheets in (None, '*') else list(sheets)
+    cache = _cache_path(cache_dir, fingerprint, requested, columns) if cache_dir else None
+    cached = cache is not None and os.path.exists(cache)
+    if cached:
+        df = pd.read_parquet(cache)
+        os.utime(cache)
+        sheets = df.attrs.pop('sheets', requested)
+    else:
+        # Header rows are only read when the selection needs them; opening a workbook is not free
+        headers = None
+        if columns is not None or sheets in (None, '*'):
+            headers = sheet_columns(source)
+            sheets = list(headers) if sheets == '*' else list(sheets or list(headers)[:1])
+            unknown = [sheet for sheet in sheets if sheet not in headers]
+            if unknown:
+                raise ValueError(f"Sheet not found in the workbook: {unknown[0]}")
+
+        # Workers read the workbook from disk, so uploads are spooled to a file once
+        path, spooled = source, False
+        if not isinstance(source, (str, os.PathLike)):
+            handle, path = tempfile.mkstemp(suffix='.xlsx')
+            with os.fdopen(handle, 'wb') as spool:
+                spool.write(data)
+            spooled = True
+        del data
+        usecols = [None if columns is None else [col for col in columns if col in headers[sheet]] for sheet in sheets]
+        try:
+            workers = min(workers, len(sheets), os.cpu_count() or 1)
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+                    frames = list(pool.map(read_sheet, [path] * len(sheets), sheets, usecols))
+            else:
+                frames = [read_sheet(path, sheet, cols) for sheet, cols in zip(sheets, usecols)]
+        finally:
+            if spooled:
+                os.remove(path)
+
+        if len(frames) == 1:
+            df = frames[0]
+        else:
+            name = SHEET_COLUMN
+            while any(name in frame.columns for frame in frames):
+                name = f"_{name}"
+            for sheet, frame in zip(sheets, frames):
+                frame.insert(0, name, sheet)
+            df = pd.concat(frames, ignore_index=True)
+        del frames
+        df = compact_dtypes(df, category_max_ratio)
+        if cache is not None:
+            # The sheet names are stored with the data, for the report of a cache hit
+            df.attrs['sheets'] = sheets
+            _write_cache(df, cache, cache_max_bytes)
+            df.attrs.pop('sheets')
+
+    elapsed = time.perf_counter() - start
+    return df, {
+        'engine': 'excel',
+        'reader': EXCEL_ENGINE,
+        'sheets': sheets,
+        'cached': cached,
+        'rows': len(df),
+        'seconds': elapsed,
+        'rows_per_second': len(df) / elapsed if elapsed > 0 else float(len(df)),
+        'memory_bytes': int(df.memory_usage(deep=True, index=False).sum()),
+        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}
+    }
@@ -0,0 +1,119 @@
+"""Chunked exports to CSV, gzip-compressed CSV, Parquet and Excel files."""
+import datetime
+import gzip
+import os
+import tempfile
+
+import pandas as pd
+
+from engine.sparse import arrow_schema, densify, sparse_columns
+
+# Rows converted and written at a time, so export memory does not grow with the data
+EXPORT_CHUNK_ROWS = 50_000
+
+# Values of sparse columns made dense at a time; wide one-hot frames get shorter chunks
+EXPORT_CHUNK_SPARSE_VALUES = 20_000_000
+
+# Largest number of data rows an Excel sheet holds (below the header row)
+EXCEL_MAX_ROWS = 1_048_575
+
+# Download format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+EXCEL_CELL_TYPES = (str, int, float, bool, datetime.date, datetime.datetime)
+
+
+# Consecutive row slices of a DataFrame; slices are views, nothing is copied up front.
+# Sparse columns are made dense one slice at a time, which the writers handle
+# much faster, in slices short enough to keep that within EXPORT_CHUNK_SPARSE_VALUES.
+def iter_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    sparse = sparse_columns(df)
+    if sparse:
+        chunk_rows = max(1, min(chunk_rows, EXPORT_CHUNK_SPARSE_VALUES // len(sparse)))
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield densify(chunk) if sparse else chunk
+
+
+# A fresh spool file for an export; the caller removes it when it is no longer needed
+def spool_path(extension, directory=None):
+    handle, path = tempfile.mkstemp(prefix='export-', suffix=f'.{extension}', dir=directory)
+    os.close(handle)
+    return path
+
+
+def write_csv(chunks, path, compress=False):
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', newline='', encoding='utf-8') as out:
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(out, index=False, header=header)
+            header = False
+
+
+# Write chunks to one Parquet file, one row group per chunk.
+# The schema comes from the whole frame so every chunk is written with the same types.
+def write_parquet(df, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(df)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _excel_cell(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp) and value.tzinfo is not None:
+        return value.tz_localize(None)
+    return value if isinstance(value, EXCEL_CELL_TYPES) else str(value)
+
+
+# Write an .xlsx file in xlsxwriter's constant-memory mode: rows are flushed
+# to disk as they are written, so only the current row is held in memory
+def write_excel(chunks, columns, path, transformation_history=None):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {
+        'constant_memory': True,
+        'nan_inf_to_errors': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss'
+    })
+    try:
+        sheet = workbook.add_worksheet('Data')
+        sheet.write_row(0, 0, [str(col) for col in columns])
+        row = 0
+        for chunk in chunks:
+            if row + len(chunk) > EXCEL_MAX_ROWS:
+                raise ValueError(f"Excel sheets hold at most {EXCEL_MAX_ROWS:,} rows; use CSV or Parquet instead")
+            for values in chunk.itertuples(index=False, name=None):
+                row += 1
+                sheet.write_row(row, 0, [_excel_cell(value) for value in values])
+
+        if transformation_history:
+            history = workbook.add_worksheet('Transformation History')
+            history.write(0, 0, 'Transformation')
+            history.write_column(1, 0, transformation_history)
+    finally:
+        workbook.close()
+
+
+# Export an in-memory DataFrame to `path` in one of EXPORT_FORMATS
+def export_dataframe(df, path, file_format, transformation_history=None):
+    if file_format == 'CSV':
+        write_csv(iter_chunks(df), path)
+    elif file_format == 'CSV (gzip)':
+        write_csv(iter_chunks(df), path, compress=True)
+    elif file_format == 'Parquet':
+        write_parquet(df, path)
+    elif file_format == 'Excel':
+        write_excel(iter_chunks(df), df.columns, path, transformation_history)
+    else:
+        raise ValueError(f"Unknown export format: {file_format}")
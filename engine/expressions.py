@@ -0,0 +1,238 @@
+"""Derived-column expressions such as ``(price - cost) * qty`` or ``region + "-" + store``.
+
+An expression is parsed once into a small tree of column references,
+literals, operators and function calls, checked against the column types,
+then evaluated chunk by chunk with vectorized pandas/NumPy arithmetic and
+Arrow string kernels. engine.outofcore renders the same tree as SQL.
+
+Columns are referenced by name; names that are not Python identifiers are
+written in backticks, e.g. ``(`Unit Price` - cost) * qty``.
+"""
+import ast
+import operator
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Rows evaluated at a time, so temporaries stay bounded on large frames
+EXPRESSION_CHUNK_ROWS = 1_000_000
+
+OPERATORS = {
+    ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+    ast.FloorDiv: '//', ast.Mod: '%', ast.Pow: '**',
+}
+
+NUMBER_OPERATIONS = {
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv,
+    '//': operator.floordiv, '%': operator.mod, '**': operator.pow,
+}
+
+# Function name -> (argument kind, result kind, allowed argument counts)
+FUNCTIONS = {
+    'abs': ('number', 'number', (1,)),
+    'round': ('number', 'number', (1, 2)),
+    'sqrt': ('number', 'number', (1,)),
+    'log': ('number', 'number', (1,)),
+    'exp': ('number', 'number', (1,)),
+    'upper': ('text', 'text', (1,)),
+    'lower': ('text', 'text', (1,)),
+    'str': (None, 'text', (1,)),
+}
+
+_BACKTICK = re.compile(r"`([^`]*)`")
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+# Parse `expression` into a tree of tuples:
+#   ('column', name) | ('literal', value) | ('neg', node)
+#   | ('binary', operator, left, right) | ('call', function, [args])
+def parse(expression):
+    names = []
+
+    def placeholder(match):
+        names.append(match.group(1))
+        return f"__column_{len(names) - 1}__"
+
+    source = _BACKTICK.sub(placeholder, expression.strip())
+    try:
+        tree = ast.parse(source, mode='eval').body
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}") from e
+
+    def build(node):
+        if isinstance(node, ast.Name):
+            match = re.fullmatch(r"__column_(\d+)__", node.id)
+            return ('column', names[int(match.group(1))] if match else node.id)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) and not isinstance(node.value, bool):
+            return ('literal', node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = build(node.operand)
+            return ('neg', operand) if isinstance(node.op, ast.USub) else operand
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return ('binary', OPERATORS[type(node.op)], build(node.left), build(node.right))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            if node.func.id not in FUNCTIONS:
+                raise ExpressionError(f"Unknown function: {node.func.id}")
+            return ('call', node.func.id, [build(arg) for arg in node.args])
+        raise ExpressionError(f"Unsupported syntax in expression: {ast.unparse(node)}")
+
+    return build(tree)
+
+
+# Column names an expression reads
+def referenced_columns(expression):
+    found = []
+
+    def walk(node):
+        if node[0] == 'column' and node[1] not in found:
+            found.append(node[1])
+        for child in node[1:]:
+            if isinstance(child, tuple):
+                walk(child)
+            elif isinstance(child, list):
+                for item in child:
+                    walk(item)
+
+    walk(parse(expression))
+    return found
+
+
+# 'text' or 'number' for a parsed expression; non-numeric columns count as text
+def result_kind(node, columns, numeric_columns):
+    kind = node[0]
+    if kind == 'column':
+        if node[1] not in columns:
+            raise ExpressionError(f"Unknown column: {node[1]}")
+        return 'number' if node[1] in numeric_columns else 'text'
+    if kind == 'literal':
+        return 'text' if isinstance(node[1], str) else 'number'
+    if kind == 'neg':
+        if result_kind(node[1], columns, numeric_columns) != 'number':
+            raise ExpressionError("Only numbers can be negated")
+        return 'number'
+    if kind == 'binary':
+        left = result_kind(node[2], columns, numeric_columns)
+        right = result_kind(node[3], columns, numeric_columns)
+        if left == right == 'number':
+            return 'number'
+        if left == right == 'text' and node[1] == '+':
+            return 'text'
+        if node[1] == '+':
+            raise ExpressionError("Cannot add text and numbers; wrap the number in str(...)")
+        raise ExpressionError(f"Operator {node[1]} needs numbers")
+
+    argument, result, counts = FUNCTIONS[node[1]]
+    if len(node[2]) not in counts:
+        raise ExpressionError(f"{node[1]}() takes {' or '.join(map(str, counts))} argument(s)")
+    kinds = [result_kind(arg, columns, numeric_columns) for arg in node[2]]
+    if argument is not None and any(kind != argument for kind in kinds):
+        raise ExpressionError(f"{node[1]}() needs {argument} arguments")
+    return result
+
+
+# Parse and type-check an expression against a frame's columns; returns the tree and its kind
+def compile_expression(expression, columns, numeric_columns):
+    tree = parse(expression)
+    return tree, result_kind(tree, set(columns), set(numeric_columns))
+
+
+def is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _is_text(value):
+    return isinstance(value, str) or (isinstance(value, pd.Series) and not is_numeric(value))
+
+
+def _as_text(value):
+    if isinstance(value, pd.Series):
+        # The nullable string dtype keeps missing values missing on every
+        # pandas version (astype(str) writes 'None'/'nan' before pandas 3)
+        return pa.array(value.astype('string'), type=pa.string(), from_pandas=True)
+    return pa.scalar(str(value), type=pa.string())
+
+
+# Arrow result of a chunk as a Series on the chunk's index, row by row
+# (not by label: a sorted or filtered chunk's index is not 0..n-1)
+def _text_series(array, index):
+    if len(array) != len(index):
+        raise ValueError(f"Text result has {len(array)} rows for a chunk of {len(index)}")
+    return pd.Series(array.to_numpy(zero_copy_only=False), index=index).astype('string')
+
+
+# Evaluate a type-checked tree on one chunk; returns a Series or a scalar
+def _evaluate(node, chunk):
+    kind = node[0]
+    if kind == 'column':
+        return chunk[node[1]]
+    if kind == 'literal':
+        return node[1]
+    if kind == 'neg':
+        return -_evaluate(node[1], chunk)
+
+    if kind == 'binary':
+        left = _evaluate(node[2], chunk)
+        right = _evaluate(node[3], chunk)
+        if _is_text(left):
+            if not isinstance(left, pd.Series) and not isinstance(right, pd.Series):
+                return left + right
+            # Arrow string kernel; the result is missing where either side is
+            joined = pc.binary_join_element_wise(_as_text(left), _as_text(right), "")
+            return _text_series(joined, chunk.index)
+        return NUMBER_OPERATIONS[node[1]](left, right)
+
+    args = [_evaluate(arg, chunk) for arg in node[2]]
+    value = args[0]
+    if node[1] == 'str':
+        return value.astype('string') if isinstance(value, pd.Series) else str(value)
+    if node[1] in ('upper', 'lower'):
+        if not isinstance(value, pd.Series):
+            return value.upper() if node[1] == 'upper' else value.lower()
+        kernel = pc.utf8_upper if node[1] == 'upper' else pc.utf8_lower
+        return _text_series(kernel(_as_text(value)), chunk.index)
+    if node[1] == 'round':
+        digits = int(args[1]) if len(args) > 1 else 0
+        return value.round(digits) if isinstance(value, pd.Series) else round(value, digits)
+    return {'abs': np.abs, 'sqrt': np.sqrt, 'log': np.log, 'exp': np.exp}[node[1]](value)
+
+
+def _chunks(df, chunk_rows):
+    if len(df) <= chunk_rows:
+        yield df
+        return
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+# Evaluate an expression over `df` as a new column (a Series aligned with df)
+def evaluate(df, expression, chunk_rows=EXPRESSION_CHUNK_ROWS):
+    numeric_columns = [col for col in df.columns if is_numeric(df[col])]
+    tree, _ = compile_expression(expression, df.columns, numeric_columns)
+
+    parts = []
+    for chunk in _chunks(df, chunk_rows):
+        value = _evaluate(tree, chunk)
+        # Constant expressions are broadcast to every row
+        parts.append(value if isinstance(value, pd.Series) else pd.Series(value, index=chunk.index))
+    return parts[0] if len(parts) == 1 else pd.concat(parts)
+
+
+# Join the text of several columns with a separator, skipping missing values
+def join_columns(df, columns, separator, chunk_rows=EXPRESSION_CHUNK_ROWS):
+    parts = []
+    for chunk in _chunks(df, chunk_rows):
+        arrays = [_as_text(chunk[col]) for col in columns]
+        # Arrow drops the rows where every input is missing instead of
+        # returning a null: those rows join an empty string, then become missing
+        all_missing = pa.array(np.logical_and.reduce([array.is_null().to_numpy(zero_copy_only=False) for array in arrays]))
+        arrays[0] = pc.if_else(all_missing, '', arrays[0])
+        joined = pc.binary_join_element_wise(*arrays, separator, null_handling='skip')
+        joined = pc.if_else(all_missing, pa.scalar(None, pa.string()), joined)
+        parts.append(_text_series(joined, chunk.index))
+    return parts[0] if len(parts) == 1 else pd.concat(parts)
@@ -0,0 +1,84 @@
+"""Backend-independent access to the current data for the UI.
+
+The current data is either a pandas DataFrame (in-memory engine) or a
+SQLFrame (out-of-core engine); the widgets only ever ask these questions.
+"""
+import numpy as np
+
+from engine.export import export_dataframe
+from engine.outofcore import SQLFrame
+from engine.profile import TEXT_DTYPES
+from engine.sparse import densify
+
+
+def is_out_of_core(df):
+    return isinstance(df, SQLFrame)
+
+
+def numeric_columns(df):
+    if is_out_of_core(df):
+        return df.numeric_columns()
+    return df.select_dtypes(include=np.number).columns.tolist()
+
+
+def text_columns(df):
+    if is_out_of_core(df):
+        return df.text_columns()
+    return df.select_dtypes(include=TEXT_DTYPES).columns.tolist()
+
+
+# Distinct values of a column in order of first appearance. In-memory data
+# reads them from `indexes` (engine.indexes.ColumnIndexes) when given.
+def unique_values(df, col, indexes=None):
+    if is_out_of_core(df):
+        return df.distinct(col)
+    if indexes is not None:
+        return indexes.distinct(col)
+    return df[col].unique()
+
+
+# Number of distinct non-missing values of a column, without materializing them
+def distinct_count(df, col, indexes=None):
+    if is_out_of_core(df):
+        return df.distinct_count(col)
+    if indexes is not None:
+        return indexes.distinct_count(col)
+    return df[col].nunique()
+
+
+def column_range(df, col, indexes=None):
+    if is_out_of_core(df):
+        return df.bounds(col)
+    if indexes is not None:
+        return indexes.bounds(col)
+    return df[col].min(), df[col].max()
+
+
+def column_dtype(df, col):
+    return df.dtypes[col]
+
+
+def sample_values(df, col, n):
+    if is_out_of_core(df):
+        return df.head(n)[col].tolist()
+    return df[col].head(n).tolist()
+
+
+# Up to `n` values of a column to check conversions on: a random sample in
+# memory, the first rows out of core (where a random sample means a full scan)
+def column_sample(df, col, n):
+    if is_out_of_core(df):
+        return df.head(n)[col]
+    return df[col].sample(n, random_state=0) if len(df) > n else df[col]
+
+
+def preview(df, n):
+    return densify(df.head(n))
+
+
+# Write the data to `path` in one of engine.export.EXPORT_FORMATS
+def export_data(df, path, file_format, transformation_history=None):
+    if is_out_of_core(df):
+        df.export(path, file_format, transformation_history)
+    else:
+        export_dataframe(df, path, file_format, transformation_history)
@@ -0,0 +1,107 @@
+"""Per-column indexes that answer filter widgets and filters without rescanning.
+
+Indexes are built lazily, the first time a column is filtered or shown in a
+filter widget, and live on one data version (see engine.snapshots.Snapshot).
+"""
+import numpy as np
+import pandas as pd
+
+
+class CodesIndex:
+    """Factorized column: one integer code per row plus the distinct values.
+
+    `isin` filters are evaluated on the distinct values only and spread back
+    to the rows through a lookup table, instead of hashing every row again.
+    """
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.codes = codes
+        self.uniques = pd.Index(uniques)
+        # The column's own missing value, so it is matched exactly like Series.isin does
+        self.missing = series[codes < 0].iloc[:1]
+
+    # Distinct values in order of first appearance, like Series.unique();
+    # a missing value, if any, is listed last
+    def distinct(self):
+        values = pd.concat([pd.Series(self.uniques, dtype=self.missing.dtype), self.missing], ignore_index=True)
+        return values.unique()
+
+    # Rows whose value is one of `values`, with Series.isin semantics
+    def isin(self, values):
+        # Code -1 (missing) reads the last slot of the table
+        table = np.append(self.uniques.isin(values), self.missing.isin(values).any())
+        return table[self.codes]
+
+
+class SortedIndex:
+    """Stable sort permutation of a numeric column.
+
+    Range filters are two binary searches plus marking the rows in between;
+    bounds are the first and last sorted values. Missing values sort last and
+    never match a range.
+    """
+
+    def __init__(self, series):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        self.order = np.argsort(values, kind='stable')
+        self.sorted = values[self.order]
+        self.valid = len(values) - int(np.isnan(values).sum())
+
+    def bounds(self):
+        if self.valid == 0:
+            return np.nan, np.nan
+        return self.sorted[0], self.sorted[self.valid - 1]
+
+    # Rows with low <= value <= high
+    def between(self, low, high):
+        values = self.sorted[:self.valid]
+        start = np.searchsorted(values, low, side='left')
+        stop = np.searchsorted(values, high, side='right')
+        mask = np.zeros(len(self.order), dtype=bool)
+        mask[self.order[start:stop]] = True
+        return mask
+
+
+class ColumnIndexes:
+    """Lazily built indexes for the columns of one DataFrame."""
+
+    def __init__(self, df):
+        self.df = df
+        self._codes = {}
+        self._sorted = {}
+
+    def codes(self, col):
+        if col not in self._codes:
+            self._codes[col] = CodesIndex(self.df[col])
+        return self._codes[col]
+
+    def sorted(self, col):
+        if col not in self._sorted:
+            self._sorted[col] = SortedIndex(self.df[col])
+        return self._sorted[col]
+
+    def distinct(self, col):
+        return self.codes(col).distinct()
+
+    # Number of distinct non-missing values; reads an index that already
+    # exists and otherwise counts without building one
+    def distinct_count(self, col):
+        if col in self._codes:
+            return len(self._codes[col].uniques)
+        return self.df[col].nunique()
+
+    def bounds(self, col):
+        return self.sorted(col).bounds()
+
+    # Boolean row mask for a single 'isin' or 'range' filter op, or None when
+    # the op has to be evaluated on the column itself
+    def filter_mask(self, op):
+        series = self.df[op['column']]
+        if op['kind'] == 'isin':
+            mask = self.codes(op['column']).isin(op['values'])
+        elif op['kind'] == 'range' and pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            mask = self.sorted(op['column']).between(op['min'], op['max'])
+        else:
+            return None
+        return pd.Series(mask, index=self.df.index)
@@ -0,0 +1,142 @@
+"""Chunked, memory-budgeted file ingest with compact dtypes."""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "object"
+
+# Largest number of significant digits float32 keeps without visible rounding
+FLOAT32_DIGITS = 7
+
+
+# Raised when a file does not fit the configured memory budget
+class MemoryBudgetExceeded(MemoryError):
+    pass
+
+
+# Current resident set size of this process in bytes, if the platform exposes it
+def current_rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# True when every value survives a float32 round trip at the precision it was written with
+def fits_float32(values):
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return True
+
+    largest = np.abs(finite).max()
+    int_digits = int(np.floor(np.log10(largest))) + 1 if largest >= 1 else 1
+    for decimals in range(FLOAT32_DIGITS - int_digits + 1):
+        if np.array_equal(np.round(finite, decimals), finite):
+            return True
+    return False
+
+
+# Pick string/category dtypes for text columns from a sample of the file
+def infer_text_dtypes(sample, category_max_ratio):
+    dtypes = {}
+    for col in sample.columns:
+        series = sample[col]
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            continue
+        non_null = series.dropna()
+        if len(non_null) and non_null.nunique() / len(non_null) <= category_max_ratio:
+            dtypes[col] = "category"
+        else:
+            dtypes[col] = STRING_DTYPE
+    return dtypes
+
+
+# Downcast the numeric columns of a chunk to the smallest dtype that holds them
+def downcast_numeric(chunk):
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            chunk[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series) and fits_float32(series.to_numpy(dtype="float64")):
+            chunk[col] = series.astype("float32")
+    return chunk
+
+
+# Concatenate one column's chunk pieces, unioning categories where needed
+def _concat_pieces(pieces):
+    if all(isinstance(piece.dtype, pd.CategoricalDtype) for piece in pieces):
+        return pd.Series(pd.api.types.union_categoricals([piece.array for piece in pieces]), name=pieces[0].name)
+    return pd.concat(pieces, ignore_index=True)
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+# Stream a CSV in chunks, downcasting as it goes.
+# Returns the DataFrame and a report with rows/second and peak memory.
+def read_csv_chunked(source, chunk_rows=250_000, memory_budget=None, sample_rows=10_000,
+                     category_max_ratio=0.5):
+    start = time.perf_counter()
+    rss_start = current_rss()
+    rss_peak = rss_start
+
+    sample = pd.read_csv(source, nrows=sample_rows)
+    _rewind(source)
+    text_dtypes = infer_text_dtypes(sample, category_max_ratio)
+    raw_sample_bytes = sample.memory_usage(deep=True).sum()
+    del sample
+
+    # Keep one list of pieces per column so the chunk frames can be released right away
+    pieces = {}
+    held_bytes = 0
+    peak_bytes = 0
+    rows = 0
+    for chunk in pd.read_csv(source, chunksize=chunk_rows, dtype=text_dtypes):
+        chunk = downcast_numeric(chunk)
+        rows += len(chunk)
+        held_bytes += chunk.memory_usage(deep=True, index=False).sum()
+        peak_bytes = max(peak_bytes, held_bytes)
+        if memory_budget and held_bytes > memory_budget:
+            raise MemoryBudgetExceeded(
+                f"File needs more than {memory_budget / 1024 ** 2:.0f} MB after {rows:,} rows"
+            )
+        for col in chunk.columns:
+            pieces.setdefault(col, []).append(chunk[col])
+        del chunk
+
+        rss = current_rss()
+        if rss is not None:
+            rss_peak = max(rss_peak, rss)
+
+    # Build columns one at a time; only one column exists twice at any moment
+    columns = {}
+    for col in list(pieces):
+        columns[col] = _concat_pieces(pieces.pop(col))
+        peak_bytes = max(peak_bytes, held_bytes + columns[col].memory_usage(deep=True, index=False))
+    df = pd.DataFrame(columns, copy=False)
+    del columns
+
+    elapsed = time.perf_counter() - start
+    memory_bytes = int(df.memory_usage(deep=True, index=False).sum())
+    report = {
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed > 0 else float(rows),
+        'memory_bytes': memory_bytes,
+        'peak_bytes': int(peak_bytes),
+        'default_bytes_estimate': int(raw_sample_bytes / max(min(sample_rows, rows), 1) * rows),
+        'peak_rss_delta': rss_peak - rss_start if rss_start is not None else None,
+        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}
+    }
+    return df, report
@@ -0,0 +1,400 @@
+"""Model clients and responses shared between sessions: pooling, retries, caching."""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+# Questions that differ only in case or spacing get the same answer
+def normalize_question(question):
+    return " ".join(question.casefold().split())
+
+
+# Cache key for one request: the data it is about (the profile text sent in the
+# prompt), the normalized question, the model and its generation config
+def response_key(profile_text, question, model_name, generation_config):
+    payload = json.dumps({
+        'profile': hashlib.sha256(profile_text.encode('utf-8')).hexdigest(),
+        'question': normalize_question(question),
+        'model': model_name,
+        'config': generation_config,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# A request currently being answered; other callers with the same key wait for it
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of model responses with a time-to-live.
+
+    Entries live in memory (at most `max_entries`, least recently used evicted
+    first) and, when `disk_dir` is set, also as small JSON files so they
+    survive restarts. Concurrent requests for a key that is not cached yet are
+    coalesced: only the first caller generates, the others wait for its result
+    (at most `wait_timeout` seconds). `clock` can be replaced in tests.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=24 * 3600, disk_dir=None, max_disk_entries=10_000,
+                 wait_timeout=300, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.wait_timeout = wait_timeout
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'memory_hits': 0, 'disk_hits': 0, 'coalesced': 0,
+                       'misses': 0, 'errors': 0, 'evictions': 0, 'seconds_saved': 0.0, 'seconds_spent': 0.0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _expired(self, entry):
+        return self.clock() - entry['created'] > self.ttl_seconds
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, encoding='utf-8') as cached:
+                entry = json.load(cached)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    # Write via a temporary file so readers never see a partial entry
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as cached:
+            json.dump(entry, cached)
+        os.replace(temp_path, path)
+
+        files = [name for name in os.listdir(self.disk_dir) if name.endswith('.json')]
+        if len(files) > self.max_disk_entries:
+            files.sort(key=lambda name: os.stat(os.path.join(self.disk_dir, name)).st_mtime_ns)
+            for name in files[:len(files) - self.max_disk_entries]:
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    pass
+
+    # Store in memory, evicting the least recently used entries beyond the limit
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._expired(entry):
+                self._entries.move_to_end(key)
+                return entry, 'memory'
+            del self._entries[key]
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._remember(key, entry)
+            return entry, 'disk'
+        return None, None
+
+    # Look `key` up. Returns (entry, origin) on a hit; otherwise (in_flight, 'leader')
+    # when this caller must generate, or (in_flight, 'waiter') when another caller is
+    def _claim(self, key):
+        with self._lock:
+            self._stats['requests'] += 1
+            entry, origin = self._lookup(key)
+            if entry is not None:
+                self._stats[f'{origin}_hits'] += 1
+                self._stats['seconds_saved'] += entry['seconds']
+                return entry, origin
+
+            waiting = self._in_flight.get(key)
+            if waiting is None:
+                waiting = self._in_flight[key] = _InFlight()
+                self._stats['misses'] += 1
+                return waiting, 'leader'
+            self._stats['coalesced'] += 1
+            return waiting, 'waiter'
+
+    def _wait(self, waiting):
+        if not waiting.done.wait(self.wait_timeout):
+            raise TimeoutError("Timed out waiting for an identical request to finish")
+        if waiting.error is not None:
+            raise waiting.error
+        return waiting.text
+
+    def _complete(self, key, waiting, text, seconds):
+        waiting.text = text
+        entry = {'text': text, 'created': self.clock(), 'seconds': seconds}
+        with self._lock:
+            self._stats['seconds_spent'] += seconds
+            self._remember(key, entry)
+            del self._in_flight[key]
+        waiting.done.set()
+        self._write_disk(key, entry)
+
+    def _fail(self, key, waiting, error):
+        waiting.error = error
+        with self._lock:
+            self._stats['errors'] += 1
+            del self._in_flight[key]
+        waiting.done.set()
+
+    # Return (text, origin) for `key`, calling `generate()` only when no cached
+    # or in-flight answer exists. origin is 'memory', 'disk', 'coalesced' or 'api'.
+    def get_or_generate(self, key, generate):
+        found, origin = self._claim(key)
+        if origin == 'waiter':
+            return self._wait(found), 'coalesced'
+        if origin != 'leader':
+            return found['text'], origin
+
+        start = time.perf_counter()
+        try:
+            text = generate()
+        except Exception as e:
+            self._fail(key, found, e)
+            raise
+        self._complete(key, found, text, time.perf_counter() - start)
+        return text, 'api'
+
+    # Streaming variant: returns (chunks, origin) where chunks is an iterator of
+    # text pieces. A new answer is cached once its stream has been read to the end;
+    # a stream abandoned half way is not cached and waiting callers get an error.
+    def get_or_stream(self, key, stream):
+        found, origin = self._claim(key)
+        if origin == 'waiter':
+            return iter([self._wait(found)]), 'coalesced'
+        if origin != 'leader':
+            return iter([found['text']]), origin
+        return self._stream_and_store(key, found, stream), 'api'
+
+    def _stream_and_store(self, key, waiting, stream):
+        start = time.perf_counter()
+        parts = []
+        try:
+            for chunk in stream():
+                parts.append(chunk)
+                yield chunk
+        except BaseException as e:
+            error = e if isinstance(e, Exception) else RuntimeError("The request was cancelled")
+            self._fail(key, waiting, error)
+            raise
+        self._complete(key, waiting, "".join(parts), time.perf_counter() - start)
+
+    # Counters plus the hit rate; cache hits add the latency the original request took
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        hits = stats['memory_hits'] + stats['disk_hits'] + stats['coalesced']
+        stats['hit_rate'] = hits / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+
+# Raised when no request slot frees up in time; the quota is shared by all sessions
+class ModelBusy(Exception):
+    pass
+
+
+class ModelBackend:
+    """Interface every model backend implements.
+
+    `generate` returns the whole answer and `stream` yields it in pieces.
+    Both get a per-request `timeout` in seconds. `retryable(error)` tells the
+    client which failures are transient.
+    """
+
+    def generate(self, prompt, generation_config, timeout):
+        raise NotImplementedError
+
+    def stream(self, prompt, generation_config, timeout):
+        yield self.generate(prompt, generation_config, timeout)
+
+    def retryable(self, error):
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+
+class GeminiBackend(ModelBackend):
+    def __init__(self, model_name):
+        import google.generativeai as genai
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, generation_config, timeout):
+        response = self.model.generate_content(
+            prompt, generation_config=generation_config, request_options={'timeout': timeout}
+        )
+        return response.text
+
+    def stream(self, prompt, generation_config, timeout):
+        response = self.model.generate_content(
+            prompt, generation_config=generation_config, stream=True, request_options={'timeout': timeout}
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def retryable(self, error):
+        try:
+            from google.api_core import exceptions
+        except ImportError:
+            return super().retryable(error)
+        transient = (exceptions.ResourceExhausted, exceptions.ServiceUnavailable,
+                     exceptions.DeadlineExceeded, exceptions.InternalServerError)
+        return isinstance(error, transient) or super().retryable(error)
+
+
+class FakeBackend(ModelBackend):
+    """Offline backend for tests and demos.
+
+    Answers with `reply` (or `reply(prompt)` when it is callable), word by word
+    when streamed, after `latency` seconds. The first `failures` calls raise a
+    retryable ConnectionError. Every prompt is recorded in `prompts`.
+    """
+
+    def __init__(self, reply="This is a placeholder answer from the offline model.", latency=0.0, failures=0):
+        self.reply = reply
+        self.latency = latency
+        self.failures = failures
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt, timeout):
+        with self._lock:
+            self.prompts.append(prompt)
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("Simulated connection failure")
+        if self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"No answer within {timeout}s")
+        time.sleep(self.latency)
+        return self.reply(prompt) if callable(self.reply) else self.reply
+
+    def generate(self, prompt, generation_config, timeout):
+        return self._answer(prompt, timeout)
+
+    def stream(self, prompt, generation_config, timeout):
+        words = self._answer(prompt, timeout).split(" ")
+        for i, word in enumerate(words):
+            yield word if i == len(words) - 1 else word + " "
+
+
+class ModelClient:
+    """A model backend shared by every session of the process.
+
+    At most `max_concurrent` requests run at once; a request that cannot get a
+    slot within `queue_timeout` seconds fails with ModelBusy instead of
+    blocking its Streamlit thread. Transient failures are retried up to
+    `max_retries` times with exponential backoff and full jitter. A stream is
+    only retried before its first piece was produced.
+    """
+
+    def __init__(self, backend, timeout=60, max_retries=3, backoff=1.0, max_backoff=30.0,
+                 max_concurrent=4, queue_timeout=30, sleep=time.sleep):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue_timeout = queue_timeout
+        self.sleep = sleep
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise ModelBusy("Too many requests are running; please try again in a moment")
+
+    def _delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def generate(self, prompt, generation_config=None):
+        self._acquire()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return self.backend.generate(prompt, generation_config, self.timeout)
+                except Exception as e:
+                    if attempt == self.max_retries or not self.backend.retryable(e):
+                        raise
+                self.sleep(self._delay(attempt))
+        finally:
+            self._slots.release()
+
+    def stream(self, prompt, generation_config=None):
+        self._acquire()
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = False
+                try:
+                    for chunk in self.backend.stream(prompt, generation_config, self.timeout):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started or attempt == self.max_retries or not self.backend.retryable(e):
+                        raise
+                self.sleep(self._delay(attempt))
+        finally:
+            self._slots.release()
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per `per` seconds, with bursts of up to `burst`.
+
+    `acquire()` blocks until the caller may proceed. Waiting callers reserve
+    their slot, so concurrent threads are spaced out instead of all retrying.
+    """
+
+    def __init__(self, rate, per=60.0, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.interval = per / rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens * self.interval if self._tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
@@ -0,0 +1,533 @@
+"""Out-of-core execution of transformation plans on an embedded DuckDB database.
+
+The uploaded file is imported once into an on-disk DuckDB table. Every
+transformation plan is compiled to SQL on top of that table, so filters,
+sorts, aggregates, null handling and derived columns run inside DuckDB and
+only the rows the app actually shows (previews, exports) are ever fetched.
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from engine.correlation import strongest_correlations
+from engine.export import write_excel
+from engine.expressions import compile_expression, result_kind
+from engine.plan import PlanExecutionError, one_hot_other_label, optimize
+from engine.stats import DESCRIBE_INDEX
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Hidden column that keeps the row order of the data through every step
+ROW_ID = '__row'
+
+# Rows fetched at a time when streaming results out of the engine
+BATCH_ROWS = 100_000
+
+NUMERIC_TYPES = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT',
+                 'UINTEGER', 'UBIGINT', 'FLOAT', 'DOUBLE', 'DECIMAL')
+TEXT_TYPES = ('VARCHAR',)
+
+# SQL types for the pandas dtypes offered by "Change Data Type"
+SQL_TYPES = {
+    'int8': 'TINYINT',
+    'int16': 'SMALLINT',
+    'int32': 'INTEGER',
+    'int64': 'BIGINT',
+    'Int8': 'TINYINT',
+    'Int16': 'SMALLINT',
+    'Int32': 'INTEGER',
+    'Int64': 'BIGINT',
+    'float32': 'FLOAT',
+    'float64': 'DOUBLE',
+    'string': 'VARCHAR',
+    'category': 'VARCHAR',
+    'bool': 'BOOLEAN',
+    'boolean': 'BOOLEAN',
+    'datetime': 'TIMESTAMP',
+}
+
+
+def available():
+    return duckdb is not None
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# Render a Python value as a SQL literal
+def literal(value):
+    if value is None or (isinstance(value, (float, np.floating)) and np.isnan(value)):
+        return 'NULL'
+    if isinstance(value, (bool, np.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return f"'{float(value)!r}'::DOUBLE" if np.isinf(value) else repr(float(value))
+    if isinstance(value, (pd.Timestamp, datetime.datetime)):
+        return f"TIMESTAMP '{value.isoformat()}'"
+    if isinstance(value, datetime.date):
+        return f"DATE '{value.isoformat()}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _base_type(sql_type):
+    return sql_type.split('(')[0]
+
+
+class DuckDBSource:
+    """A dataset imported into its own on-disk DuckDB database.
+
+    The database lives in a private work directory that also holds DuckDB's
+    spill files, and is removed when the source is garbage collected.
+    """
+
+    def __init__(self, workdir, memory_limit=None):
+        self.workdir = workdir
+        self.database = os.path.join(workdir, 'data.duckdb')
+        self._con = duckdb.connect(self.database)
+        self._con.execute(f"SET temp_directory = {literal(os.path.join(workdir, 'spill'))}")
+        if memory_limit:
+            self._con.execute(f"SET memory_limit = {literal(memory_limit)}")
+        self._finalizer = weakref.finalize(self, _remove_workdir, self._con, workdir)
+
+    # Separate cursor per query so sessions can share one source across threads
+    def execute(self, sql):
+        return self._con.cursor().execute(sql)
+
+    def fetch_df(self, sql):
+        return self.execute(sql).df()
+
+    def fetch_one(self, sql):
+        return self.execute(sql).fetchone()
+
+    def disk_bytes(self):
+        return os.path.getsize(self.database)
+
+    # The imported table, with the hidden row id that carries the original file order
+    def frame(self):
+        return SQLFrame(self, f"SELECT rowid AS {ROW_ID}, * FROM data")
+
+    def close(self):
+        self._finalizer()
+
+
+def _remove_workdir(con, workdir):
+    con.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+# Import a CSV (a path or an uploaded file object) into a new on-disk database.
+# Uploads are spooled to disk in chunks first so DuckDB can read them in parallel.
+# Returns the source and an ingest report.
+def import_csv(source, workdir=None, memory_limit=None):
+    if not available():
+        raise RuntimeError("The out-of-core engine needs the duckdb package")
+
+    start = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix='data-assistant-', dir=workdir)
+    path = source
+    if hasattr(source, 'read'):
+        path = os.path.join(workdir, 'upload.csv')
+        source.seek(0)
+        with open(path, 'wb') as spool:
+            shutil.copyfileobj(source, spool, length=16 * 1024 ** 2)
+
+    store = DuckDBSource(workdir, memory_limit)
+    try:
+        store.execute(f"CREATE TABLE data AS SELECT * FROM read_csv_auto({literal(path)})")
+    except Exception:
+        store.close()
+        raise
+    finally:
+        if path != source:
+            os.remove(path)
+
+    rows = store.fetch_one("SELECT count(*) FROM data")[0]
+    elapsed = time.perf_counter() - start
+    report = {
+        'engine': 'duckdb',
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed > 0 else float(rows),
+        'disk_bytes': store.disk_bytes(),
+    }
+    return store, report
+
+
+class SQLFrame:
+    """A lazily evaluated query over a DuckDBSource.
+
+    Stands in for the DataFrame of the in-memory engine: it exposes the
+    schema, row count, previews and a profile, all answered by the engine.
+    The query is only run when one of those is asked for.
+    """
+
+    def __init__(self, source, sql, depth=0):
+        self.source = source
+        self.sql = sql
+        self.depth = depth
+        self._schema = None
+        self._rows = None
+
+    # (name, SQL type) pairs of the visible columns; binding the query is enough
+    @property
+    def schema(self):
+        if self._schema is None:
+            described = self.source.execute(f"DESCRIBE {self.sql}").fetchall()
+            self._schema = [(row[0], row[1]) for row in described if row[0] != ROW_ID]
+        return self._schema
+
+    @property
+    def columns(self):
+        return [name for name, _ in self.schema]
+
+    @property
+    def dtypes(self):
+        return dict(self.schema)
+
+    def __len__(self):
+        if self._rows is None:
+            self._rows = self.source.fetch_one(f"SELECT count(*) FROM ({self.sql})")[0]
+        return self._rows
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    @property
+    def empty(self):
+        return len(self) == 0 or not self.columns
+
+    def numeric_columns(self):
+        return [name for name, sql_type in self.schema if _base_type(sql_type) in NUMERIC_TYPES]
+
+    def text_columns(self):
+        return [name for name, sql_type in self.schema if _base_type(sql_type) in TEXT_TYPES]
+
+    # Query for the visible columns in row order
+    def ordered_sql(self, columns=None):
+        select = ", ".join(quote(col) for col in columns) if columns else f"* EXCLUDE ({ROW_ID})"
+        return f"SELECT {select} FROM ({self.sql}) ORDER BY {ROW_ID}"
+
+    def head(self, n=5):
+        return self.source.fetch_df(f"{self.ordered_sql()} LIMIT {int(n)}")
+
+    # Distinct values of a column in order of first appearance (like Series.unique)
+    def distinct(self, col):
+        rows = self.source.execute(
+            f"SELECT {quote(col)} FROM ({self.sql}) GROUP BY {quote(col)} ORDER BY min({ROW_ID})"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    # Number of distinct non-missing values, without fetching them
+    def distinct_count(self, col):
+        return self.source.fetch_one(f"SELECT count(DISTINCT {quote(col)}) FROM ({self.sql})")[0]
+
+    def bounds(self, col):
+        return self.source.fetch_one(f"SELECT min({quote(col)}), max({quote(col)}) FROM ({self.sql})")
+
+    # Stream the result as DataFrames of at most `batch_rows` rows
+    def iter_batches(self, batch_rows=BATCH_ROWS):
+        result = self.source.execute(self.ordered_sql())
+        reader = result.to_arrow_reader(batch_rows) if hasattr(result, 'to_arrow_reader') else \
+            result.fetch_record_batch(batch_rows)
+        for batch in reader:
+            yield batch.to_pandas()
+
+    # Write the result straight from the engine to a file in one of
+    # engine.export.EXPORT_FORMATS; Excel rows are streamed through xlsxwriter
+    def export(self, path, file_format, transformation_history=None):
+        if file_format == 'Excel':
+            write_excel(self.iter_batches(), self.columns, path, transformation_history)
+            return
+        options = {
+            'CSV': "FORMAT CSV, HEADER",
+            'CSV (gzip)': "FORMAT CSV, HEADER, COMPRESSION GZIP",
+            'Parquet': "FORMAT PARQUET",
+        }.get(file_format)
+        if options is None:
+            raise ValueError(f"Unknown export format: {file_format}")
+        self.source.execute(f"COPY ({self.ordered_sql()}) TO {literal(path)} ({options})")
+
+    # Same profile layout as engine.profile.build_profile, computed by the
+    # engine in a single scan. Quantiles and unique counts are approximate.
+    # With more than `max_pair_columns` numeric columns, the `top_k` strongest
+    # correlations come from engine.correlation on a sample of `sample_rows` rows.
+    def profile(self, preview_rows=5, max_pair_columns=None, top_k=100, sample_rows=100_000, workers=1):
+        columns = self.columns
+        numeric = self.numeric_columns()
+        text = self.text_columns()
+        wide = max_pair_columns is not None and len(numeric) > max_pair_columns
+        pairs = [] if wide else [(a, b) for i, a in enumerate(numeric) for b in numeric[i + 1:]]
+
+        aggregates = ["count(*)"] + [f"count({quote(col)})" for col in columns]
+        for col in numeric:
+            value = f"CAST({quote(col)} AS DOUBLE)"
+            aggregates += [f"avg({value})", f"stddev_samp({value})", f"min({value})",
+                           f"approx_quantile({value}, [0.25, 0.5, 0.75])", f"max({value})"]
+        aggregates += [f"approx_count_distinct({quote(col)})" for col in text]
+        aggregates += [f"corr(CAST({quote(a)} AS DOUBLE), CAST({quote(b)} AS DOUBLE))" for a, b in pairs]
+        values = iter(self.source.fetch_one(f"SELECT {', '.join(aggregates)} FROM ({self.sql})"))
+
+        rows = next(values)
+        self._rows = rows
+        counts = {col: next(values) for col in columns}
+        summary = {}
+        for col in numeric:
+            mean, std, minimum, quantiles, maximum = (next(values) for _ in range(5))
+            summary[col] = [counts[col], mean, std, minimum, *(quantiles or [None] * 3), maximum]
+        unique_counts = {col: next(values) for col in text}
+        correlations = strongest = approximate = None
+        if wide:
+            selected = ", ".join(f"CAST({quote(col)} AS DOUBLE) AS {quote(col)}" for col in numeric)
+            sample = self.source.fetch_df(
+                f"SELECT {selected} FROM ({self.sql}) USING SAMPLE reservoir({int(sample_rows)} ROWS) REPEATABLE (0)"
+            )
+            strongest = strongest_correlations(sample, numeric, top_k, workers=workers)
+            approximate = {'rows': rows, 'sample_rows': len(sample), 'pair_counts': None}
+        elif numeric:
+            matrix = pd.DataFrame(np.eye(len(numeric)), index=numeric, columns=numeric)
+            for a, b in pairs:
+                matrix.loc[a, b] = matrix.loc[b, a] = next(values)
+            correlations = matrix.astype('float64')
+
+        describe = pd.DataFrame(summary, index=DESCRIBE_INDEX, dtype='float64') if summary else \
+            pd.DataFrame({'count': [counts[col] for col in columns]}, index=columns).T
+        return {
+            'shape': (rows, len(columns)),
+            'columns': columns,
+            'dtypes': self.dtypes,
+            'describe': describe,
+            'head': self.head(preview_rows),
+            'missing': {col: rows - counts[col] for col in columns},
+            'unique_counts': unique_counts,
+            'correlations': correlations,
+            'strongest_correlations': strongest,
+            'approximate': approximate
+        }
+
+
+def _stat(frame_name, aggregate):
+    return f"(SELECT {aggregate} FROM {frame_name})"
+
+
+def _filter_condition(frame, op):
+    if op['op'] == 'fused_filter':
+        return " AND ".join(f"({_filter_condition(frame, part)})" for part in op['filters'])
+
+    if op['kind'] == 'isin':
+        column = quote(op['column'])
+        present = [value for value in op['values'] if literal(value) != 'NULL']
+        condition = f"{column} IN ({', '.join(literal(value) for value in present)})" if present else "FALSE"
+        # isin() also keeps missing values when they were selected
+        if len(present) < len(op['values']):
+            condition = f"({condition} OR {column} IS NULL)"
+        return condition
+    if op['kind'] == 'range':
+        return f"{quote(op['column'])} BETWEEN {literal(op['min'])} AND {literal(op['max'])}"
+    columns = op.get('columns') or frame.columns
+    return " AND ".join(f"{quote(col)} IS NOT NULL" for col in columns) or "TRUE"
+
+
+def _fill_expression(name, op):
+    column = quote(op['column'])
+    method = op['method']
+    if method == 'mean':
+        return _stat(name, f"avg({column})")
+    if method == 'median':
+        return _stat(name, f"median({column})")
+    if method == 'mode':
+        # Most frequent value, smallest first on ties like Series.mode()
+        return (f"(SELECT {column} FROM {name} WHERE {column} IS NOT NULL "
+                f"GROUP BY {column} ORDER BY count(*) DESC, {column} LIMIT 1)")
+    return literal(op['value'])
+
+
+def _transform_expression(name, op):
+    column = quote(op['column'])
+    method = op['method']
+    minimum, maximum = _stat(name, f"min({column})"), _stat(name, f"max({column})")
+    if method == 'normalize':
+        # Avoid division by zero
+        return f"CASE WHEN {maximum} > {minimum} THEN ({column} - {minimum}) / ({maximum} - {minimum}) ELSE {column} END"
+    if method == 'standardize':
+        mean, std = _stat(name, f"avg({column})"), _stat(name, f"stddev_samp({column})")
+        return f"CASE WHEN {std} > 0 THEN ({column} - {mean}) / {std} ELSE {column} END"
+    if method == 'log':
+        # Shift so the smallest value becomes 1 when there are zero or negative values
+        return f"CASE WHEN {minimum} <= 0 THEN ln({column} + abs({minimum}) + 1) ELSE ln({column}) END"
+    if method == 'sqrt':
+        return f"CASE WHEN {minimum} < 0 THEN sqrt({column} + abs({minimum})) ELSE sqrt({column}) END"
+    if method == 'upper':
+        return f"upper(CAST({column} AS VARCHAR))"
+    if method == 'lower':
+        return f"lower(CAST({column} AS VARCHAR))"
+    raise ValueError(f"Unknown transform: {method}")
+
+
+# SQL for a parsed engine.expressions tree; text is concatenated with ||,
+# which is NULL when either side is, like the pandas evaluation
+def _expression_sql(node, columns, numeric):
+    kind = node[0]
+    if kind == 'column':
+        return quote(node[1]) if node[1] in numeric else f"CAST({quote(node[1])} AS VARCHAR)"
+    if kind == 'literal':
+        return literal(node[1])
+    if kind == 'neg':
+        return f"(-{_expression_sql(node[1], columns, numeric)})"
+
+    if kind == 'binary':
+        left = _expression_sql(node[2], columns, numeric)
+        right = _expression_sql(node[3], columns, numeric)
+        if result_kind(node, columns, numeric) == 'text':
+            return f"({left} || {right})"
+        if node[1] == '//':
+            return f"floor({left} / {right})"
+        if node[1] == '%':
+            # Python's modulo takes the sign of the divisor
+            return f"({left} - {right} * floor({left} / {right}))"
+        if node[1] == '**':
+            return f"power({left}, {right})"
+        return f"({left} {node[1]} {right})"
+
+    args = [_expression_sql(arg, columns, numeric) for arg in node[2]]
+    if node[1] == 'str':
+        return f"CAST({args[0]} AS VARCHAR)"
+    function = {'log': 'ln'}.get(node[1], node[1])
+    return f"{function}({', '.join(args)})"
+
+
+def _derive_expression(frame, op):
+    if op['kind'] == 'arithmetic':
+        operator = {'Add': '+', 'Subtract': '-', 'Multiply': '*', 'Divide': '/'}[op['operator']]
+        return f"({quote(op['source'])} {operator} {literal(op['value'])})"
+    if op['kind'] == 'expression':
+        columns, numeric = set(frame.columns), set(frame.numeric_columns())
+        tree, _ = compile_expression(op['expression'], columns, numeric)
+        return _expression_sql(tree, columns, numeric)
+
+    columns = op['columns']
+    numeric_cols = frame.numeric_columns()
+    if all(col in numeric_cols for col in columns):
+        # Sum numeric columns, skipping missing values
+        return " + ".join(f"coalesce({quote(col)}, 0)" for col in columns)
+    # Concatenate as text with the separator, skipping missing values
+    parts = ", ".join(f"CAST({quote(col)} AS VARCHAR)" for col in columns)
+    return f"concat_ws({literal(op['separator'])}, {parts})"
+
+
+# Set a column: replace it when it exists, append it otherwise
+def _with_column(frame, column, expression):
+    if column in frame.columns:
+        return f"* REPLACE ({expression} AS {quote(column)})"
+    return f"*, {expression} AS {quote(column)}"
+
+
+# The conversion of an astype op, and the same conversion returning NULL instead of failing.
+# Text parsed as datetimes with an explicit format (other than ISO 8601) uses strptime.
+def _conversion_expressions(frame, op):
+    column = quote(op['column'])
+    fmt = op.get('format')
+    if op['dtype'] == 'datetime' and fmt and fmt != 'ISO8601' and op['column'] in frame.text_columns():
+        return f"strptime({column}, {literal(fmt)})", f"try_strptime({column}, {literal(fmt)})"
+    sql_type = SQL_TYPES.get(op['dtype'], op['dtype'])
+    return f"CAST({column} AS {sql_type})", f"TRY_CAST({column} AS {sql_type})"
+
+
+# Values that cannot be converted would only fail once rows are fetched, so check up front
+def _check_conversion(frame, op, checked):
+    column = op['column']
+    failed = frame.source.fetch_one(
+        f"SELECT count(*) FROM ({frame.sql}) WHERE {quote(column)} IS NOT NULL AND {checked} IS NULL"
+    )[0]
+    if failed:
+        raise ValueError(f"{failed:,} values in {column} cannot be converted to {op['dtype']}")
+
+
+# Compile a single (possibly fused) step into a query on top of `frame`
+def compile_step(frame, op):
+    kind = op['op']
+    name = f"step{frame.depth}"
+    select = "*"
+    where = ""
+
+    if kind in ('filter', 'fused_filter'):
+        where = f" WHERE {_filter_condition(frame, op)}"
+    elif kind == 'drop_columns':
+        columns = [col for col in op['columns'] if col in frame.columns]
+        if columns:
+            select = f"* EXCLUDE ({', '.join(quote(col) for col in columns)})"
+    elif kind == 'sort':
+        # Stable: ties keep their current order
+        direction = 'ASC' if op['ascending'] else 'DESC'
+        select = (f"* REPLACE (row_number() OVER (ORDER BY {quote(op['column'])} {direction} NULLS LAST, "
+                  f"{ROW_ID}) AS {ROW_ID})")
+    elif kind == 'one_hot':
+        column = quote(op['column'])
+        top_k = op.get('top_k')
+        if top_k:
+            # The most frequent values (ties in value order), one more to tell whether there are others
+            categories = frame.source.execute(
+                f"SELECT {column} FROM ({frame.sql}) WHERE {column} IS NOT NULL "
+                f"GROUP BY {column} ORDER BY count(*) DESC, {column} LIMIT {int(top_k) + 1}"
+            ).fetchall()
+            others = len(categories) > top_k
+            categories = sorted(categories[:top_k])
+        else:
+            categories = frame.source.execute(
+                f"SELECT DISTINCT {column} FROM ({frame.sql}) WHERE {column} IS NOT NULL ORDER BY 1"
+            ).fetchall()
+            others = False
+        prefix = op['column']
+        dummies = [f"coalesce({column} = {literal(value)}, FALSE) AS {quote(f'{prefix}_{value}')}"
+                   for (value,) in categories]
+        if others:
+            kept = ", ".join(literal(value) for (value,) in categories)
+            label = one_hot_other_label([value for (value,) in categories])
+            dummies.append(f"coalesce({column} NOT IN ({kept}), FALSE) AS {quote(f'{prefix}_{label}')}")
+        select = ", ".join([f"* EXCLUDE ({column})"] + dummies)
+    elif kind == 'fillna':
+        expression = f"coalesce({quote(op['column'])}, {_fill_expression(name, op)})"
+        select = _with_column(frame, op['column'], expression)
+    elif kind == 'transform':
+        select = _with_column(frame, op['column'], _transform_expression(name, op))
+    elif kind == 'derive':
+        select = _with_column(frame, op['column'], _derive_expression(frame, op))
+    elif kind == 'astype':
+        expression, checked = _conversion_expressions(frame, op)
+        if op.get('errors') == 'coerce':
+            # Values that cannot be converted become NULL
+            expression = checked
+        else:
+            _check_conversion(frame, op, checked)
+        select = _with_column(frame, op['column'], expression)
+    else:
+        raise ValueError(f"Unknown operation: {kind}")
+
+    step = SQLFrame(frame.source, f"WITH {name} AS ({frame.sql}) SELECT {select} FROM {name}{where}",
+                    frame.depth + 1)
+    step.schema  # bind now so type errors surface with the op that caused them
+    return step
+
+
+# Same contract as engine.plan.execute, for a SQLFrame. Nothing is fetched:
+# the result is a new query with every step pushed down into the engine.
+def execute(frame, ops, observer=None):
+    for step in optimize(ops):
+        try:
+            frame = compile_step(frame, step)
+        except Exception as e:
+            failing = step['filters'][-1] if step['op'] == 'fused_filter' else step
+            raise PlanExecutionError(failing, e) from e
+    return frame
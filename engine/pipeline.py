@@ -0,0 +1,170 @@
+"""Headless load, profile, transform and export, shared by the app and the command line.
+
+A recipe is a transformation plan saved from the app ("Download pipeline",
+see engine.plan.dumps). run_files replays one recipe over many CSV/Excel
+files on a process pool, each worker under its own memory cap, and reports
+rows and timings per file. `python -m engine` is the command-line front end.
+"""
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import pandas as pd
+
+from engine.excel import read_workbook
+from engine.export import EXPORT_FORMATS, export_dataframe
+from engine.ingest import current_rss, read_csv_chunked
+from engine.plan import describe_op, execute
+from engine.profile import build_approximate_profile, build_profile
+
+# File extensions load_table understands
+INPUT_EXTENSIONS = ('.csv', '.xlsx')
+
+SUMMARY_COLUMNS = ['input', 'output', 'status', 'rows_in', 'rows_out', 'columns',
+                   'load_seconds', 'transform_seconds', 'export_seconds', 'seconds', 'peak_rss_mb', 'error']
+
+
+# Load a CSV (streamed in chunks with compact dtypes) or an Excel workbook
+# from a path or a file object. `excel_options` go to engine.excel.read_workbook
+# (sheets, columns, workers, cache). Returns the DataFrame and an ingest report.
+def load_table(source, name=None, chunk_rows=250_000, memory_budget=None, category_max_ratio=0.5, excel_options=None):
+    name = name or getattr(source, 'name', None) or str(source)
+    if not name.lower().endswith(INPUT_EXTENSIONS):
+        raise ValueError(f"Unsupported file format: {os.path.basename(name)}")
+    if name.lower().endswith('.csv'):
+        return read_csv_chunked(source, chunk_rows=chunk_rows, memory_budget=memory_budget,
+                                category_max_ratio=category_max_ratio)
+    return read_workbook(source, category_max_ratio=category_max_ratio, **(excel_options or {}))
+
+
+# Profile an in-memory DataFrame: exact below `approx_min_rows` rows, from
+# sketches and a row sample at or above it (see engine.profile)
+def profile_table(df, preview_rows=5, stats=None, approx_min_rows=None, sample_rows=100_000,
+                  max_pair_columns=None, top_k=100, workers=1):
+    correlation = {'max_pair_columns': max_pair_columns, 'top_k': top_k, 'workers': workers}
+    if approx_min_rows is not None and len(df) >= approx_min_rows:
+        return build_approximate_profile(df, preview_rows, sample_rows, **correlation)
+    return build_profile(df, preview_rows, stats, **correlation)
+
+
+# Where the output for `path` is written: same base name, extension of the export format
+def output_path(path, output_dir, file_format):
+    base = os.path.basename(path)
+    for extension in INPUT_EXTENSIONS:
+        if base.lower().endswith(extension):
+            base = base[:-len(extension)]
+    return os.path.join(output_dir, f"{base}.{EXPORT_FORMATS[file_format][0]}")
+
+
+# Input files matching any of the glob patterns, sorted and without duplicates
+def expand_inputs(patterns):
+    found = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        found.extend(path for path in matches if os.path.isfile(path) and path.lower().endswith(INPUT_EXTENSIONS))
+    return list(dict.fromkeys(found))
+
+
+# Highest resident memory of this worker so far, in MB
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        rss = current_rss()
+        return None if rss is None else rss / 1024 ** 2
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+# Load one file, run the recipe and write the result. Failures are reported
+# in the summary row instead of raised, so one bad file does not stop a batch.
+def process_file(path, ops, output_dir, file_format='CSV', load_options=None):
+    result = dict.fromkeys(SUMMARY_COLUMNS)
+    result.update(input=path, output=output_path(path, output_dir, file_format), status='ok')
+    start = time.perf_counter()
+    stage = 'load_seconds'
+    try:
+        df, _ = load_table(path, **(load_options or {}))
+        result['rows_in'] = len(df)
+        result['load_seconds'] = time.perf_counter() - start
+
+        stage = 'transform_seconds'
+        df = execute(df, ops)
+        result['rows_out'], result['columns'] = df.shape
+        result['transform_seconds'] = time.perf_counter() - start - result['load_seconds']
+
+        stage = 'export_seconds'
+        export_dataframe(df, result['output'], file_format, [describe_op(op) for op in ops])
+        result['export_seconds'] = time.perf_counter() - start - result['load_seconds'] - result['transform_seconds']
+    except MemoryError as e:
+        result.update(status='failed', output=None, error=f"Out of memory during {stage.split('_')[0]}: {e}")
+    except Exception as e:
+        result.update(status='failed', output=None, error=f"{type(e).__name__} during {stage.split('_')[0]}: {e}")
+    result['seconds'] = time.perf_counter() - start
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+# Worker initializer: cap the address space of this process, so a file that
+# does not fit fails with MemoryError instead of taking the machine down
+def _limit_memory(limit_bytes):
+    try:
+        import resource
+    except ImportError:
+        return
+    # Import what the workers need before the cap, so it only limits data
+    import pyarrow  # noqa: F401
+    import xlsxwriter  # noqa: F401
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, hard))
+
+
+# Run the recipe over every file on a pool of `workers` processes (one per
+# CPU by default) and yield each file's summary row as soon as it is done.
+# With `memory_limit_mb`, each worker's address space is capped at that size
+# and CSV ingest stops early once the data alone would exceed it.
+def run_files(paths, ops, output_dir, file_format='CSV', workers=None, memory_limit_mb=None, load_options=None):
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {file_format}")
+    outputs = [output_path(path, output_dir, file_format) for path in paths]
+    duplicates = sorted({out for out in outputs if outputs.count(out) > 1})
+    if duplicates:
+        raise ValueError(f"Several inputs would be written to {duplicates[0]}; give the files distinct names")
+    os.makedirs(output_dir, exist_ok=True)
+
+    load_options = dict(load_options or {})
+    initializer = initargs = None
+    if memory_limit_mb:
+        load_options.setdefault('memory_budget', memory_limit_mb * 1024 ** 2)
+        initializer, initargs = _limit_memory, (memory_limit_mb * 1024 ** 2,)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths) or 1))
+    # Fresh interpreters, so workers never inherit a parent's threads or large data
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                             initializer=initializer, initargs=initargs or ()) as pool:
+        futures = [pool.submit(process_file, path, ops, output_dir, file_format, load_options) for path in paths]
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # The worker itself died, e.g. killed by the operating system
+                path = paths[futures.index(future)]
+                result = dict.fromkeys(SUMMARY_COLUMNS)
+                result.update(input=path, status='failed', error=f"Worker failed: {e}")
+                yield result
+
+
+# Write summary rows to CSV or, for a .json path, JSON
+def write_summary(results, path):
+    summary = pd.DataFrame(list(results), columns=SUMMARY_COLUMNS)
+    summary = summary.astype({'rows_in': 'Int64', 'rows_out': 'Int64', 'columns': 'Int64'})
+    summary = summary.round({name: 3 for name in SUMMARY_COLUMNS if name.endswith(('_seconds', '_mb')) or name == 'seconds'})
+    if path.lower().endswith('.json'):
+        summary.to_json(path, orient='records', indent=2)
+    else:
+        summary.to_csv(path, index=False)
+    return summary
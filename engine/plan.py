@@ -0,0 +1,379 @@
+"""Structured, replayable transformation plans.
+
+Every transformation is recorded as a plain dict (an "op") such as
+``{'op': 'sort', 'column': 'Price', 'ascending': False}``. A list of ops is
+a plan: it can be optimized, executed against any DataFrame with the same
+columns, and saved as JSON to re-apply to another file later.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+from pandas._libs.sparse import IntIndex
+
+from engine.dtypes import convert
+from engine.expressions import evaluate as evaluate_expression, join_columns, referenced_columns
+from engine.snapshots import working_copy
+
+PLAN_FORMAT_VERSION = 1
+
+# Marker for ops whose read/write set depends on the data (e.g. one-hot encoding)
+ALL_COLUMNS = object()
+
+# One-hot indicator for the values outside the `top_k` most frequent ones
+ONE_HOT_OTHER = 'other'
+
+ARITHMETIC = {
+    'Add': lambda series, value: series + value,
+    'Subtract': lambda series, value: series - value,
+    'Multiply': lambda series, value: series * value,
+    'Divide': lambda series, value: series / value,
+}
+
+
+# Raised when an op cannot be applied to the data; keeps the failing op for the UI
+class PlanExecutionError(Exception):
+    def __init__(self, op, error):
+        super().__init__(f"{describe_op(op)}: {error}")
+        self.op = op
+        self.error = error
+
+
+# Human-readable description of an op, used for the transformation history
+def describe_op(op):
+    kind = op['op']
+    if kind == 'filter':
+        if op['kind'] == 'isin':
+            return f"Filtered {op['column']} to keep only {', '.join(map(str, op['values']))}"
+        if op['kind'] == 'range':
+            return f"Filtered {op['column']} to range {op['min']} - {op['max']}"
+        if op.get('columns'):
+            return f"Dropped rows with missing values in columns: {', '.join(op['columns'])}"
+        return "Dropped all rows with any missing values"
+    if kind == 'drop_columns':
+        return f"Removed columns: {', '.join(op['columns'])}"
+    if kind == 'fillna':
+        method = {'mean': 'mean', 'median': 'median', 'mode': 'most frequent value'}.get(op['method'])
+        if method:
+            return f"Filled missing values in {op['column']} with {method}"
+        return f"Filled missing values in {op['column']} with custom value ({op['value']})"
+    if kind == 'derive':
+        if op['kind'] == 'arithmetic':
+            return f"Created new column '{op['column']}' = {op['source']} {op['operator']} {op['value']}"
+        if op['kind'] == 'expression':
+            return f"Created new column '{op['column']}' = {op['expression']}"
+        return f"Created new column '{op['column']}' from combination of {', '.join(op['columns'])}"
+    if kind == 'transform':
+        return {
+            'normalize': f"Normalized {op['column']} to range 0-1",
+            'standardize': f"Standardized {op['column']} (z-score)",
+            'log': f"Applied log transform to {op['column']}",
+            'sqrt': f"Applied square root transform to {op['column']}",
+            'upper': f"Converted {op['column']} to uppercase",
+            'lower': f"Converted {op['column']} to lowercase",
+        }[op['method']]
+    if kind == 'one_hot':
+        if op.get('top_k'):
+            return f"One-hot encoded {op['column']} (top {op['top_k']} values, the rest as {ONE_HOT_OTHER})"
+        return f"One-hot encoded {op['column']}"
+    if kind == 'astype':
+        text = f"Changed data type of {op['column']} to {op['dtype']}"
+        if op.get('format'):
+            text += f" (format {op['format']})"
+        if op.get('errors') == 'coerce':
+            text += ", values that could not be converted set to missing"
+        return text
+    if kind == 'sort':
+        return f"Sorted data by {op['column']} in {'ascending' if op['ascending'] else 'descending'} order"
+    if kind == 'fused_filter':
+        return " and ".join(describe_op(part) for part in op['filters'])
+    return kind
+
+
+# Columns an op reads; ALL_COLUMNS when it depends on every column
+def _reads(op):
+    kind = op['op']
+    if kind == 'filter':
+        if op['kind'] == 'notna':
+            return set(op['columns']) if op.get('columns') else ALL_COLUMNS
+        return {op['column']}
+    if kind == 'derive':
+        if op['kind'] == 'expression':
+            return set(referenced_columns(op['expression']))
+        return {op['source']} if op['kind'] == 'arithmetic' else set(op['columns'])
+    if kind == 'drop_columns':
+        return set()
+    return {op['column']}
+
+
+# Columns an op adds, modifies or removes; ALL_COLUMNS when that depends on the data
+def _writes(op):
+    kind = op['op']
+    if kind in ('filter', 'sort'):
+        return set()
+    if kind == 'one_hot':
+        return ALL_COLUMNS
+    if kind == 'drop_columns':
+        return set(op['columns'])
+    return {op['column']}
+
+
+def _overlaps(columns, other):
+    return columns is ALL_COLUMNS or other is ALL_COLUMNS or bool(columns & other)
+
+
+# An earlier sort is superseded by a later (stable) sort on the same column,
+# as long as nothing in between rewrites that column
+def _remove_superseded_sorts(ops):
+    kept = []
+    for i, op in enumerate(ops):
+        if op['op'] == 'sort':
+            superseded = False
+            for later in ops[i + 1:]:
+                if later['op'] == 'sort' and later['column'] == op['column']:
+                    superseded = True
+                    break
+                if _overlaps(_writes(later), {op['column']}):
+                    break
+            if superseded:
+                continue
+        kept.append(op)
+    return kept
+
+
+# Move column drops ahead of every op that does not use the dropped columns,
+# merging neighbouring drops, so later steps work on narrower frames
+def _push_down_drops(ops):
+    result = []
+    for op in ops:
+        if op['op'] != 'drop_columns':
+            result.append(op)
+            continue
+
+        dropped = set(op['columns'])
+        position = len(result)
+        while position > 0:
+            previous = result[position - 1]
+            if previous['op'] == 'drop_columns':
+                break
+            if _overlaps(_reads(previous), dropped) or _overlaps(_writes(previous), dropped):
+                break
+            position -= 1
+
+        if position > 0 and result[position - 1]['op'] == 'drop_columns':
+            merged = result[position - 1]
+            merged = {**merged, 'columns': merged['columns'] + [c for c in op['columns'] if c not in merged['columns']]}
+            result[position - 1] = merged
+        else:
+            result.insert(position, op)
+    return result
+
+
+# Consecutive row filters are evaluated as one combined mask
+def _fuse_filters(ops):
+    result = []
+    for op in ops:
+        if op['op'] == 'filter' and result and result[-1]['op'] in ('filter', 'fused_filter'):
+            previous = result.pop()
+            parts = previous['filters'] if previous['op'] == 'fused_filter' else [previous]
+            result.append({'op': 'fused_filter', 'filters': parts + [op]})
+        else:
+            result.append(op)
+    return result
+
+
+# Rewrite a plan into an equivalent, cheaper sequence of steps
+def optimize(ops):
+    ops = _remove_superseded_sorts(list(ops))
+    ops = _push_down_drops(ops)
+    return _fuse_filters(ops)
+
+
+# `indexes` (engine.indexes.ColumnIndexes for `df`) answers isin and range
+# filters without scanning the column
+def _filter_mask(df, op, indexes=None):
+    if op['op'] == 'fused_filter':
+        mask = np.ones(len(df), dtype=bool)
+        for part in op['filters']:
+            mask &= _filter_mask(df, part, indexes).to_numpy(dtype=bool)
+        return pd.Series(mask, index=df.index)
+
+    if indexes is not None and op['kind'] in ('isin', 'range'):
+        mask = indexes.filter_mask(op)
+        if mask is not None:
+            return mask
+    if op['kind'] == 'isin':
+        return df[op['column']].isin(op['values'])
+    if op['kind'] == 'range':
+        series = df[op['column']]
+        return (series >= op['min']) & (series <= op['max'])
+    columns = op.get('columns') or list(df.columns)
+    return df[columns].notna().all(axis=1)
+
+
+def _fill_value(series, op):
+    method = op['method']
+    if method == 'mean':
+        return series.mean()
+    if method == 'median':
+        return series.median()
+    if method == 'mode':
+        return series.mode()[0]
+    return op['value']
+
+
+def _transform_column(series, method):
+    if method == 'normalize':
+        min_val, max_val = float(series.min()), float(series.max())
+        # Avoid division by zero
+        return (series - min_val) / (max_val - min_val) if max_val > min_val else series
+    if method == 'standardize':
+        mean, std = series.mean(), series.std()
+        return (series - mean) / std if std > 0 else series
+    if method == 'log':
+        # Shift so the smallest value becomes 1 when there are zero or negative values
+        min_val = float(series.min())
+        return np.log(series + abs(min_val) + 1) if min_val <= 0 else np.log(series)
+    if method == 'sqrt':
+        min_val = float(series.min())
+        return np.sqrt(series + abs(min_val)) if min_val < 0 else np.sqrt(series)
+    if method == 'upper':
+        return series.astype(str).str.upper()
+    if method == 'lower':
+        return series.astype(str).str.lower()
+    raise ValueError(f"Unknown transform: {method}")
+
+
+# Label of the "other" indicator; parenthesized if a kept value is already called that
+def one_hot_other_label(kept):
+    return f"({ONE_HOT_OTHER})" if ONE_HOT_OTHER in {str(value) for value in kept} else ONE_HOT_OTHER
+
+
+# One-hot indicator columns named like pd.get_dummies, built from the codes
+# of the column's values. Each is a sparse boolean column that only stores the
+# rows where it is True, so memory grows with the rows, not rows x values.
+# With `top_k`, only the most frequent values (ties in value order) get a
+# column of their own and all other values share the "other" column.
+def _one_hot_columns(series, prefix, top_k=None):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, labels = series.cat.codes.to_numpy(), list(series.cat.categories)
+    else:
+        try:
+            codes, labels = pd.factorize(series, sort=True)
+        except TypeError:
+            # Values that cannot be sorted (e.g. mixed text and numbers) keep their order of appearance
+            codes, labels = pd.factorize(series)
+        labels = list(labels)
+
+    if top_k and len(labels) > top_k:
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        kept = np.sort(np.argsort(-counts, kind='stable')[:top_k])
+        recode = np.full(len(labels), len(kept), dtype=np.int64)
+        recode[kept] = np.arange(len(kept))
+        codes = np.where(codes >= 0, recode[codes], -1)
+        labels = [labels[i] for i in kept]
+        labels.append(one_hot_other_label(labels))
+
+    # Rows grouped by code, each group in row order (missing values, -1, come first)
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+    dtype = pd.SparseDtype(bool, False)
+    columns = {}
+    for code, label in enumerate(labels):
+        rows = order[bounds[code]:bounds[code + 1]]
+        columns[f"{prefix}_{label}"] = pd.arrays.SparseArray(
+            np.ones(len(rows), dtype=bool), sparse_index=IntIndex(len(series), rows), dtype=dtype
+        )
+    return pd.DataFrame(columns, index=series.index)
+
+
+def _derive_column(df, op):
+    if op['kind'] == 'arithmetic':
+        return ARITHMETIC[op['operator']](df[op['source']], op['value'])
+    if op['kind'] == 'expression':
+        return evaluate_expression(df, op['expression'])
+
+    columns = op['columns']
+    numeric_cols = df.select_dtypes(include=np.number).columns
+    if all(col in numeric_cols for col in columns):
+        # Sum numeric columns
+        return df[columns].sum(axis=1)
+    # Concatenate as text with the separator, skipping missing values
+    return join_columns(df, columns, op['separator'])
+
+
+# Apply a single (possibly fused) step.
+# Returns the new frame and its effect: {'mask': kept rows} for filters or
+# {'touched': columns} for everything else.
+def run_step(df, op, indexes=None):
+    kind = op['op']
+    if kind in ('filter', 'fused_filter'):
+        mask = _filter_mask(df, op, indexes)
+        return df[mask], {'mask': mask}
+
+    if kind == 'drop_columns':
+        columns = [col for col in op['columns'] if col in df.columns]
+        return df.drop(columns=columns), {'touched': columns}
+
+    if kind == 'sort':
+        return df.sort_values(by=op['column'], ascending=op['ascending'], kind='stable'), {'touched': []}
+
+    if kind == 'one_hot':
+        one_hot = _one_hot_columns(df[op['column']], op['column'], op.get('top_k'))
+        new_df = pd.concat([df.drop(columns=[op['column']]), one_hot], axis=1)
+        return new_df, {'touched': [op['column']] + one_hot.columns.tolist()}
+
+    new_df = working_copy(df)
+    column = op['column']
+    if kind == 'fillna':
+        series = df[column]
+        value = _fill_value(series, op)
+        # Category columns need a new fill value registered first
+        if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+            series = series.cat.add_categories([value])
+        new_df[column] = series.fillna(value)
+    elif kind == 'transform':
+        new_df[column] = _transform_column(df[column], op['method'])
+    elif kind == 'derive':
+        new_df[column] = _derive_column(df, op)
+    elif kind == 'astype':
+        new_df[column] = convert(df[column], op['dtype'], op.get('format'), op.get('errors', 'raise'))
+    else:
+        raise ValueError(f"Unknown operation: {kind}")
+    return new_df, {'touched': [column]}
+
+
+# Execute a plan lazily built from ops. `observer(before, after, effect)` is
+# called after every step, e.g. to keep column statistics in sync. `indexes`
+# of the input frame serve the filters that run before anything else changes it.
+def execute(df, ops, observer=None, indexes=None):
+    for step in optimize(ops):
+        try:
+            new_df, effect = run_step(df, step, indexes if indexes is not None and indexes.df is df else None)
+        except Exception as e:
+            failing = step['filters'][-1] if step['op'] == 'fused_filter' else step
+            raise PlanExecutionError(failing, e) from e
+        if observer is not None:
+            observer(df, new_df, effect)
+        df = new_df
+    return df
+
+
+def _to_builtin(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+# Serialize a plan so it can be re-applied to another file
+def dumps(ops):
+    return json.dumps({'version': PLAN_FORMAT_VERSION, 'ops': list(ops)}, default=_to_builtin, indent=2)
+
+
+def loads(text):
+    data = json.loads(text)
+    if not isinstance(data, dict) or data.get('version') != PLAN_FORMAT_VERSION or 'ops' not in data:
+        raise ValueError("Not a saved transformation pipeline")
+    return data['ops']
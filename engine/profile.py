@@ -0,0 +1,238 @@
+"""Dataset profiling used by the AI prompt and the data preview."""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from engine.correlation import strongest_correlations
+from engine.sketches import HyperLogLog, QuantileSketch, ReservoirSample, correlation_interval
+from engine.sparse import densify, missing_counts
+from engine.stats import CHUNK_ROWS, DESCRIBE_INDEX, ColumnStatsStore, _merge_moments, _moments, is_numeric_column
+
+# Dtypes treated as text/categorical columns (includes pandas string dtypes from compact ingest)
+TEXT_DTYPES = ['object', 'category', 'string']
+
+
+# Fingerprint raw file contents so the same upload always maps to the same key
+def file_fingerprint(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Assemble every column statistic the app shows or sends to Gemini.
+# 'describe' and 'correlations' are DataFrames; profile_to_text and
+# engine.prompt render them.
+# Pass the session's ColumnStatsStore so only columns changed since the last
+# transformation are rescanned. Tables too wide for a correlation matrix
+# (see ColumnStatsStore's max_pair_columns) list their `top_k` strongest
+# pairs in 'strongest_correlations' instead.
+def build_profile(df, preview_rows=5, stats=None, max_pair_columns=None, top_k=100, workers=1):
+    if stats is None:
+        stats = ColumnStatsStore(df, max_pair_columns)
+    cat_cols = df.select_dtypes(include=TEXT_DTYPES).columns
+
+    profile = {
+        'shape': df.shape,
+        'columns': df.columns.tolist(),
+        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+        'describe': stats.describe(),
+        'head': densify(df.head(preview_rows)),
+        'missing': stats.missing(),
+        'unique_counts': stats.unique_counts(cat_cols),
+        'correlations': None,
+        'strongest_correlations': None
+    }
+
+    numeric = stats.numeric_columns()
+    if numeric and stats.tracks_pairs:
+        profile['correlations'] = stats.correlations()
+    elif numeric:
+        profile['strongest_correlations'] = strongest_correlations(df, numeric, top_k, workers=workers)
+
+    return profile
+
+
+# Correlations of the numeric columns in a row sample, and the number of rows behind each pair
+def _sampled_correlations(sample, columns):
+    values = sample[columns].to_numpy(dtype='float64', na_value=np.nan)
+    present = (~np.isnan(values)).astype('float64')
+    pair_counts = pd.DataFrame(present.T @ present, index=columns, columns=columns).astype('int64')
+    return sample[columns].astype('float64').corr(), pair_counts
+
+
+# (a, b, r, rows) for pairs of a correlation matrix (every pair by default);
+# rows comes from `pair_counts` and is None without it
+def matrix_pairs(correlations, pairs=None, pair_counts=None):
+    if pairs is None:
+        columns = correlations.columns.tolist()
+        pairs = [(a, b) for i, a in enumerate(columns) for b in columns[i + 1:]]
+    return [
+        (a, b, correlations.loc[a, b], None if pair_counts is None else int(pair_counts.loc[a, b]))
+        for a, b in pairs
+    ]
+
+
+# One "A ~ B: r" line per (a, b, r, rows) pair; with `intervals`, followed by
+# the 95% confidence interval and the rows behind it
+def correlation_lines(pairs, intervals=False):
+    lines = []
+    for a, b, r, n in pairs:
+        if np.isnan(r):
+            lines.append(f"{a} ~ {b}: n/a")
+        elif intervals:
+            low, high = correlation_interval(r, n)
+            lines.append(f"{a} ~ {b}: {r:.2f} (95% CI {low:.2f} to {high:.2f}, n={n:,})")
+        else:
+            lines.append(f"{a} ~ {b}: {r:.2f}")
+    return lines
+
+
+# Seconds since the epoch as floats, NaN where the timestamp is missing
+def _epoch_seconds(series):
+    offsets = series - pd.Timestamp(0, tz=series.dt.tz)
+    return offsets.dt.total_seconds().to_numpy(dtype='float64', na_value=np.nan)
+
+
+# Same layout as build_profile, from one streaming pass over the rows.
+# Counts, missing values, mean, std, min and max are exact; quartiles come
+# from streaming quantile sketches, unique counts from HyperLogLog sketches
+# (exact for category columns) and correlations from a uniform row sample.
+def build_approximate_profile(df, preview_rows=5, sample_rows=100_000, chunk_rows=CHUNK_ROWS, seed=0,
+                              max_pair_columns=None, top_k=100, workers=1):
+    numeric = [col for col in df.columns if is_numeric_column(df[col])]
+    dates = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+    text = df.select_dtypes(include=TEXT_DTYPES).columns.tolist()
+    categories = [col for col in text if isinstance(df[col].dtype, pd.CategoricalDtype)]
+
+    missing = dict.fromkeys(df.columns, 0)
+    moments = {col: (0, np.nan, 0.0) for col in numeric + dates}
+    extremes = {col: (np.inf, -np.inf) for col in numeric + dates}
+    quantiles = {col: QuantileSketch() for col in numeric + dates}
+    distinct = {col: HyperLogLog() for col in text if col not in categories}
+    reservoir = ReservoirSample(sample_rows, seed)
+
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        reservoir.update(len(chunk))
+        for col, count in missing_counts(chunk).items():
+            missing[col] += count
+        for col in numeric + dates:
+            series = chunk[col]
+            values = _epoch_seconds(series) if col in dates else series.to_numpy(dtype='float64', na_value=np.nan)
+            moments[col] = _merge_moments(*moments[col], *_moments(values))
+            if not np.isnan(values).all():
+                low, high = extremes[col]
+                extremes[col] = (min(low, np.nanmin(values)), max(high, np.nanmax(values)))
+            quantiles[col].update(values)
+        for col, sketch in distinct.items():
+            sketch.update(chunk[col])
+
+    summary = {}
+    for col in df.columns:
+        if col not in moments:
+            continue
+        n, mean, m2 = moments[col]
+        low, high = extremes[col] if n else (np.nan, np.nan)
+        values = [mean, low, *quantiles[col].quantiles([0.25, 0.5, 0.75]), high]
+        std = float(np.sqrt(m2 / (n - 1))) if n > 1 else np.nan
+        if col in dates:
+            tz = df[col].dt.tz
+            values = [pd.NaT if np.isnan(v) else pd.Timestamp(v, unit='s', tz=tz) for v in values]
+            std = np.nan
+        summary[col] = [n, values[0], std, *values[1:]]
+
+    unique_counts = {}
+    for col in text:
+        if col in categories:
+            codes = df[col].cat.codes.to_numpy()
+            unique_counts[col] = int(np.count_nonzero(np.bincount(codes[codes >= 0], minlength=1)))
+        else:
+            unique_counts[col] = distinct[col].estimate()
+
+    if summary:
+        describe = pd.DataFrame(summary, index=DESCRIBE_INDEX)
+    else:
+        describe = pd.DataFrame(
+            {col: [len(df) - missing[col], unique_counts.get(col, np.nan)] for col in df.columns},
+            index=['count', 'unique']
+        )
+
+    correlations = pair_counts = strongest = None
+    numeric = [col for col in df.columns if col in numeric]
+    if numeric:
+        sample = df.iloc[reservoir.positions]
+        if max_pair_columns is None or len(numeric) <= max_pair_columns:
+            correlations, pair_counts = _sampled_correlations(sample, numeric)
+        else:
+            strongest = strongest_correlations(sample, numeric, top_k, workers=workers)
+
+    return {
+        'shape': df.shape,
+        'columns': df.columns.tolist(),
+        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+        'describe': describe,
+        'head': densify(df.head(preview_rows)),
+        'missing': missing,
+        'unique_counts': unique_counts,
+        'correlations': correlations,
+        'strongest_correlations': strongest,
+        'approximate': {
+            'rows': len(df),
+            'sample_rows': min(len(df), sample_rows),
+            'pair_counts': pair_counts
+        }
+    }
+
+
+# Render a profile as the DataFrame description embedded in the prompt
+def profile_to_text(profile):
+    approximate = profile.get('approximate')
+    info_parts = [
+        "DataFrame Information:",
+        f"- Shape: {profile['shape']}",
+        f"- Columns: {profile['columns']}",
+        f"- Data types: {profile['dtypes']}",
+        "\nStatistical Summary (approximate quartiles):" if approximate else "\nStatistical Summary:",
+        profile['describe'].to_string(),
+        "\nFirst 5 rows:",
+        profile['head'].to_string(),
+        "\nMissing Values:",
+        str(profile['missing'])
+    ]
+
+    # Add categorical info if exists
+    if profile['unique_counts']:
+        info_parts.extend([
+            "\nApproximate Unique Values (for categorical columns):" if approximate else "\nUnique Values (for categorical columns):",
+            ", ".join(f"{col}: {count} unique values" for col, count in profile['unique_counts'].items())
+        ])
+
+    # Add correlations if numeric columns exist
+    sampled = f", from a sample of {approximate['sample_rows']:,} rows" if approximate else ""
+    strongest = profile.get('strongest_correlations')
+    if profile['correlations'] is not None:
+        info_parts.extend([
+            f"\nCorrelations (for numeric columns{sampled}):",
+            "\n".join(correlation_lines(matrix_pairs(profile['correlations'], pair_counts=approximate['pair_counts']), True))
+            if approximate else profile['correlations'].round(2).to_string()
+        ])
+    elif strongest is not None:
+        info_parts.extend([
+            f"\nStrongest correlations (top {len(strongest)} pairs of numeric columns{sampled}):",
+            "\n".join(correlation_lines(strongest, bool(approximate)))
+        ])
+    else:
+        info_parts.append("\nCorrelations: No numeric columns for correlation")
+
+    if approximate:
+        info_parts.append(
+            f"\nNote: this profile of {approximate['rows']:,} rows is approximate. Counts, means, "
+            "standard deviations, minimums and maximums are exact; quartiles, unique counts and "
+            "correlations are estimates."
+        )
+
+    return "\n".join(info_parts)
+
+
+# Columns that currently contain at least one missing value
+def columns_with_missing(profile):
+    return [col for col, count in profile['missing'].items() if count > 0]
@@ -0,0 +1,208 @@
+"""Token-budgeted rendering of a dataset profile for the model prompt.
+
+Small tables are described in full by engine.profile.profile_to_text. Wide
+tables are compressed to fit the budget: the columns most relevant to the
+question are kept, their statistics are written as one compact row each, and
+only the strongest correlations are listed.
+"""
+import re
+import time
+
+import numpy as np
+
+from engine.profile import correlation_lines, matrix_pairs, profile_to_text
+
+# Rough size of a token for English text and numbers
+CHARS_PER_TOKEN = 4
+
+STAT_COLUMNS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _words(text):
+    return set(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+
+# Whether the question names the column as a whole word
+def _mentions(question, col):
+    pattern = rf"(?<![a-z0-9]){re.escape(str(col).lower())}(?![a-z0-9])"
+    return re.search(pattern, question.lower()) is not None
+
+
+# Cheap upper estimate of profile_to_text's length, so wide tables are never rendered in full
+def _full_size(profile):
+    columns = len(profile['columns'])
+    numeric = 0 if profile['correlations'] is None else len(profile['correlations'].columns)
+    name_width = max((len(str(col)) for col in profile['columns']), default=0)
+    return columns * (2 * name_width + 30) + columns * 8 * 14 + numeric * numeric * 8
+
+
+# Columns ordered by relevance to the question: columns named in the question
+# first, then the columns whose name shares words with it, then the most
+# informative ones (missing values and spread first, constant columns last)
+def rank_columns(profile, question):
+    question_words = _words(question)
+    rows = max(profile['shape'][0], 1)
+    summary = profile['describe'].to_dict()
+
+    def score(col):
+        named = _mentions(question, col)
+        shared = len(_words(col) & question_words) / max(len(_words(col)), 1)
+        missing = profile['missing'].get(col, 0) / rows
+        spread = 0.0
+        if 'std' in summary.get(col, {}):
+            std, mean = summary[col]['std'], summary[col]['mean']
+            try:
+                spread = float(std) / (abs(float(mean)) + float(std))
+            except (TypeError, ValueError, ZeroDivisionError):
+                spread = 0.0
+            spread = 0.0 if np.isnan(spread) else spread
+        elif col in profile['unique_counts']:
+            spread = min(profile['unique_counts'][col] / rows, 1.0)
+        return (named, shared, missing + spread)
+
+    return sorted(profile['columns'], key=score, reverse=True)
+
+
+# The k strongest correlations as (a, b) pairs, ordered by |r|. Up to half of
+# them are reserved for pairs touching a preferred column (those named in the question).
+def top_correlations(correlations, k, preferred=()):
+    columns = correlations.columns.tolist()
+    left, right = np.triu_indices(len(columns), k=1)
+    strength = np.abs(correlations.to_numpy(dtype='float64')[left, right])
+    valid = ~np.isnan(strength)
+    left, right, strength = left[valid], right[valid], strength[valid]
+
+    flags = np.isin(np.arange(len(columns)), [columns.index(col) for col in preferred if col in columns])
+    touching = flags[left] | flags[right]
+    order = np.argsort(-strength, kind='stable')
+    chosen = order[touching[order]][:k // 2] if preferred else order[:0]
+    rest = order[~np.isin(order, chosen)][:k - len(chosen)]
+    chosen = np.concatenate([chosen, rest])
+    chosen = chosen[np.argsort(-strength[chosen], kind='stable')]
+    return [(columns[left[i]], columns[right[i]]) for i in chosen]
+
+
+def _format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else f"{value:.4g}"
+    if isinstance(value, (int, np.integer)):
+        return str(value)
+    text = str(value)
+    return "" if text in ("NaT", "nan", "<NA>") else text
+
+
+# One pipe-separated row per column: name, dtype, missing, unique and the describe() statistics
+def compact_rows(profile, columns):
+    describe = profile['describe']
+    stats = [name for name in STAT_COLUMNS if name in describe.index]
+    summary = describe.to_dict()
+    header = "|".join(["column", "dtype", "missing", "unique", *stats])
+    rows = []
+    for col in columns:
+        values = [summary[col].get(name) if col in summary else None for name in stats]
+        rows.append("|".join([
+            str(col),
+            profile['dtypes'][col],
+            str(profile['missing'].get(col, 0)),
+            _format_value(profile['unique_counts'].get(col)),
+            *(_format_value(value) for value in values)
+        ]))
+    return header, rows
+
+
+# Compact description of a wide table, filled in relevance order until the budget is used up
+def compress_profile(profile, question, token_budget, top_k=20):
+    approximate = profile.get('approximate')
+    ranked = rank_columns(profile, question)
+    named = [col for col in ranked if _mentions(question, col)]
+
+    parts = [
+        "DataFrame Information (compressed: wide table, only the columns most relevant to the question):",
+        f"- Shape: {profile['shape']}",
+    ]
+    if approximate:
+        parts.append(f"- Approximate profile of {approximate['rows']:,} rows; "
+                     "quartiles, unique counts and correlations are estimates")
+
+    pairs = []
+    if profile['correlations'] is not None and top_k:
+        chosen = top_correlations(profile['correlations'], top_k, named)
+        pairs = matrix_pairs(profile['correlations'], chosen, approximate['pair_counts'] if approximate else None)
+    elif profile.get('strongest_correlations') and top_k:
+        # Already strongest first; pairs touching a named column move ahead of the rest
+        pairs = sorted(profile['strongest_correlations'], key=lambda pair: not set(pair[:2]) & set(named))[:top_k]
+
+    correlation_part = []
+    if pairs:
+        # Columns strongly correlated with a named column are described right after it
+        partners = [col for pair in pairs if set(pair[:2]) & set(named) for col in pair[:2]]
+        lead = list(dict.fromkeys(named + partners))
+        ranked = lead + [col for col in ranked if col not in lead]
+        title = f"\nStrongest correlations (top {len(pairs)})"
+        if approximate:
+            title += f", from a sample of {approximate['sample_rows']:,} rows"
+        correlation_part = [title + ":", *correlation_lines(pairs, bool(approximate))]
+
+    header, rows = compact_rows(profile, ranked)
+    used = estimate_tokens("\n".join(parts + correlation_part)) + estimate_tokens(header) + 40
+    included = []
+    for col, row in zip(ranked, rows):
+        cost = estimate_tokens(row) + 1
+        if included and used + cost > token_budget:
+            break
+        included.append((col, row))
+        used += cost
+    columns = [col for col, _ in included]
+
+    parts += [f"\nColumn summary ({len(columns)} of {len(ranked)} columns):", header]
+    parts += [row for _, row in included]
+
+    # Sample rows of the included columns, if they still fit
+    sample = profile['head'][columns[:20]].to_string()
+    if used + estimate_tokens(sample) < token_budget:
+        parts += [f"\nFirst {len(profile['head'])} rows (first {min(len(columns), 20)} columns above):", sample]
+        used += estimate_tokens(sample)
+
+    parts += correlation_part
+
+    # Names of the columns left out, as many as fit
+    others = [str(col) for col in ranked[len(columns):]]
+    if others:
+        listed = []
+        for name in others:
+            used += estimate_tokens(name) + 1
+            if used > token_budget:
+                break
+            listed.append(name)
+        if len(listed) < len(others):
+            listed.append(f"{len(others) - len(listed)} more")
+        parts.append(f"\nOther columns ({len(others)}): {', '.join(listed)}")
+
+    return "\n".join(parts), columns
+
+
+# The profile text for one question, within `token_budget` tokens where possible.
+# Returns the text and a report of its size, the columns kept and the build time.
+def build_context(profile, question, token_budget, top_k=20):
+    started = time.perf_counter()
+    text, columns = None, profile['columns']
+    if _full_size(profile) <= 4 * token_budget * CHARS_PER_TOKEN:
+        text = profile_to_text(profile)
+    compressed = text is None or estimate_tokens(text) > token_budget
+    if compressed:
+        text, columns = compress_profile(profile, question, token_budget, top_k)
+    return text, {
+        'characters': len(text),
+        'tokens': estimate_tokens(text),
+        'token_budget': token_budget,
+        'compressed': compressed,
+        'columns': len(columns),
+        'total_columns': len(profile['columns']),
+        'seconds': time.perf_counter() - started
+    }
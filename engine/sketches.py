@@ -0,0 +1,124 @@
+"""Streaming sketches for approximate profiling of very large datasets."""
+import numpy as np
+import pandas as pd
+
+
+class ReservoirSample:
+    """Uniform sample of `size` row positions from a stream of rows (Algorithm R).
+
+    Rows are fed in chunks with `update(n_rows)`; `positions` holds the
+    sampled row numbers in ascending order.
+    """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seen = 0
+        self._reservoir = np.empty(size, dtype='int64')
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, n_rows):
+        start = self.seen
+        fill = min(max(self.size - start, 0), n_rows)
+        self._reservoir[start:start + fill] = np.arange(start, start + fill)
+
+        # Row t replaces a random slot with probability size / (t + 1); later rows win on collisions
+        rows = np.arange(start + fill, start + n_rows)
+        if rows.size:
+            slots = (self._rng.random(rows.size) * (rows + 1)).astype('int64')
+            keep = slots < self.size
+            self._reservoir[slots[keep]] = rows[keep]
+        self.seen += n_rows
+
+    @property
+    def positions(self):
+        return np.sort(self._reservoir[:min(self.seen, self.size)])
+
+
+def _bit_length(values):
+    # Exact for uint64: each 32-bit half converts to float64 without rounding
+    high = (values >> np.uint64(32)).astype('float64')
+    low = (values & np.uint64(0xFFFFFFFF)).astype('float64')
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+class HyperLogLog:
+    """Cardinality sketch with 2**precision registers (about 1.04 / sqrt(2**precision) relative error)."""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype='uint8')
+
+    # Add the non-missing values of a Series
+    def update(self, series):
+        series = series.dropna()
+        if len(series) == 0:
+            return
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy(dtype='uint64')
+        index = (hashes >> np.uint64(64 - self.precision)).astype('int64')
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # Position of the first set bit in the remaining 64 - precision bits
+        rank = (64 - self.precision) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype('uint8'))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(2.0 ** -self.registers.astype('float64'))
+        empty = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        if raw <= 2.5 * m and empty:
+            return int(round(m * np.log(m / empty)))
+        return int(round(raw))
+
+
+class QuantileSketch:
+    """Mergeable quantile summary: weighted points, compacted to `size` points.
+
+    Each chunk contributes `size` evenly spaced order statistics weighted by
+    the rows they stand for, so the rank error stays around 1 / size.
+    """
+
+    def __init__(self, size=512):
+        self.size = size
+        self.values = np.empty(0)
+        self.weights = np.empty(0)
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        if values.size <= self.size:
+            points, weights = values, np.ones(values.size)
+        else:
+            points = np.quantile(values, (np.arange(self.size) + 0.5) / self.size)
+            weights = np.full(self.size, values.size / self.size)
+        self.values = np.concatenate([self.values, points])
+        self.weights = np.concatenate([self.weights, weights])
+        if self.values.size > 8 * self.size:
+            self._compact()
+
+    def _compact(self):
+        order = np.argsort(self.values, kind='stable')
+        values, weights = self.values[order], self.weights[order]
+        total = weights.sum()
+        targets = (np.arange(self.size) + 0.5) / self.size * total
+        self.values = values[np.searchsorted(np.cumsum(weights), targets)]
+        self.weights = np.full(self.size, total / self.size)
+
+    def quantiles(self, qs):
+        if self.values.size == 0:
+            return [np.nan] * len(qs)
+        order = np.argsort(self.values, kind='stable')
+        values, weights = self.values[order], self.weights[order]
+        # Midpoint CDF of the weighted points, interpolated like numpy's linear method
+        cdf = (np.cumsum(weights) - weights / 2) / weights.sum()
+        return list(np.interp(qs, cdf, values))
+
+
+# Pearson correlation with a 95% confidence interval from the Fisher z-transform
+def correlation_interval(r, n, z_critical=1.959964):
+    if n <= 3 or not np.isfinite(r):
+        return np.nan, np.nan
+    z = np.arctanh(np.clip(r, -0.999999, 0.999999))
+    half_width = z_critical / np.sqrt(n - 3)
+    return float(np.tanh(z - half_width)), float(np.tanh(z + half_width))
@@ -0,0 +1,192 @@
+"""Copy-on-write DataFrame snapshots with multi-level undo/redo."""
+import itertools
+import threading
+
+import numpy as np
+import pandas as pd
+
+_versions = itertools.count(1)
+
+
+# Shallow DataFrame copies only share column buffers safely with copy-on-write enabled.
+# It is always on from pandas 3.0; earlier versions need the option.
+def enable_copy_on_write():
+    if int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+
+
+# A working copy that shares every column with `frame`; columns written to it
+# are materialized on assignment, everything else stays shared
+def working_copy(frame):
+    return frame.copy(deep=False)
+
+
+# Addresses of the data buffers behind a column, to tell which columns two frames share
+def _buffers(series):
+    values = series.array
+    if isinstance(values, pd.Categorical):
+        values = values.codes
+    elif isinstance(values, pd.arrays.SparseArray):
+        values = values.sp_values
+    if hasattr(values, '__arrow_array__'):
+        arrow = values.__arrow_array__()
+        chunks = getattr(arrow, 'chunks', [arrow])
+        return {buffer.address for chunk in chunks for buffer in chunk.buffers() if buffer is not None}
+    return {np.asarray(values).__array_interface__['data'][0]}
+
+
+# Memory of the columns of `frame` that are not shared with `original`
+def unshared_bytes(frame, original):
+    shared = set()
+    for col in original.columns:
+        shared |= _buffers(original[col])
+    return int(sum(
+        frame[col].memory_usage(index=False, deep=True)
+        for col in frame.columns if not _buffers(frame[col]) <= shared
+    ))
+
+
+# One version of the data: the ops that produce it from the original, and,
+# once resolved, the resulting frame, its column stats and column indexes
+class Snapshot:
+    def __init__(self, ops=(), frame=None, stats=None):
+        self.ops = tuple(ops)
+        self.frame = frame
+        self.stats = stats
+        self.indexes = None
+        self.version = next(_versions)
+
+    @property
+    def resolved(self):
+        return self.frame is not None
+
+
+class SnapshotHistory:
+    """Original data plus an undo/redo stack of later versions.
+
+    Committing ops is cheap: a version is only executed when `resolve()` is
+    called, starting from the nearest already materialized version. Versions
+    are shallow copies of each other, so a step that rewrites one column only
+    materializes that column; the rest of the buffers are shared with the
+    original frame.
+
+    With `source` (a callable returning the original frame, e.g. from the
+    shared engine.store.DatasetStore), `release()` may drop every
+    materialized frame; they are rebuilt from the ops on the next `resolve()`.
+    `spilled` (a callable taking a version's ops and returning its frame, or
+    None) is tried first, e.g. to map a checkpointed version back from disk
+    (engine.checkpoints) instead of executing the ops again.
+    """
+
+    def __init__(self, original, stats=None, max_steps=20, source=None, spilled=None):
+        self.original = Snapshot((), original, stats)
+        self.current = self.original
+        self.max_steps = max_steps
+        self.source = source
+        self.spilled = spilled
+        self._undo = []
+        self._redo = []
+        self._lock = threading.Lock()
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    # Record ops as a new (unresolved) version; redo history is discarded
+    def commit(self, ops):
+        self._undo.append(self.current)
+        if len(self._undo) > self.max_steps:
+            self._undo.pop(0)
+        self._redo.clear()
+        self.current = Snapshot(self.current.ops + tuple(ops))
+        return self.current
+
+    # Execute any pending ops of the current version
+    def resolve(self, execute):
+        with self._lock:
+            return self._resolve(execute)
+
+    def _resolve(self, execute):
+        snapshot = self.current
+        if snapshot.resolved:
+            return snapshot
+
+        if not self.original.resolved:
+            self.original.frame = self.source()
+            if snapshot is self.original:
+                return snapshot
+        if self.spilled is not None:
+            snapshot.frame = self.spilled(snapshot.ops)
+            if snapshot.resolved:
+                return snapshot
+        base = next((s for s in reversed(self._undo) if s.resolved), self.original)
+        stats = base.stats.copy() if base.stats is not None else None
+        observer = stats.observe if stats is not None else None
+        # Filters on the base frame can use its indexes; they are not needed afterwards
+        indexes = {'indexes': base.indexes} if base.indexes is not None else {}
+        snapshot.frame = execute(base.frame, snapshot.ops[len(base.ops):], observer=observer, **indexes)
+        snapshot.stats = stats
+        base.indexes = None
+        return snapshot
+
+    # Number of ops of each undo step and of the current version, oldest first;
+    # committing the ops between these boundaries rebuilds the same history
+    def steps(self):
+        return [len(s.ops) for s in self._undo] + [len(self.current.ops)]
+
+    def _snapshots(self):
+        return [self.original, self.current, *self._undo, *self._redo]
+
+    # Drop the materialized frames, column stats and indexes of every version,
+    # keeping only the ops. Returns False, without waiting, while the history
+    # is being resolved. Without a `source` the original frame is kept.
+    def release(self):
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            for snapshot in self._snapshots():
+                if snapshot is not self.original or self.source is not None:
+                    snapshot.frame = None
+                snapshot.stats = None
+                snapshot.indexes = None
+        finally:
+            self._lock.release()
+        return True
+
+    # Memory held by this history's own columns, i.e. not shared with the original
+    def working_bytes(self):
+        original = self.original.frame
+        if original is None:
+            return 0
+        frames = {id(s.frame): s.frame for s in self._snapshots() if s.resolved and s is not self.original}
+        return sum(unshared_bytes(frame, original) for frame in frames.values())
+
+    # Drop the current version for good (e.g. when its ops failed to execute)
+    def discard(self):
+        if self._undo:
+            self.current = self._undo.pop()
+        self._redo.clear()
+        return self.current
+
+    def undo(self):
+        if self._undo:
+            self._redo.append(self.current)
+            self.current = self._undo.pop()
+        return self.current
+
+    def redo(self):
+        if self._redo:
+            self._undo.append(self.current)
+            self.current = self._redo.pop()
+        return self.current
+
+    # Back to the original data; no copy is made
+    def reset(self):
+        self._undo.clear()
+        self._redo.clear()
+        self.current = self.original
+        return self.current
@@ -0,0 +1,95 @@
+"""Sparse columns (one-hot indicators) in code that needs dense or Arrow data.
+
+One-hot encoding (engine.plan) produces pandas SparseArray columns that only
+store the rows where an indicator is True. Arrow and Parquet have no sparse
+type and several frame-wide pandas reductions fail on mixed sparse/dense
+frames, so these helpers convert one column or one row slice at a time and
+never densify a whole frame. In Arrow, boolean indicators become bit-packed
+boolean columns: one bit per row.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+# Schema metadata key listing the columns to restore as sparse ({column: dtype})
+SPARSE_METADATA_KEY = b'sparse_columns'
+
+
+def is_sparse(series):
+    return isinstance(series.dtype, pd.SparseDtype)
+
+
+def sparse_columns(df):
+    return [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+
+
+# The frame with its sparse columns converted to their dense dtype; meant for
+# small slices (previews, export chunks), not for whole frames
+def densify(df):
+    sparse = sparse_columns(df)
+    if not sparse:
+        return df
+    return df.astype({col: df[col].dtype.subtype for col in sparse})
+
+
+# Missing values per column, counting sparse columns from their stored values only
+def missing_counts(df):
+    sparse = set(sparse_columns(df))
+    counts = df[[col for col in df.columns if col not in sparse]].isna().sum().to_dict()
+    for col in sparse:
+        values = df[col].array
+        missing = int(pd.isna(values.sp_values).sum())
+        if pd.isna(values.fill_value):
+            missing += len(values) - values.sp_index.npoints
+        counts[col] = missing
+    return {col: int(counts[col]) for col in df.columns}
+
+
+def _dense_values(series):
+    values = series.array
+    dense = np.full(len(values), values.fill_value, dtype=values.dtype.subtype)
+    dense[values.sp_index.indices] = values.sp_values
+    return dense
+
+
+# Arrow schema of a frame; sparse columns get the Arrow type of their dense dtype
+def arrow_schema(df, preserve_index=False):
+    import pyarrow as pa
+
+    sparse = sparse_columns(df)
+    schema = pa.Schema.from_pandas(df.drop(columns=sparse), preserve_index=preserve_index)
+    for col in sparse:
+        field = pa.field(str(col), pa.from_numpy_dtype(df[col].dtype.subtype))
+        schema = schema.insert(df.columns.get_loc(col), field)
+    return schema
+
+
+# Arrow table of a frame. Sparse columns are converted one at a time (boolean
+# indicators to bit-packed booleans) and listed in the schema metadata, so
+# frame_from_arrow can make them sparse again.
+def arrow_table(df, preserve_index=False):
+    import pyarrow as pa
+
+    sparse = sparse_columns(df)
+    table = pa.Table.from_pandas(df.drop(columns=sparse), preserve_index=preserve_index)
+    if not sparse:
+        return table
+    for col in sparse:
+        table = table.add_column(df.columns.get_loc(col), str(col), pa.array(_dense_values(df[col])))
+    metadata = {**table.schema.metadata, SPARSE_METADATA_KEY: json.dumps({str(col): str(df[col].dtype) for col in sparse})}
+    return table.replace_schema_metadata(metadata)
+
+
+# DataFrame of an Arrow table written by arrow_table, with its sparse columns restored
+def frame_from_arrow(table, **options):
+    metadata = table.schema.metadata or {}
+    sparse = json.loads(metadata.get(SPARSE_METADATA_KEY, b'{}'))
+    if not sparse:
+        return table.to_pandas(**options)
+    names = table.column_names
+    frame = table.drop_columns(list(sparse)).to_pandas(**options)
+    for col, dtype in sparse.items():
+        values = table.column(col).to_numpy(zero_copy_only=False)
+        frame.insert(names.index(col), col, pd.arrays.SparseArray(values, dtype=pd.api.types.pandas_dtype(dtype)))
+    return frame
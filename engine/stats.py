@@ -0,0 +1,303 @@
+"""Per-column statistics that are kept up to date as the data is transformed."""
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Rows processed at a time when accumulating pairwise sums
+CHUNK_ROWS = 100_000
+
+DESCRIBE_INDEX = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+
+# Statistics kept for a single column; quantiles and unique are filled lazily
+class ColumnStats:
+    def __init__(self, kind, count, null_count, minimum=None, maximum=None, mean=np.nan, m2=0.0):
+        self.kind = kind
+        self.count = count
+        self.null_count = null_count
+        self.min = minimum
+        self.max = maximum
+        self.mean = mean
+        self.m2 = m2
+        self.quantiles = None
+        self.unique = None
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance)) if self.count > 1 else np.nan
+
+
+# Columns that take part in describe() and correlations
+def is_numeric_column(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _float_values(series):
+    return series.to_numpy(dtype='float64', na_value=np.nan)
+
+
+# Welford-style (count, mean, M2) for an array that may contain NaN
+def _moments(values):
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return 0, np.nan, 0.0
+    mean = values.mean()
+    return values.size, mean, float(((values - mean) ** 2).sum())
+
+
+# Chan's parallel merge of two (count, mean, M2) summaries
+def _merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    if n_b == 0:
+        return n_a, mean_a, m2_a
+    if n_a == 0:
+        return n_b, mean_b, m2_b
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+
+# Reverse of Chan's parallel merge: drop the (n_b, mean_b, m2_b) part from a summary
+def _remove_moments(n, mean, m2, n_b, mean_b, m2_b):
+    n_a = n - n_b
+    if n_b == 0:
+        return n, mean, m2
+    if n_a <= 0:
+        return 0, np.nan, 0.0
+    mean_a = (n * mean - n_b * mean_b) / n_a
+    delta = mean_b - mean_a
+    m2_a = m2 - m2_b - delta * delta * n_a * n_b / n
+    return n_a, mean_a, max(m2_a, 0.0)
+
+
+# Compute the stats of one column from scratch
+def column_stats(series):
+    null_count = int(series.isna().sum())
+    count = len(series) - null_count
+
+    if is_numeric_column(series):
+        values = _float_values(series)
+        n, mean, m2 = _moments(values)
+        minimum = np.nanmin(values) if n else np.nan
+        maximum = np.nanmax(values) if n else np.nan
+        return ColumnStats('numeric', count, null_count, minimum, maximum, mean, m2)
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return ColumnStats('datetime', count, null_count, series.min(), series.max(), series.mean())
+
+    return ColumnStats('other', count, null_count)
+
+
+# Sums over pairwise-complete rows, accumulated in row chunks
+def _pair_sums(left, right, left_shift, right_shift):
+    n_left, n_right = left.shape[1], right.shape[1]
+    sums = {name: np.zeros((n_left, n_right)) for name in ('n', 'sx', 'sy', 'sxx', 'syy', 'sxy')}
+
+    for start in range(0, len(left), CHUNK_ROWS):
+        x = left[start:start + CHUNK_ROWS] - left_shift
+        y = right[start:start + CHUNK_ROWS] - right_shift
+        mx, my = ~np.isnan(x), ~np.isnan(y)
+        x, y = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+        mx, my = mx.astype('float64'), my.astype('float64')
+
+        sums['n'] += mx.T @ my
+        sums['sx'] += x.T @ my
+        sums['sy'] += mx.T @ y
+        sums['sxx'] += (x * x).T @ my
+        sums['syy'] += mx.T @ (y * y)
+        sums['sxy'] += x.T @ y
+
+    return sums
+
+
+class ColumnStatsStore:
+    """Column statistics plus pairwise correlation sums for the current DataFrame.
+
+    Transformations report which columns they touched (or which rows they
+    removed) so only that part of the statistics is recomputed. Tables with
+    more than `max_pair_columns` numeric columns keep no pairwise sums; their
+    correlations come from engine.correlation instead.
+    """
+
+    def __init__(self, df, max_pair_columns=None):
+        self.df = df
+        self.columns = {col: column_stats(df[col]) for col in df.columns}
+        self.tracks_pairs = max_pair_columns is None or len(self.numeric_columns()) <= max_pair_columns
+        self._build_pairs()
+
+    # Independent copy to update for a new data version; the DataFrame itself is shared
+    def copy(self):
+        clone = copy.copy(self)
+        clone.columns = {col: copy.copy(stats) for col, stats in self.columns.items()}
+        clone._pair_columns = list(self._pair_columns)
+        for name in ('_shift', '_n', '_sx', '_sxx', '_sxy'):
+            setattr(clone, name, getattr(self, name).copy())
+        return clone
+
+    # Numeric columns in DataFrame order
+    def numeric_columns(self):
+        return [col for col in self.df.columns if self.columns[col].kind == 'numeric']
+
+    def _numeric_matrix(self, df, columns):
+        if not columns:
+            return np.empty((len(df), 0))
+        return np.column_stack([_float_values(df[col]) for col in columns])
+
+    # Pairwise sums for every pair of numeric columns
+    def _build_pairs(self):
+        self._pair_columns = self.numeric_columns() if self.tracks_pairs else []
+        self._shift = np.array([self.columns[col].mean for col in self._pair_columns], dtype='float64')
+        self._shift = np.nan_to_num(self._shift)
+        values = self._numeric_matrix(self.df, self._pair_columns)
+        sums = _pair_sums(values, values, self._shift, self._shift)
+        self._n, self._sx, self._sxx, self._sxy = sums['n'], sums['sx'], sums['sxx'], sums['sxy']
+
+    # Drop a column's row and column from the pairwise sums
+    def _drop_pair_column(self, col):
+        idx = self._pair_columns.index(col)
+        for name in ('_n', '_sx', '_sxx', '_sxy'):
+            matrix = getattr(self, name)
+            setattr(self, name, np.delete(np.delete(matrix, idx, axis=0), idx, axis=1))
+        self._shift = np.delete(self._shift, idx)
+        self._pair_columns.pop(idx)
+
+    # Recompute the pairwise sums of one column against all other numeric columns
+    def _refresh_pair_column(self, col):
+        if col in self._pair_columns:
+            self._drop_pair_column(col)
+
+        shift = np.nan_to_num(np.array([self.columns[col].mean], dtype='float64'))
+        values = self._numeric_matrix(self.df, [col])
+        others = self._numeric_matrix(self.df, self._pair_columns)
+        cross = _pair_sums(values, others, shift, self._shift)
+        own = _pair_sums(values, values, shift, shift)
+
+        def grow(matrix, row, column, corner):
+            matrix = np.vstack([matrix, row])
+            return np.hstack([matrix, np.append(column, corner)[:, None]])
+
+        self._n = grow(self._n, cross['n'], cross['n'][0], own['n'][0, 0])
+        self._sx = grow(self._sx, cross['sx'], cross['sy'][0], own['sx'][0, 0])
+        self._sxx = grow(self._sxx, cross['sxx'], cross['syy'][0], own['sxx'][0, 0])
+        self._sxy = grow(self._sxy, cross['sxy'], cross['sxy'][0], own['sxy'][0, 0])
+        self._shift = np.append(self._shift, shift)
+        self._pair_columns.append(col)
+
+    # Columns were added, modified or removed: recompute only those columns
+    def refresh_columns(self, df, columns):
+        self.df = df
+        for col in columns:
+            if col in self._pair_columns:
+                self._drop_pair_column(col)
+            self.columns.pop(col, None)
+
+            if col in df.columns:
+                self.columns[col] = column_stats(df[col])
+                if self.columns[col].kind == 'numeric' and self.tracks_pairs:
+                    self._refresh_pair_column(col)
+
+    # Rows were removed (filter / dropna): downdate the stats using only the removed rows
+    def remove_rows(self, df, removed):
+        self.df = df
+        if len(removed) == 0:
+            return
+
+        # Rebuilding is cheaper than downdating when most rows are gone
+        if len(removed) >= len(df):
+            self.columns = {col: column_stats(df[col]) for col in df.columns}
+            self._build_pairs()
+            return
+
+        for col, stats in self.columns.items():
+            part = removed[col]
+            part_nulls = int(part.isna().sum())
+            stats.null_count -= part_nulls
+            stats.count -= len(part) - part_nulls
+            stats.quantiles = None
+            stats.unique = None
+
+            if stats.kind == 'numeric':
+                values = _float_values(part)
+                n_b, mean_b, m2_b = _moments(values)
+                n, stats.mean, stats.m2 = _remove_moments(stats.count + n_b, stats.mean, stats.m2, n_b, mean_b, m2_b)
+                # Extremes only need a rescan when a removed row held them
+                if n_b and (np.nanmin(values) <= stats.min or np.nanmax(values) >= stats.max):
+                    column = _float_values(df[col])
+                    stats.min = np.nanmin(column) if stats.count else np.nan
+                    stats.max = np.nanmax(column) if stats.count else np.nan
+            elif stats.kind == 'datetime':
+                self.columns[col] = column_stats(df[col])
+
+        values = self._numeric_matrix(removed, self._pair_columns)
+        sums = _pair_sums(values, values, self._shift, self._shift)
+        self._n -= sums['n']
+        self._sx -= sums['sx']
+        self._sxx -= sums['sxx']
+        self._sxy -= sums['sxy']
+
+    # Row order changed but the rows themselves did not
+    def reorder(self, df):
+        self.df = df
+
+    # Keep the stats in sync with one executed plan step (see engine.plan.run_step)
+    def observe(self, before, after, effect):
+        if 'mask' in effect:
+            self.remove_rows(after, before[~effect['mask']])
+        else:
+            self.refresh_columns(after, effect['touched'])
+
+    # Full stats for a column, filling the lazily computed parts on demand
+    def get(self, col, quantiles=False, unique=False):
+        stats = self.columns[col]
+        if quantiles and stats.quantiles is None and stats.kind != 'other':
+            stats.quantiles = self.df[col].quantile([0.25, 0.5, 0.75]).tolist()
+        if unique and stats.unique is None:
+            stats.unique = int(self.df[col].nunique())
+        return stats
+
+    def missing(self):
+        return {col: self.columns[col].null_count for col in self.df.columns}
+
+    def unique_counts(self, columns):
+        return {col: self.get(col, unique=True).unique for col in columns}
+
+    # Same layout as DataFrame.describe() built from the cached stats
+    def describe(self):
+        summary = {}
+        for col in self.df.columns:
+            stats = self.columns[col]
+            if stats.kind == 'other':
+                continue
+            stats = self.get(col, quantiles=True)
+            std = stats.std if stats.kind == 'numeric' else np.nan
+            summary[col] = [stats.count, stats.mean, std, stats.min, *stats.quantiles, stats.max]
+
+        if not summary:
+            return self.df.describe()
+        return pd.DataFrame(summary, index=DESCRIBE_INDEX)
+
+    # Pearson correlations over pairwise-complete rows, in DataFrame column order
+    # (None when the table is too wide to keep pairwise sums)
+    def correlations(self):
+        if not self.tracks_pairs:
+            return None
+        order = self.numeric_columns()
+        idx = [self._pair_columns.index(col) for col in order]
+        n = self._n[np.ix_(idx, idx)]
+        sx = self._sx[np.ix_(idx, idx)]
+        sxx = self._sxx[np.ix_(idx, idx)]
+        sxy = self._sxy[np.ix_(idx, idx)]
+        sy, syy = sx.T, sxx.T
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = n * sxy - sx * sy
+            var_x = n * sxx - sx * sx
+            var_y = n * syy - sy * sy
+            corr = cov / np.sqrt(var_x * var_y)
+        corr[(n < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+
+        return pd.DataFrame(np.clip(corr, -1.0, 1.0), index=order, columns=order)
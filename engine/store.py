@@ -0,0 +1,208 @@
+"""Process-wide store of loaded datasets, shared read-only by every session.
+
+Datasets are keyed by content (the file's hash plus the load options) and
+loaded once; every session gets the same DataFrame object. With pandas
+copy-on-write, transformations never write to it: each version is a shallow
+copy that shares all unchanged columns (engine.snapshots), so a session only
+adds the columns it changed.
+
+One memory budget covers the shared datasets and the sessions' own columns.
+When it is exceeded, sessions idle for longer than `idle_seconds` release
+their materialized versions (they are rebuilt from the recorded ops when the
+user comes back) and the least recently used datasets are spilled to an
+Arrow IPC file under `spill_dir`. A spilled dataset is memory-mapped back on
+its next use; most of its columns then point straight into the file, so their
+pages can be reclaimed by the operating system instead of counting against
+the process.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from engine.sparse import arrow_table, frame_from_arrow
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+# Write a frame to an uncompressed Arrow IPC file, which can be memory-mapped back.
+# The file appears under `path` only once it is complete. Sparse columns are
+# stored densely (booleans bit-packed) and are sparse again when mapped back.
+def write_ipc(frame, path, index=False):
+    table = arrow_table(frame, preserve_index=None if index else False)
+    partial = f"{path}.{threading.get_ident()}.partial"
+    try:
+        with pa.OSFile(partial, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+# Memory-map an Arrow IPC file back as a DataFrame; columns that can point into
+# the file do so. Returns the frame and the bytes that had to be copied.
+def map_ipc(path):
+    allocated = pa.total_allocated_bytes()
+    with pa.memory_map(path) as source:
+        table = ipc.open_file(source).read_all()
+    frame = frame_from_arrow(table, split_blocks=True)
+    return frame, max(pa.total_allocated_bytes() - allocated, 0)
+
+
+class _Dataset:
+    def __init__(self, frame, report):
+        self.frame = frame
+        self.report = report
+        self.size = frame_bytes(frame)
+        # Bytes this dataset currently holds in process memory
+        self.resident = self.size
+        self.path = None
+        self.used = time.monotonic()
+
+
+class _Session:
+    def __init__(self, key, release):
+        self.key = key
+        self.release = release
+        self.working_bytes = 0
+        self.seen = time.monotonic()
+
+
+class DatasetStore:
+    """Shared datasets and per-session working memory under one budget."""
+
+    def __init__(self, memory_budget, spill_dir=None, idle_seconds=900):
+        self.memory_budget = memory_budget
+        self.idle_seconds = idle_seconds
+        self.spill_dir = tempfile.mkdtemp(prefix='datasets-', dir=spill_dir)
+        atexit.register(shutil.rmtree, self.spill_dir, ignore_errors=True)
+        self._lock = threading.RLock()
+        self._loading = {}
+        self._datasets = {}
+        self._sessions = {}
+
+    # The dataset for `key`, loaded with `loader()` -> (frame, report) the first
+    # time any session asks for it. Concurrent requests for the same key wait
+    # for one load. Returns the shared frame and the load report.
+    def load(self, key, loader):
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            with self._lock:
+                if key in self._datasets:
+                    return self.frame(key), self._datasets[key].report
+            frame, report = loader()
+            with self._lock:
+                self._datasets[key] = _Dataset(frame, report)
+                self._loading.pop(key, None)
+                self.enforce(protect=key)
+                return frame, report
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._datasets
+
+    # The shared frame for `key`, memory-mapped back from disk if it was spilled
+    def frame(self, key):
+        with self._lock:
+            dataset = self._datasets[key]
+            dataset.used = time.monotonic()
+            if dataset.frame is None:
+                # Columns that could not point into the file were copied; only those count
+                dataset.frame, dataset.resident = map_ipc(dataset.path)
+            return dataset.frame
+
+    # Record that a session working on dataset `key` is active. `release()`
+    # drops its materialized data (returning False when it cannot right now);
+    # `working_bytes` is the memory of the columns it does not share with the dataset.
+    def touch_session(self, session_id, key, release, working_bytes):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(key, release)
+            session.key, session.release = key, release
+            session.working_bytes = working_bytes
+            session.seen = time.monotonic()
+            if key in self._datasets:
+                self._datasets[key].used = session.seen
+            self.enforce(protect=key, current=session_id)
+
+    def used_bytes(self):
+        with self._lock:
+            return (sum(dataset.resident for dataset in self._datasets.values() if dataset.frame is not None)
+                    + sum(session.working_bytes for session in self._sessions.values()))
+
+    # Release a session's data; a session that is busy right now is kept
+    def _release(self, session_id):
+        if self._sessions[session_id].release():
+            del self._sessions[session_id]
+
+    def _spill(self, dataset):
+        if dataset.path is None:
+            handle, path = tempfile.mkstemp(suffix='.arrow', dir=self.spill_dir)
+            os.close(handle)
+            try:
+                write_ipc(dataset.frame, path)
+            except BaseException:
+                os.remove(path)
+                raise
+            dataset.path = path
+        dataset.frame = None
+        dataset.resident = 0
+
+    # Spill the least recently used datasets that no session is working on
+    def _spill_unused(self, protect):
+        held = {session.key for session in self._sessions.values()} | {protect}
+        for key, dataset in sorted(self._datasets.items(), key=lambda item: item[1].used):
+            if self.used_bytes() <= self.memory_budget:
+                return
+            if key in held or dataset.frame is None or dataset.resident == 0:
+                continue
+            try:
+                self._spill(dataset)
+            except (pa.ArrowException, OSError, ValueError, TypeError):
+                # E.g. object columns mixing text and numbers; the dataset stays in memory
+                continue
+
+    # Bring memory back under the budget; nothing is evicted while it fits.
+    # Over the budget, sessions idle for longer than `idle_seconds` are released
+    # first, then unused datasets are spilled, least recently used first. If
+    # that is not enough, other sessions are released too, least recently seen
+    # first, and their datasets spilled. `protect` and `current` are never evicted.
+    def enforce(self, protect=None, current=None):
+        with self._lock:
+            if self.used_bytes() <= self.memory_budget:
+                return
+            now = time.monotonic()
+            for session_id, session in list(self._sessions.items()):
+                if session_id != current and now - session.seen > self.idle_seconds:
+                    self._release(session_id)
+            self._spill_unused(protect)
+
+            others = sorted((session.seen, session_id) for session_id, session in self._sessions.items()
+                            if session_id != current)
+            for _, session_id in others:
+                if self.used_bytes() <= self.memory_budget:
+                    break
+                self._release(session_id)
+                self._spill_unused(protect)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'datasets': len(self._datasets),
+                'resident_datasets': sum(dataset.frame is not None for dataset in self._datasets.values()),
+                'spilled_datasets': sum(dataset.path is not None for dataset in self._datasets.values()),
+                'sessions': len(self._sessions),
+                'used_bytes': self.used_bytes(),
+                'memory_budget': self.memory_budget,
+            }
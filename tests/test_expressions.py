@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.expressions import evaluate, join_columns
+from engine.plan import execute
+
+
+@pytest.fixture
+def sales():
+    return pd.DataFrame({
+        'Product': ['Laptop', 'Tablet', None, 'Monitor', 'Printer', 'Mouse'],
+        'Region': ['North', None, None, 'East', 'West', 'South'],
+        'Price': [1200.0, 450.0, np.nan, 300.0, 150.0, 25.0],
+    })
+
+
+# The frame as the app sees it after a Sort step, a Filter step, or neither
+@pytest.fixture(params=['unchanged', 'sorted', 'filtered'])
+def frame(request, sales):
+    if request.param == 'sorted':
+        return sales.sort_values('Price', ascending=False)
+    if request.param == 'filtered':
+        return sales[sales['Price'] != 450.0]
+    return sales
+
+
+def expected_join(df, columns, separator):
+    return df[columns].apply(
+        lambda row: separator.join(str(value) for value in row if pd.notna(value)) or None, axis=1
+    ).astype('string')
+
+
+def assert_text_equal(result, expected):
+    pd.testing.assert_series_equal(result, expected.astype('string'), check_names=False)
+
+
+@pytest.mark.parametrize('chunk_rows', [2, 1_000_000])
+def test_upper_matches_pandas(frame, chunk_rows):
+    result = evaluate(frame, 'upper(Product)', chunk_rows=chunk_rows)
+    assert_text_equal(result, frame['Product'].str.upper())
+
+
+@pytest.mark.parametrize('chunk_rows', [2, 1_000_000])
+def test_concatenation_matches_pandas(frame, chunk_rows):
+    result = evaluate(frame, 'Product + " / " + Region', chunk_rows=chunk_rows)
+    assert_text_equal(result, frame['Product'] + " / " + frame['Region'])
+
+
+@pytest.mark.parametrize('chunk_rows', [2, 1_000_000])
+def test_join_columns_matches_pandas(frame, chunk_rows):
+    result = join_columns(frame, ['Product', 'Region', 'Price'], '-', chunk_rows=chunk_rows)
+    assert_text_equal(result, expected_join(frame, ['Product', 'Region', 'Price'], '-'))
+
+
+def test_join_columns_keeps_rows_after_an_all_missing_row():
+    df = pd.DataFrame({'a': ['x', None, 'z'], 'b': [1.0, np.nan, 3.0]})
+    assert_text_equal(join_columns(df, ['a', 'b'], '-'), pd.Series(['x-1.0', None, 'z-3.0']))
+
+
+def test_combine_after_sort(sales):
+    result = execute(sales, [
+        {'op': 'sort', 'column': 'Price', 'ascending': False},
+        {'op': 'derive', 'kind': 'combine', 'column': 'Label', 'columns': ['Product', 'Region'], 'separator': ' / '},
+    ])
+    assert_text_equal(result['Label'], expected_join(result, ['Product', 'Region'], ' / '))
+
+
+def test_missing_text_stays_missing_without_the_pandas_3_string_dtype():
+    with pd.option_context('future.infer_string', False):
+        df = pd.DataFrame({'a': ['x', None], 'b': [1.0, np.nan]})
+        assert_text_equal(evaluate(df, 'upper(a)'), pd.Series(['X', None]))
+        assert_text_equal(join_columns(df, ['a', 'b'], '-'), pd.Series(['x-1.0', None]))